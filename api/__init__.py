@@ -0,0 +1 @@
+from .pipeline import ApiBlueprint, ApiError, init_app
@@ -0,0 +1,44 @@
+from flask import jsonify, request
+from models import User
+from .pipeline import ApiBlueprint, BadRequest, Conflict, Unauthorized, current_user, model, token_expires_in
+
+auth = ApiBlueprint('auth', __name__)
+
+
+def credentials():
+    data = request.json
+    if not data:
+        raise BadRequest("Please provide email, password")
+    return data
+
+
+@auth.endpoint("/auth/login", methods=["POST"], failure="Something went wrong!")
+def login():
+    data = credentials()
+    token = model(User).login(data["email"], data["password"])
+    if not token:
+        raise Unauthorized("Error fetching auth token!, invalid email or password")
+    token["expires_in"] = token_expires_in()
+    return jsonify(token)
+
+
+@auth.endpoint("/auth/register", methods=["POST"], failure="Something went wrong!")
+def register():
+    data = credentials()
+    token = model(User).create_user(data["email"], data["name"], data["password"])
+    if not token:
+        raise Conflict("User already exists")
+    token["expires_in"] = token_expires_in()
+    return jsonify(token)
+
+
+@auth.endpoint("/auth/me", message="Successfully retrieved user profile", auth=True)
+def get_current_user():
+    return current_user()
+
+# Users management
+
+
+@auth.endpoint("/users", message="Successfully retrieved all users", auth=True)
+def gat_all_users():
+    return model(User).get_all_users()
@@ -0,0 +1,44 @@
+import tempfile
+
+from flask import request, send_file
+from models import GTFS, BundleError, BusLine, BusStation, NetworkImport, StationLine, read_bundle
+from utils import columnar
+from .pipeline import ApiBlueprint, ApiError, BadRequest, NotFound, columnar_response, model
+
+bulk = ApiBlueprint('bulk', __name__)
+
+
+@bulk.endpoint("/import", methods=["POST"], message="Successfully imported bus network", status=201, auth=True)
+def import_network():
+    source = request.files['bundle'].stream if 'bundle' in request.files else request.get_json(silent=True)
+    if not source:
+        raise BadRequest("Please provide a JSON bundle or a zip file in 'bundle'")
+    replace = request.args.get('mode', 'merge') == 'replace'
+    try:
+        with read_bundle(source) as bundle:
+            return model(NetworkImport).import_bundle(bundle, replace=replace)
+    except BundleError as e:
+        raise ApiError("Invalid bundle", error=e.errors, status=400)
+
+
+@bulk.endpoint("/export/gtfs")
+def export_gtfs():
+    feed = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    model(GTFS).export_feed(feed, expand=request.args.get('expand') in ['true', '1'])
+    feed.seek(0)
+    return send_file(feed, mimetype='application/zip', as_attachment=True, download_name='gtfs.zip')
+
+
+@bulk.endpoint("/export/<dataset>")
+def export_dataset(dataset):
+    batches = {
+        'bus_stations': lambda: model(BusStation).iter_bus_station_batches(),
+        'bus_lines': lambda: model(BusLine).iter_bus_line_batches(),
+        'schedules': lambda: model(StationLine).iter_schedule_batches()
+    }
+    if dataset not in batches:
+        raise NotFound("Dataset not found", error="Not Found")
+    mimetype = columnar.negotiate(request)
+    if mimetype == columnar.JSON:
+        mimetype = columnar.ARROW_STREAM
+    return columnar_response(dataset, batches[dataset](), mimetype)
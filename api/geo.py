@@ -0,0 +1,75 @@
+from models import District, Ward
+from .pipeline import ApiBlueprint, found, json_body, model
+
+geo = ApiBlueprint('geo', __name__)
+
+
+def split_ward_id(ward_id):
+    """Wards are addressed as <id_district><id_ward>"""
+    return ward_id[-2:], ward_id[:4]
+
+
+@geo.endpoint("/districts", message="Successfully retrieved districts")
+def get_all_districts():
+    return model(District).get_all_districts()
+
+
+@geo.endpoint("/districts/<district_id>", message="Successfully retrieved a district")
+def get_district_by_id(district_id):
+    return found(model(District).get_district_by_id(district_id), "district not found")
+
+
+@geo.endpoint("/districts", methods=["POST"], message="Successfully created a district", status=201,
+              auth=True, failure="Failed to create a district")
+def create_district():
+    data = json_body()
+    return model(District).create_district(data["id"], data["name"])
+
+
+@geo.endpoint("/districts/<district_id>", methods=["PUT"], message="Successfully updated a district", status=201,
+              auth=True, failure="failed to update a district", failure_status=400)
+def update_district(district_id):
+    found(model(District).get_district_by_id(district_id), "district not found")
+    data = json_body()
+    return model(District).update_district(district_id, data["name"])
+
+
+@geo.endpoint("/districts/<district_id>", methods=["DELETE"], message="Successfully deleted a district", status=204,
+              auth=True, failure="failed to delete a district", failure_status=400)
+def delete_district(district_id):
+    found(model(District).get_district_by_id(district_id), "district not found")
+    model(District).delete_district(district_id)
+
+# Wards management
+
+
+@geo.endpoint("/wards", message="Successfully retrieved wards")
+def get_all_wards():
+    return model(Ward).get_all_wards()
+
+
+@geo.endpoint("/wards/<ward_id>", message="Successfully retrieved a ward")
+def get_ward_by_id(ward_id):
+    return found(model(Ward).get_ward_by_id(*split_ward_id(ward_id)), "ward not found")
+
+
+@geo.endpoint("/wards", methods=["POST"], message="Successfully created a ward", status=201,
+              auth=True, failure="Failed to create a ward")
+def create_ward():
+    data = json_body()
+    return model(Ward).create_ward(data["id_ward"], data["id_district"], data["name"])
+
+
+@geo.endpoint("/wards/<ward_id>", methods=["PUT"], message="Successfully updated a ward", status=201,
+              auth=True, failure="failed to update a ward", failure_status=400)
+def update_ward(ward_id):
+    found(model(Ward).get_ward_by_id(*split_ward_id(ward_id)), "ward not found")
+    data = json_body()
+    return model(Ward).update_ward(*split_ward_id(ward_id), data["name"])
+
+
+@geo.endpoint("/wards/<ward_id>", methods=["DELETE"], message="Successfully deleted a ward", status=204,
+              auth=True, failure="failed to delete a ward", failure_status=400)
+def delete_ward(ward_id):
+    found(model(Ward).get_ward_by_id(*split_ward_id(ward_id)), "ward not found")
+    model(Ward).delete_ward(*split_ward_id(ward_id))
@@ -0,0 +1,114 @@
+from flask import request
+from models import BusLine, BusStation, StationLine
+from utils import columnar
+from .pipeline import ApiBlueprint, BadRequest, columnar_response, found, json_body, model
+
+lines = ApiBlueprint('lines', __name__)
+
+
+@lines.endpoint("/bus_lines", message="Successfully retrieved bus lines")
+def get_all_bus_lines():
+    mimetype = columnar.negotiate(request)
+    if mimetype != columnar.JSON:
+        return columnar_response('bus_lines', model(BusLine).iter_bus_line_batches(), mimetype)
+    return model(BusLine).get_all_bus_lines_json()
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>", message="Successfully retrieved a bus line")
+def get_bus_line_by_id(bus_line_id):
+    return found(model(BusLine).get_bus_line_by_id(bus_line_id), "bus line not found")
+
+
+@lines.endpoint("/bus_lines", methods=["POST"], message="Successfully created a bus line", status=201,
+                auth=True, failure="Failed to create a bus line")
+def create_bus_line():
+    data = json_body()
+    return model(BusLine).create_bus_line(
+        data["name"], data["length"], data["price"], data["number_of_trips"], data["time_between_trips"], data["start_time_first"])
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>", methods=["PUT"], message="Successfully updated a bus line", status=201,
+                auth=True, failure="failed to update a bus line", failure_status=400)
+def update_bus_line(bus_line_id):
+    found(model(BusLine).get_bus_line_by_id(bus_line_id), "bus line not found")
+    data = json_body()
+    return model(BusLine).update_bus_line(
+        bus_line_id, data["name"], data["length"], data["price"], data["number_of_trips"], data["time_between_trips"], data["start_time_first"])
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>", methods=["DELETE"], message="Successfully deleted a bus line", status=204,
+                auth=True, failure="failed to delete a bus line", failure_status=400)
+def delete_bus_line(bus_line_id):
+    found(model(BusLine).get_bus_line_by_id(bus_line_id), "bus line not found")
+    model(BusLine).delete_bus_line(bus_line_id)
+
+# Station line management
+
+
+def line_and_station(bus_line_id, bus_station_id):
+    found(model(BusLine).get_bus_line_by_id(bus_line_id), "Bus line not found")
+    found(model(BusStation).get_bus_station_by_id(bus_station_id), "Bus station not found")
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/bus_stations", message="Successfully retrieved all bus stations")
+def get_all_bus_stations_by_id_bus_line(bus_line_id):
+    return model(StationLine).get_all_bus_stations_by_id_bus_line_json(bus_line_id)
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/schedules", message="Successfully retrieved all schedules")
+def get_all_schedules_by_id_bus_line(bus_line_id):
+    mimetype = columnar.negotiate(request)
+    if mimetype != columnar.JSON:
+        return columnar_response('schedules', model(StationLine).iter_schedule_batches(bus_line_id), mimetype)
+    return model(StationLine).get_all_schedules_by_id_bus_line_json(bus_line_id)
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/bus_stations/<bus_station_id>", message="Successfully retrieved a station line")
+def get_station_line_by_id(bus_station_id, bus_line_id):
+    return found(model(StationLine).get_station_line_by_id(bus_station_id, bus_line_id), "Station line not found")
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/bus_stations/<bus_station_id>", methods=["POST"],
+                message="Successfully created a station line", status=201, auth=True,
+                failure="Failed to create a station line")
+def create_station_line(bus_station_id, bus_line_id):
+    line_and_station(bus_line_id, bus_station_id)
+    data = json_body()
+    return model(StationLine).create_station_line(
+        bus_station_id, bus_line_id, data["seq"], data["start_time_first"], data["distance"])
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/bus_stations/<bus_station_id>", methods=["PUT"],
+                message="Successfully updated a station line", status=201, auth=True,
+                failure="failed to update a station line", failure_status=400)
+def update_station_line(bus_station_id, bus_line_id):
+    line_and_station(bus_line_id, bus_station_id)
+    data = json_body()
+    return model(StationLine).update_station_line(
+        bus_station_id, bus_line_id, data["seq"], data["start_time_first"], data["distance"])
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/bus_stations/<bus_station_id>", methods=["DELETE"],
+                message="Successfully deleted a station line", status=204, auth=True,
+                failure="failed to delete a station line", failure_status=400)
+def delete_station_line(bus_station_id, bus_line_id):
+    line_and_station(bus_line_id, bus_station_id)
+    if not model(StationLine).delete_station_line(bus_station_id, bus_line_id):
+        raise BadRequest("failed to delete a station line")
+
+
+@lines.endpoint("/bus_lines/<bus_line_id>/sequence", methods=["PUT"],
+                message="Successfully updated the bus line sequence", auth=True,
+                failure="failed to update the bus line sequence", failure_status=400)
+def resequence_bus_line(bus_line_id):
+    bus_line = found(model(BusLine).get_bus_line_by_id(bus_line_id), "Bus line not found")
+    data = request.json
+    stops = data.get("stops") if isinstance(data, dict) else data
+    if not isinstance(stops, list) or not all(isinstance(stop, dict) and "id_bus_station" in stop and "distance" in stop for stop in stops):
+        raise BadRequest("Please provide stops as a list of id_bus_station, distance")
+    if len({stop["id_bus_station"] for stop in stops}) != len(stops):
+        raise BadRequest("A bus station can only appear once on a line")
+    result = model(StationLine).resequence(bus_line.id, stops)
+    if result is None:
+        raise BadRequest("failed to update the bus line sequence")
+    return result
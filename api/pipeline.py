@@ -0,0 +1,387 @@
+import functools
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from flask import Blueprint, Response, current_app, g, has_request_context, jsonify, request
+from flask_cors import cross_origin
+from flask_jwt_extended import get_jwt_identity, jwt_required, verify_jwt_in_request
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from werkzeug.exceptions import HTTPException
+from db import connect, create_pool, tracing
+from models import User, memory
+from routing import listener
+from utils import columnar, metrics
+from utils.passwords import HashPoolBusy
+
+
+class ApiError(Exception):
+    """Turned into the error envelope by the pipeline"""
+    status = 500
+    error = "Internal Server Error"
+    headers = None
+
+    def __init__(self, message, error=None, status=None):
+        super().__init__(message)
+        self.message = message
+        if error is not None:
+            self.error = error
+        if status is not None:
+            self.status = status
+
+
+class BadRequest(ApiError):
+    status = 400
+    error = "Bad request"
+
+
+class Unauthorized(ApiError):
+    status = 401
+    error = "Unauthorized"
+
+
+class Forbidden(ApiError):
+    status = 403
+    error = "Forbidden"
+
+
+class NotFound(ApiError):
+    status = 404
+    error = "Not found"
+
+
+class NotAcceptable(ApiError):
+    status = 406
+    error = "Not Acceptable"
+
+
+class Conflict(ApiError):
+    status = 409
+    error = "Conflict"
+
+
+class ServiceUnavailable(ApiError):
+    status = 503
+    error = "Service Unavailable"
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.headers = {"Retry-After": str(retry_after)}
+
+
+def error_response(message, error, status, headers=None):
+    return jsonify({
+        "message": message,
+        "error": error,
+        "data": None
+    }), status, headers or {}
+
+
+# Connection lifecycle
+
+
+def connect_worker():
+    """Open a connection for this process' pool"""
+    worker_conn = connect()
+    listener.ignore(worker_conn)
+    return worker_conn
+
+
+pool = create_pool(connect_worker, maxconn=int(os.getenv('DB_POOL_SIZE', 10)))
+
+
+def connect_replica(dsn):
+    """Open a read-only connection to the replica named by a libpq DSN or URI"""
+    params = {'connect_timeout': int(os.getenv('DB_REPLICA_CONNECT_TIMEOUT', 2)),
+              **psycopg2.extensions.parse_dsn(dsn)}
+    replica_conn = connect(**params)
+    replica_conn.set_session(readonly=True)
+    return replica_conn
+
+
+# DB_REPLICAS lists DSNs, comma-separated; each replica gets its own pool.
+# A busy replica pool is not waited for, the read goes to the primary.
+replica_pools = [
+    create_pool(functools.partial(connect_replica, dsn.strip()),
+                maxconn=int(os.getenv('DB_REPLICA_POOL_SIZE', os.getenv('DB_POOL_SIZE', 10))),
+                timeout=float(os.getenv('DB_REPLICA_POOL_WAIT', 0)))
+    for dsn in os.getenv('DB_REPLICAS', '').split(',') if dsn.strip()
+]
+
+# Reads of a client stay on the primary this long after its last write
+STICKY_COOKIE = 'read_primary_until'
+sticky_seconds = float(os.getenv('DB_STICKY_SECONDS', 5))
+
+connection_routes = metrics.registry.counter(
+    'db_connection_routes_total', "Request connections by pool and why it was chosen", ('target', 'reason'))
+
+logger = logging.getLogger(__name__)
+
+# At most one fallback warning per FALLBACK_LOG_SECONDS, with a count of the rest
+FALLBACK_LOG_SECONDS = 60
+_fallbacks = {'logged_at': 0.0, 'suppressed': 0}
+_fallbacks_lock = threading.Lock()
+
+
+def _log_fallback(e):
+    with _fallbacks_lock:
+        now = time.monotonic()
+        if now - _fallbacks['logged_at'] < FALLBACK_LOG_SECONDS:
+            _fallbacks['suppressed'] += 1
+            return
+        suppressed, _fallbacks['suppressed'], _fallbacks['logged_at'] = _fallbacks['suppressed'], 0, now
+    logger.warning("Replica unavailable, reading from the primary (%d more since the last warning): %s",
+                   suppressed, str(e).strip())
+
+
+def _route():
+    """(pool, reason) for the current request: GET and HEAD read from a
+    replica unless the client wrote within the sticky window"""
+    if not replica_pools or not has_request_context():
+        return pool, 'primary'
+    if request.method not in ('GET', 'HEAD'):
+        return pool, 'write'
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+            return pool, 'sticky'
+    except ValueError:
+        pass
+    return random.choice(replica_pools), 'read'
+
+
+def get_conn():
+    """Connection checked out for the current app context, from a replica
+    pool for reads when DB_REPLICAS is set and from the primary otherwise"""
+    if 'conn' not in g:
+        target, reason = _route()
+        try:
+            g.conn = target.getconn()
+        except psycopg2.Error as e:
+            if target is pool:
+                raise
+            _log_fallback(e)
+            target, reason = pool, 'fallback'
+            g.conn = pool.getconn()
+        g.conn_pool = target
+        connection_routes.inc(('primary' if target is pool else 'replica', reason))
+    return g.conn
+
+
+def release_conn(e=None):
+    request_conn = g.pop('conn', None)
+    if request_conn is not None:
+        g.pop('conn_pool', pool).putconn(request_conn)
+
+
+def _stick_to_primary(response):
+    """Send the client's reads to the primary for a while after a successful write"""
+    if replica_pools and request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        response.set_cookie(STICKY_COOKIE, f"{time.time() + sticky_seconds:.3f}",
+                            max_age=math.ceil(sticky_seconds), httponly=True, samesite='Lax')
+    return response
+
+
+def model(cls):
+    """Model instance bound to the request connection, or to the memory store
+    with STORAGE_BACKEND=memory or sqlite, one per class and request
+
+    The connection is checked out here rather than on first query, so a
+    model never waits for the pool while holding a lock such as the
+    routing graph's (a write holding the last connection waits on that
+    lock to patch the graph).
+    """
+    models = g.setdefault('models', {})
+    if cls not in models:
+        backend = current_app.config['STORAGE_BACKEND']
+        if backend in ('memory', 'sqlite'):
+            if cls not in memory.MODELS:
+                raise ApiError(f"{cls.__name__} is not available with the {backend} storage backend",
+                               error="Not Implemented", status=501)
+            models[cls] = memory.MODELS[cls](memory.get_store())
+        else:
+            models[cls] = cls(get_conn())
+    return models[cls]
+
+
+def current_user():
+    """Profile of the JWT identity, from the short-lived profile cache"""
+    if 'current_user' not in g:
+        g.current_user = model(User).get_profile(get_jwt_identity())
+    return g.current_user
+
+
+def require_admin():
+    """Raise unless the request carries the JWT of an admin"""
+    try:
+        verify_jwt_in_request()
+    except (JWTExtendedException, PyJWTError) as e:
+        raise Unauthorized("Admin token required", str(e))
+    user = current_user()
+    if not user or not user.get('is_admin'):
+        raise Forbidden("Admin rights required")
+    return user
+
+
+# Request helpers
+
+
+def json_body(message="Invalid data"):
+    data = request.json
+    if not data:
+        raise BadRequest(message)
+    return data
+
+
+def found(value, message):
+    if not value:
+        raise NotFound(message)
+    return value
+
+
+def server_timing(name, seconds):
+    """Add a phase to this response's Server-Timing header"""
+    g.setdefault('timings', []).append(f"{name};dur={seconds * 1000:.1f}")
+
+
+def debug_requested():
+    return request.args.get('debug', '').lower() in ['true', '1']
+
+
+def columnar_response(dataset, batches, mimetype):
+    if mimetype is None or not columnar.available():
+        raise NotAcceptable("Requested format is not available")
+    return Response(columnar.encode(dataset, batches, mimetype), mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={columnar.filename(dataset, mimetype)}"
+    })
+
+
+# Metrics hooks
+
+_hooks = []
+
+requests_total = metrics.registry.counter(
+    'http_requests_total', "Requests by endpoint, method and status", ('endpoint', 'method', 'status'))
+request_duration = metrics.registry.histogram(
+    'http_request_duration_seconds', "Request latency by endpoint", ('endpoint', 'method'))
+response_size = metrics.registry.histogram(
+    'http_response_size_bytes', "Response body size by endpoint, streamed bodies excluded",
+    ('endpoint', 'method'), metrics.SIZE_BUCKETS)
+
+
+def add_hook(hook):
+    """Register hook(endpoint, method, status, seconds, size), called after
+    each request. size is None for streamed responses."""
+    if hook not in _hooks:
+        _hooks.append(hook)
+    return hook
+
+
+@add_hook
+def record_request(endpoint, method, status, seconds, size):
+    # unmatched URLs share one label so scanners can't grow the series
+    labels = (endpoint or 'unmatched', method)
+    requests_total.inc(labels + (status,))
+    request_duration.observe(labels, seconds)
+    if size is not None:
+        response_size.observe(labels, size)
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+    g.db_trace = tracing.begin(request.endpoint)
+
+
+def _finish_trace(e=None):
+    trace = g.pop('db_trace', None)
+    if trace is not None:
+        tracing.finish(*trace)
+
+
+def _run_hooks(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    if 'db_trace' in g:
+        response.headers['Server-Timing'] = ', '.join(
+            [g.db_trace[0].server_timing(elapsed)] + g.pop('timings', []))
+    if _hooks:
+        size = None if response.is_streamed else response.calculate_content_length()
+        for hook in list(_hooks):
+            try:
+                hook(request.endpoint, request.method, response.status_code, elapsed, size)
+            except Exception:
+                logger.exception("Error in request hook %s", getattr(hook, '__name__', hook))
+    return response
+
+
+class ApiBlueprint(Blueprint):
+    """Blueprint whose endpoints return data and leave the envelope to the pipeline"""
+
+    def endpoint(self, rule, methods=("GET",), message=None, status=200, auth=False, admin=False,
+                 failure="Something went wrong", failure_status=500):
+        """Register a handler returning the `data` of the success envelope.
+
+        The handler may also return a Response, sent as is, or raise ApiError
+        for an error envelope. Anything else, tuples included, is data.
+        An HTTPException keeps its status in the error envelope; any other
+        exception is reported as `failure` with `failure_status`. `admin` implies `auth` and answers
+        403 unless the user is an admin.
+        """
+        auth = auth or admin
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def view(**kwargs):
+                try:
+                    if admin:
+                        require_admin()
+                    result = fn(**kwargs)
+                except HashPoolBusy as e:
+                    error = ServiceUnavailable("Too many logins in progress, please retry", e.retry_after)
+                    return error_response(error.message, error.error, error.status, error.headers)
+                except ApiError as e:
+                    return error_response(e.message, e.error, e.status, e.headers)
+                except HTTPException as e:
+                    # e.g. the 415 of request.json on a body that isn't JSON
+                    return error_response(e.description, e.name, e.code)
+                except Exception as e:
+                    return error_response(failure, str(e), failure_status)
+                if isinstance(result, Response):
+                    return result
+                return jsonify({
+                    "message": message,
+                    "data": result
+                }), status
+
+            handler = jwt_required()(view) if auth else view
+            self.add_url_rule(rule, view_func=cross_origin()(handler), methods=list(methods))
+            return fn
+        return decorator
+
+
+def init_app(app):
+    app.teardown_appcontext(release_conn)
+    app.before_request(_start_timer)
+    app.after_request(_run_hooks)
+    app.after_request(_stick_to_primary)
+    app.teardown_request(_finish_trace)
+
+    @app.errorhandler(403)
+    def for_bidden(e):
+        return error_response("For bidden", str(e), 403)
+
+    @app.errorhandler(404)
+    def not_found(e):
+        return error_response("Not found", str(e), 404)
+
+
+def token_expires_in():
+    return int(current_app.config['JWT_ACCESS_TOKEN_EXPIRES'])
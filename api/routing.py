@@ -0,0 +1,32 @@
+from flask import Response, request
+from models import StationLine
+from routing import SearchStats
+from utils import profiler
+from .pipeline import ApiBlueprint, debug_requested, model, require_admin, server_timing
+
+routing = ApiBlueprint('routing', __name__)
+
+
+def endpoints():
+    return int(request.args.get('start')), int(request.args.get('end'))
+
+
+@routing.endpoint("/routes/shortest", message="Successfully retrieved shortest path")
+def get_shortest_path():
+    stats = SearchStats()
+    if request.args.get('profile', '').lower() in ['true', '1']:
+        require_admin()
+        _, report = profiler.profile_call(model(StationLine).shortest_path, *endpoints(), stats=stats)
+        return Response(report, mimetype='text/plain')
+    result = model(StationLine).shortest_path(*endpoints(), stats=stats)
+    server_timing('graph', stats.graph_seconds)
+    server_timing('search', stats.search_seconds)
+    if not debug_requested():
+        return result
+    data = result if isinstance(result, dict) else {"routing": None, "distance": None}
+    return {**data, "debug": stats.as_dict()}
+
+
+@routing.endpoint("/routes", message="Successfully retrieved all paths")
+def get_find_all_paths():
+    return model(StationLine).find_all_paths(*endpoints())
@@ -0,0 +1,48 @@
+from flask import request
+from models import BusStation, StationLine
+from utils import columnar
+from .pipeline import ApiBlueprint, columnar_response, found, json_body, model
+
+stations = ApiBlueprint('stations', __name__)
+
+
+@stations.endpoint("/bus_stations", message="Successfully retrieved bus stations")
+def get_all_bus_stations():
+    mimetype = columnar.negotiate(request)
+    if mimetype != columnar.JSON:
+        return columnar_response('bus_stations', model(BusStation).iter_bus_station_batches(), mimetype)
+    return model(BusStation).get_all_bus_stations_json()
+
+
+@stations.endpoint("/bus_stations/<bus_station_id>", message="Successfully retrieved a bus station")
+def get_bus_station_by_id(bus_station_id):
+    return found(model(BusStation).get_bus_station_by_id(bus_station_id), "Bus station not found")
+
+
+@stations.endpoint("/bus_stations", methods=["POST"], message="Successfully created a bus station", status=201,
+                   auth=True, failure="Failed to create a bus station")
+def create_bus_station():
+    data = json_body()
+    return model(BusStation).create_bus_station(
+        data["name"], data["long"], data["lat"], data["address"], data["id_ward"])
+
+
+@stations.endpoint("/bus_stations/<bus_station_id>", methods=["PUT"], message="Successfully updated a bus station",
+                   status=201, auth=True, failure="failed to update a bus station", failure_status=400)
+def update_bus_station(bus_station_id):
+    found(model(BusStation).get_bus_station_by_id(bus_station_id), "Bus station not found")
+    data = json_body()
+    return model(BusStation).update_bus_station(
+        bus_station_id, data["name"], data["long"], data["lat"], data["address"], data["id_ward"])
+
+
+@stations.endpoint("/bus_stations/<bus_station_id>", methods=["DELETE"], message="Successfully deleted a bus station",
+                   status=204, auth=True, failure="failed to delete a bus station", failure_status=400)
+def delete_bus_station(bus_station_id):
+    found(model(BusStation).get_bus_station_by_id(bus_station_id), "Bus station not found")
+    model(BusStation).delete_bus_station(bus_station_id)
+
+
+@stations.endpoint("/bus_stations/<bus_station_id>/bus_lines", message="Successfully retrieved all bus lines")
+def get_all_bus_lines_by_id_bus_station(bus_station_id):
+    return model(StationLine).get_all_bus_lines_by_id_bus_station(bus_station_id)
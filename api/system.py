@@ -0,0 +1,74 @@
+import math
+import os
+import re
+import secrets
+import time
+
+from flask import Response, jsonify, request
+from db import statements
+from utils import metrics, profiler
+from .pipeline import ApiBlueprint, BadRequest, Conflict, NotFound
+
+system = ApiBlueprint('system', __name__)
+
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 60))
+# <pid>-<end, epoch seconds>-<token>
+PROFILE_ID = re.compile(r'\d+-(\d+)-[0-9a-f]{8}')
+# a session this long past its end without a result has failed or its worker died
+PROFILE_GRACE_SECONDS = 30
+
+
+@system.endpoint("/")
+def hello():
+    return Response("Hello World!")
+
+
+@system.endpoint("/stats/statements", message="Successfully retrieved prepared statement stats", auth=True)
+def get_statement_stats():
+    return statements.registry.stats()
+
+
+@system.endpoint("/metrics")
+def get_metrics():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@system.endpoint("/debug/profile", methods=["POST"], message="Profiling started", status=202, admin=True)
+def start_profile():
+    """Start sampling this worker's threads; the collapsed stacks are fetched
+    from /debug/profile/<id> once the session is over"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', 0.01))
+    except ValueError:
+        raise BadRequest("seconds and interval must be numbers")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS or not 0.001 <= interval <= 1:
+        raise BadRequest(f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}] and interval in [0.001, 1]")
+    # the id carries the end of the session, so any worker can tell running from unknown
+    session_id = f"{os.getpid()}-{math.ceil(time.time() + seconds)}-{secrets.token_hex(4)}"
+    try:
+        profiler.start(session_id, seconds, interval)
+    except profiler.ProfilerBusy as e:
+        raise Conflict(str(e))
+    return {"id": session_id, "pid": os.getpid(), "seconds": seconds, "location": f"/debug/profile/{session_id}"}
+
+
+@system.endpoint("/debug/profile/<session_id>", admin=True)
+def get_profile(session_id):
+    """Collapsed stacks of a finished session"""
+    match = PROFILE_ID.fullmatch(session_id)
+    if not match:
+        raise NotFound("Profile not found")
+    result = profiler.result(session_id)
+    if result is None:
+        ends = int(match.group(1))
+        if time.time() > ends + PROFILE_GRACE_SECONDS:
+            raise NotFound("Profile not found")
+        response = jsonify({"message": "Profile is still running", "data": None})
+        response.status_code = 202
+        response.headers["Retry-After"] = str(max(1, math.ceil(ends - time.time())))
+        return response
+    return Response(result['stacks'], mimetype='text/plain', headers={
+        "X-Profile-Samples": str(result['samples']),
+        "X-Worker-Pid": str(result['pid'])
+    })
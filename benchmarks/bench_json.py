@@ -0,0 +1,83 @@
+"""Serialization cost per thousand rows for the list endpoints.
+
+    python -m benchmarks.bench_json [--rows 1000] [--dsn postgresql://...]
+
+Compares the old path (tuples -> dicts -> stdlib json, as `jsonify` did
+before `JSONProvider`), orjson over the same dicts, and the `*_json` model
+path where Postgres aggregates the rows and Python only splices the text.
+With `--dsn` the model methods are also timed against a live database.
+"""
+import argparse
+import datetime
+import decimal
+import json
+import timeit
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.json_provider import JSONProvider, RawJSON
+
+
+def make_rows(n):
+    return [(i, f"Station {i}", decimal.Decimal('106.700000') + i, decimal.Decimal('10.770000'), f"{i} Le Loi",
+             '076001', datetime.time(5, i % 60)) for i in range(n)]
+
+
+def to_dicts(rows):
+    return [{
+        'id': row[0],
+        'name': row[1],
+        'long': row[2],
+        'lat': row[3],
+        'address': row[4],
+        'id_ward': row[5],
+        'start_time_first': row[6]
+    } for row in rows]
+
+
+class _LegacyProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, datetime.time):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+def timed(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--number', type=int, default=50)
+    parser.add_argument('--dsn')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    legacy, fast = _LegacyProvider(app), JSONProvider(app)
+    rows = make_rows(args.rows)
+    raw = RawJSON(json.dumps(to_dicts(rows), default=fast._fallback_default))
+    scale = 1000 / args.rows
+
+    results = {
+        'dicts + stdlib json (before)': lambda: legacy.dumps({'data': to_dicts(rows)}),
+        'dicts + orjson': lambda: fast.dumps({'data': to_dicts(rows)}),
+        'RawJSON splice': lambda: fast.dumps({'data': raw}),
+    }
+    if args.dsn:
+        import psycopg2
+        from models import BusStation
+        conn = psycopg2.connect(args.dsn)
+        results['db: get_all_bus_stations + stdlib json'] = lambda: legacy.dumps(
+            {'data': BusStation(conn).get_all_bus_stations()})
+        results['db: get_all_bus_stations_json'] = lambda: fast.dumps(
+            {'data': BusStation(conn).get_all_bus_stations_json()})
+
+    for name, fn in results.items():
+        print(f"{name:45s} {timed(fn, args.number) * scale * 1e3:8.3f} ms / 1000 rows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Memory held by 100k schedule rows as dicts vs `__slots__` records.
+
+    python -m benchmarks.bench_records [--rows 100000]
+"""
+import argparse
+import datetime
+import decimal
+import tracemalloc
+
+from models.records import ScheduleRecord
+
+
+def make_rows(n):
+    return [(i, i % 300, i % 60, datetime.time(5, i % 60), decimal.Decimal('0.75'), 10.77, 106.7, f"Station {i}")
+            for i in range(n)]
+
+
+def as_dicts(rows):
+    return [{
+        'id_bus_station': row[0],
+        'id_bus_line': row[1],
+        'seq': row[2],
+        'start_time_first': row[3],
+        'distance': row[4],
+        'lat': row[5],
+        'long': row[6],
+        'name': row[7]
+    } for row in rows]
+
+
+def as_records(rows):
+    return [ScheduleRecord(*row[:8]) for row in rows]
+
+
+def measure(build, rows):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build(rows)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    dicts = measure(as_dicts, rows)
+    records = measure(as_records, rows)
+    print(f"dicts   {dicts / 2 ** 20:8.2f} MiB")
+    print(f"records {records / 2 ** 20:8.2f} MiB ({records / dicts:.0%} of dicts)")
+
+
+if __name__ == '__main__':
+    main()
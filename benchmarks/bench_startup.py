@@ -0,0 +1,72 @@
+"""Cold start cost of the app, measured with `python -X importtime`.
+
+    python -m benchmarks.bench_startup [--repeat 5] [--top 15]
+
+Each stage runs in a fresh interpreter: importing `server`, then building
+the app with `create_app()`. Prints the median wall time, the cumulative
+import time reported by -X importtime and the slowest top-level imports,
+and flags heavy modules (networkx, numpy, pyarrow) that were loaded
+before routing or a columnar export was used.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = {
+    'import server': 'import server',
+    'create_app()': 'import server; server.create_app(preload_network=False)',
+}
+
+HEAVY = ('networkx', 'numpy', 'pyarrow')
+
+
+def run(code):
+    """Run code in a new interpreter
+
+    Returns:
+        tuple: wall seconds, total import us, {module imported directly by
+            the code: cumulative us}, set of every module imported
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    wall = time.perf_counter() - start
+    total, direct, loaded = 0, {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        loaded.add(name.strip())
+        # one space before top-level modules, two more per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative)
+        if depth <= 1:
+            direct[name.strip()] = max(direct.get(name.strip(), 0), int(cumulative))
+    return wall, total, direct, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    for stage, code in STAGES.items():
+        runs = [run(code) for _ in range(args.repeat)]
+        wall = statistics.median(r[0] for r in runs)
+        imports = statistics.median(r[1] for r in runs)
+        _, _, direct, loaded = runs[-1]
+        print(f"{stage}: {wall * 1e3:.1f} ms wall, {imports / 1e3:.1f} ms in imports")
+        for name, us in sorted(direct.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:40s} {us / 1e3:8.1f} ms")
+        heavy = sorted(name for name in loaded if name in HEAVY)
+        print(f"    heavy modules loaded: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Routing, model and serialization benchmarks on a synthetic network, as JSON.
+
+    python -m benchmarks.bench_suite [--backend memory|postgres] [--seed-db] [--output run.json]
+    python -m benchmarks.bench_suite --compare before.json [--threshold 0.1]
+
+The network comes from benchmarks.network (--stations, --lines,
+--stops-per-line, --overlap, --seed). With the memory backend the
+network is loaded into a MemoryStore, and routing and serialization run
+on the memory models without a database. The postgres backend uses the database named
+by the DB_* variables: --seed-db replaces its network with the generated
+one first, otherwise whatever is loaded is measured. It also times the
+list models and end-to-end requests through the Flask test client.
+
+Path enumeration is exponential in the network's size, so it runs on a
+small network generated with the same overlap (--enum-stations).
+
+--compare prints the change in median against an earlier run and exits
+with 1 when a benchmark got slower by more than --threshold.
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from flask import Flask
+
+from benchmarks.network import generate
+from models import MemoryStore
+from models.memory import MemoryBusLine, MemoryBusStation, MemoryStationLine
+from routing import routing_graph
+from routing.compact import CompactGraph
+from utils.json_provider import JSONProvider
+
+
+def measure(fn, repeat, ops=1):
+    """Time `repeat` calls of fn
+
+    Returns:
+        dict: min / median / p95 / mean milliseconds per call and per op
+    """
+    fn()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    runs.sort()
+    return {
+        'runs': repeat,
+        'ops': ops,
+        'min_ms': round(runs[0], 4),
+        'median_ms': round(statistics.median(runs), 4),
+        'p95_ms': round(runs[min(len(runs) - 1, int(len(runs) * .95))], 4),
+        'mean_ms': round(statistics.fmean(runs), 4),
+        'median_ms_per_op': round(statistics.median(runs) / ops, 4)
+    }
+
+
+def pairs(station_line, count, seed):
+    """Random (start, end) pairs of stations that are both in the graph"""
+    nodes = sorted(routing_graph.frozen(station_line).ids)
+    rng = random.Random(seed)
+    return [tuple(rng.sample(nodes, 2)) for _ in range(count)]
+
+
+def routing_benchmarks(station_line, args):
+    results = {
+        'graph_build': measure(lambda: routing_graph.build(station_line), args.repeat),
+        'graph_freeze': measure(lambda: CompactGraph.from_graph(routing_graph.get(station_line)), args.repeat)
+    }
+    batch = pairs(station_line, args.batch, args.seed)
+    results['shortest_path_single'] = measure(lambda: station_line.shortest_path(*batch[0]), args.repeat * 10)
+    results['shortest_path_batch'] = measure(
+        lambda: [station_line.shortest_path(start, end) for start, end in batch], args.repeat, len(batch))
+    return results
+
+
+def enumeration_benchmark(args):
+    small = MemoryStationLine(MemoryStore(generate(args.enum_stations, max(2, args.enum_stations // 10), 10,
+                                                   args.overlap, args.seed)))
+    routing_graph.swap(routing_graph.build(small))
+    batch = pairs(small, 10, args.seed)
+    return {'find_all_paths': measure(
+        lambda: [small.find_all_paths(start, end) for start, end in batch], args.repeat, len(batch))}
+
+
+def serialization_benchmarks(data):
+    provider = JSONProvider(Flask(__name__))
+    return {f"serialize_{name}": measure(lambda rows=rows: provider.dumps({'data': rows}), 20, len(rows))
+            for name, rows in data.items()}
+
+
+def postgres_benchmarks(args):
+    from db import connect
+    from models import BusLine, BusStation, NetworkImport, StationLine, read_bundle
+    from server import create_app
+
+    conn = connect()
+    if args.seed_db:
+        with read_bundle(args.bundle) as bundle:
+            NetworkImport(conn).import_bundle(bundle, replace=True)
+    routing_graph.invalidate()
+    station_line = StationLine(conn)
+    results = routing_benchmarks(station_line, args)
+    results['model_get_all_bus_stations'] = measure(lambda: BusStation(conn).get_all_bus_stations(), args.repeat)
+    results['model_get_all_bus_stations_json'] = measure(
+        lambda: BusStation(conn).get_all_bus_stations_json(), args.repeat)
+    results.update(serialization_benchmarks({
+        'bus_stations': BusStation(conn).get_all_bus_stations(),
+        'bus_lines': BusLine(conn).get_all_bus_lines()
+    }))
+
+    client = create_app(preload_network=False).test_client()
+    station = pairs(station_line, 1, args.seed)[0][0]
+    batch = pairs(station_line, args.batch, args.seed)
+    for name, path in {
+        'http_bus_stations': '/bus_stations',
+        'http_bus_lines': '/bus_lines',
+        'http_bus_station': f'/bus_stations/{station}',
+    }.items():
+        results[name] = measure(lambda path=path: client.get(path), args.repeat)
+    results['http_routes_shortest'] = measure(
+        lambda: [client.get(f'/routes/shortest?start={start}&end={end}') for start, end in batch],
+        args.repeat, len(batch))
+    conn.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print the median change per benchmark, return whether any regressed"""
+    regressed = False
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:40s} {result['median_ms_per_op']:10.3f} ms  (new)")
+            continue
+        change = result['median_ms_per_op'] / before['median_ms_per_op'] - 1 if before['median_ms_per_op'] else 0
+        flag = '  REGRESSION' if change > threshold else ''
+        regressed = regressed or bool(flag)
+        print(f"{name:40s} {before['median_ms_per_op']:10.3f} -> {result['median_ms_per_op']:10.3f} ms "
+              f"{change:+7.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=('memory', 'postgres'), default='memory')
+    parser.add_argument('--seed-db', action='store_true', help='Replace the database network with the generated one.')
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--lines', type=int, default=80)
+    parser.add_argument('--stops-per-line', type=int, default=30)
+    parser.add_argument('--overlap', type=float, default=0.5)
+    parser.add_argument('--enum-stations', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    args.bundle = generate(args.stations, args.lines, args.stops_per_line, args.overlap, args.seed)
+    # models print their errors, keep stdout for the results
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.backend == 'postgres':
+            results = postgres_benchmarks(args)
+        else:
+            store = MemoryStore(args.bundle)
+            station_line = MemoryStationLine(store)
+            routing_graph.swap(routing_graph.build(station_line))
+            results = routing_benchmarks(station_line, args)
+            results.update(serialization_benchmarks({
+                'bus_stations': MemoryBusStation(store).get_all_bus_stations(),
+                'bus_lines': MemoryBusLine(store).get_all_bus_lines()
+            }))
+        results.update(enumeration_benchmark(args))
+
+    run = {
+        'meta': {
+            'backend': args.backend,
+            'network': {name: getattr(args, name) for name in
+                        ('stations', 'lines', 'stops_per_line', 'overlap', 'enum_stations', 'seed')},
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'revision': git_revision(),
+            'time': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        },
+        'results': results
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    else:
+        json.dump(run, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), run, args.threshold)
+        if regressed:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""p50/p95/p99 of a non-auth endpoint while a login storm is running.
+
+    python -m benchmarks.load_login_storm [--logins 32] [--probes 4] [--seconds 10] [--inline]
+
+Serves create_app() from a threaded werkzeug server in this process
+(DB_* variables select the database), registers a throwaway user, then
+runs `--logins` threads posting /auth/login next to `--probes` threads
+reading `--probe` (a public endpoint). `--inline` sets
+PASSWORD_HASH_WORKERS=0 to compare against hashing in the request
+thread. Login clients honour Retry-After on 503.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return {'p50': None, 'p95': None, 'p99': None}
+    cuts = statistics.quantiles(samples, n=100)
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def worker(port, method, path, body, stop, latencies, statuses):
+    client = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/json'} if body else {}
+    while not stop.is_set():
+        start = time.perf_counter()
+        client.request(method, path, body=body, headers=headers)
+        response = client.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.status == 503:
+            stop.wait(float(response.getheader('Retry-After', 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=32)
+    parser.add_argument('--probes', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--probe', default='/bus_lines/1')
+    parser.add_argument('--inline', action='store_true')
+    args = parser.parse_args()
+
+    if args.inline:
+        os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    from werkzeug.serving import make_server
+    from server import create_app
+
+    server = make_server('127.0.0.1', 0, create_app(preload_network=False), threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    email = f"storm-{random.getrandbits(32)}@example.com"
+    credentials = json.dumps({'email': email, 'name': 'Load test', 'password': 'correct horse'})
+    client = http.client.HTTPConnection('127.0.0.1', port)
+    client.request('POST', '/auth/register', body=credentials, headers={'Content-Type': 'application/json'})
+    client.getresponse().read()
+
+    stop = threading.Event()
+    runs = {'login': ([], {}), 'probe': ([], {})}
+    threads = [threading.Thread(target=worker, args=(port, 'POST', '/auth/login', credentials, stop, *runs['login']))
+               for _ in range(args.logins)]
+    threads += [threading.Thread(target=worker, args=(port, 'GET', args.probe, None, stop, *runs['probe']))
+                for _ in range(args.probes)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    print(f"hashing: {'inline' if args.inline else 'pool'}, {args.logins} login threads, {args.probes} probe threads")
+    for name, (latencies, statuses) in runs.items():
+        stats = percentiles(latencies)
+        print(f"{name:6s} {len(latencies) / args.seconds:8.1f} req/s  " +
+              '  '.join(f"{k} {v * 1e3:7.1f} ms" if v is not None else f"{k} n/a" for k, v in stats.items()) +
+              f"  statuses {dict(sorted(statuses.items()))}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Replay a weighted mix of API traffic and report latency per endpoint.
+
+    python -m benchmarks.load_mix --url http://127.0.0.1:5000 [--seconds 30] [--concurrency 16]
+    python -m benchmarks.load_mix --modes sync,threaded,single-conn,uncached [--output modes.json]
+
+The mix is `--mix name=weight,...` over MIX: station lookups, line
+schedules, /routes/shortest, /routes, /auth/login, /auth/me with the
+client's token and writes (a PUT of a station with its current values,
+so the data does not change).
+/routes enumerates every simple path and can run for minutes on a real
+network, so its default weight is 0.
+
+With --url the mix runs against a server that is already up. With
+--modes each mode starts its own server on a free port (gunicorn with
+gunicorn.conf.py, or `flask run` with --server flask), runs the mix and
+stops it, then the modes are compared. DB_* variables select the
+database for both. --rate switches from closed-loop clients to a fixed
+arrival rate, measuring latency from the scheduled send time.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from benchmarks.load_login_storm import percentiles
+
+MIX = ('station', 'station_lines', 'schedule', 'shortest', 'routes', 'login', 'me', 'write')
+DEFAULT_MIX = 'station=30,station_lines=10,schedule=20,shortest=25,routes=0,login=10,me=10,write=5'
+
+THREADS = ['-k', 'gthread', '--threads', '8']
+SHARED = ['-k', 'gthread', '--threads', '32']
+
+# name -> (extra gunicorn arguments, flask run threaded, environment).
+# Each pair differs in the one setting it compares:
+#   sync / threaded / async: the worker class, with a connection per concurrent request
+#   pooled / single-conn: 32 threads sharing a pool of 8 connections, or one connection
+#   cached / uncached: the USER_CACHE_TTL of the profiles behind /auth/me
+MODES = {
+    'sync': (['-k', 'sync'], False, {'DB_POOL_SIZE': '8'}),
+    'threaded': (THREADS, True, {'DB_POOL_SIZE': '8'}),
+    # needs gevent; psycopg2 still blocks the hub unless made green (psycogreen)
+    'async': (['-k', 'gevent', '--worker-connections', '100'], True, {'DB_POOL_SIZE': '8'}),
+    'pooled': (SHARED, True, {'DB_POOL_SIZE': '8'}),
+    'single-conn': (SHARED, True, {'DB_POOL_SIZE': '1'}),
+    'cached': (THREADS, True, {'DB_POOL_SIZE': '8', 'USER_CACHE_TTL': '30'}),
+    'uncached': (THREADS, True, {'DB_POOL_SIZE': '8', 'USER_CACHE_TTL': '0'}),
+}
+
+
+class Client:
+    """Keep-alive HTTP client of one load thread"""
+
+    def __init__(self, url, timeout):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port, self.timeout = parsed.hostname, parsed.port or 80, timeout
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = dict(headers or {})
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            raise
+        return response.status, data
+
+
+class Traffic:
+    """Ids and credentials discovered from the server, and the requests of the mix"""
+
+    def __init__(self, client):
+        _, body = client.request('GET', '/bus_stations')
+        self.stations = json.loads(body)['data'] or []
+        _, body = client.request('GET', '/bus_lines')
+        self.lines = [line['id'] for line in json.loads(body)['data'] or []]
+        if not self.stations or not self.lines:
+            raise SystemExit("The server has no bus stations or bus lines to query")
+        # route between stations some line serves, a random station is often on none
+        self.routable = []
+        for line in self.lines[:20]:
+            _, body = client.request('GET', f"/bus_lines/{line}/bus_stations")
+            self.routable += [station['id'] for station in json.loads(body)['data'] or []]
+        self.routable = sorted(set(self.routable)) or [station['id'] for station in self.stations]
+        self.credentials = {'email': f"load-{random.getrandbits(32)}@example.com", 'name': 'Load test',
+                            'password': 'correct horse battery'}
+        client.request('POST', '/auth/register', self.credentials)
+        _, body = client.request('POST', '/auth/login', self.credentials)
+        self.authorization = {'Authorization': f"Bearer {json.loads(body)['access_token']}"}
+
+    def request(self, name, rng):
+        """(method, path, body, headers) of one request of kind `name`"""
+        station = rng.choice(self.stations)
+        start, end = rng.choice(self.routable), rng.choice(self.routable)
+        if name == 'station':
+            return 'GET', f"/bus_stations/{station['id']}", None, None
+        if name == 'station_lines':
+            return 'GET', f"/bus_stations/{station['id']}/bus_lines", None, None
+        if name == 'schedule':
+            return 'GET', f"/bus_lines/{rng.choice(self.lines)}/schedules", None, None
+        if name == 'shortest':
+            return 'GET', f"/routes/shortest?start={start}&end={end}", None, None
+        if name == 'routes':
+            return 'GET', f"/routes?start={start}&end={end}", None, None
+        if name == 'login':
+            return 'POST', '/auth/login', self.credentials, None
+        if name == 'me':
+            return 'GET', '/auth/me', None, self.authorization
+        if name == 'write':
+            body = {key: station[key] for key in ('name', 'long', 'lat', 'address', 'id_ward')}
+            return 'PUT', f"/bus_stations/{station['id']}", body, self.authorization
+        raise ValueError(f"Unknown request kind {name}")
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in MIX:
+            raise SystemExit(f"Unknown request kind {name!r}, expected one of {', '.join(MIX)}")
+        mix[name.strip()] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def run_mix(url, mix, seconds, concurrency, rate=None, timeout=30, seed=1):
+    """Drive the mix from `concurrency` threads for `seconds`
+
+    Returns:
+        dict: per request kind and 'total': requests, errors, req/s, p50/p95/p99 ms
+    """
+    traffic = Traffic(Client(url, timeout))
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    deadline = time.perf_counter() + seconds
+    interval = concurrency / rate if rate else 0
+
+    def load(index):
+        client = Client(url, timeout)
+        rng = random.Random(seed + index)
+        scheduled = time.perf_counter() + rng.uniform(0, interval)
+        while True:
+            if interval:
+                time.sleep(max(0, scheduled - time.perf_counter()))
+                start = scheduled
+                scheduled += interval
+            else:
+                start = time.perf_counter()
+            if start >= deadline:
+                return
+            name = rng.choices(names, weights)[0]
+            method, path, body, headers = traffic.request(name, rng)
+            try:
+                status, _ = client.request(method, path, body, headers)
+                failed = status >= 400
+            except (OSError, http.client.HTTPException):
+                failed = True
+            samples[name].append(time.perf_counter() - start)
+            errors[name] += failed
+
+    threads = [threading.Thread(target=load, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    report = {}
+    everything = []
+    for name in names:
+        everything += samples[name]
+        report[name] = summarize(samples[name], errors[name], seconds)
+    report['total'] = summarize(everything, sum(errors.values()), seconds)
+    return report
+
+
+def summarize(latencies, errors, seconds):
+    cuts = percentiles(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'error_rate': round(errors / len(latencies), 4) if latencies else None,
+        'rps': round(len(latencies) / seconds, 1),
+        **{key: round(value * 1000, 2) if value is not None else None for key, value in cuts.items()}
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, server, workers):
+    """Start the app in the given mode, return the process and its URL"""
+    gunicorn_args, threaded, env = MODES[mode]
+    port = free_port()
+    env = {**os.environ, **env, 'APP_HOST': '127.0.0.1', 'APP_PORT': str(port), 'WEB_CONCURRENCY': str(workers)}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', *gunicorn_args]
+    else:
+        command = [sys.executable, '-m', 'flask', '--app', 'server', 'run', '--port', str(port),
+                   '--with-threads' if threaded else '--without-threads']
+    process = subprocess.Popen(command, cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        if process.poll() is not None:
+            raise SystemExit(f"Server for mode {mode} exited with {process.returncode}")
+        try:
+            Client(url, 1).request('GET', '/')
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise SystemExit(f"Server for mode {mode} did not come up")
+
+
+def print_report(title, report):
+    print(title)
+    for name, stats in report.items():
+        print(f"    {name:14s} {stats['rps']:8.1f} req/s  p50 {stats['p50']} ms  p95 {stats['p95']} ms  "
+              f"p99 {stats['p99']} ms  errors {stats['errors']}/{stats['requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url')
+    parser.add_argument('--modes', help=f"Comma-separated, from: {', '.join(MODES)}")
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, help='Total requests per second (open loop).')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    if not args.url and not args.modes:
+        parser.error('give --url or --modes')
+
+    mix = parse_mix(args.mix)
+    runs = {}
+    if args.url:
+        runs['url'] = run_mix(args.url, mix, args.seconds, args.concurrency, args.rate, args.timeout, args.seed)
+        print_report(args.url, runs['url'])
+    for mode in filter(None, (args.modes or '').split(',')):
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode}")
+        process, url = start_server(mode, args.server, args.workers)
+        try:
+            runs[mode] = run_mix(url, mix, args.seconds, args.concurrency, args.rate, args.timeout, args.seed)
+        finally:
+            process.terminate()
+            process.wait()
+        print_report(mode, runs[mode])
+
+    if len(runs) > 1:
+        print(f"{'mode':14s} {'req/s':>9s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'errors':>8s}")
+        for mode, report in runs.items():
+            total = report['total']
+            print(f"{mode:14s} {total['rps']:9.1f} " +
+                  ' '.join(f"{total[key] if total[key] is not None else '-':>9}" for key in ('p50', 'p95', 'p99')) +
+                  f" {total['error_rate'] or 0:8.2%}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mix': mix, 'seconds': args.seconds, 'concurrency': args.concurrency, 'rate': args.rate,
+                       'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Synthetic city networks for the benchmarks.
+
+    python -m benchmarks.network --stations 2000 --lines 150 > network.json
+    flask --app server db import network.json --replace
+
+`generate` places stations at random in a box around Ho Chi Minh City and
+walks each line through nearby stations. `overlap` is the chance that a
+line's next stop is a station another line already serves, so 0 gives
+disjoint lines and values near 1 give a few busy corridors. The same
+arguments always give the same network.
+"""
+import argparse
+import json
+import math
+import random
+
+CENTER = (10.7769, 106.7009)
+RADIUS_KM = 15
+
+
+def _km(a, b):
+    """Haversine distance between two (lat, lng) points"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 12742 * math.asin(math.sqrt(h))
+
+
+def _neighbours(points, k):
+    """k nearest points of every point, found through a coarse grid"""
+    cell = 2 * RADIUS_KM / 111 / max(1, int(math.sqrt(len(points) / 4)))
+    grid = {}
+    for i, (lat, lng) in enumerate(points):
+        grid.setdefault((int(lat / cell), int(lng / cell)), []).append(i)
+    result = []
+    for i, (lat, lng) in enumerate(points):
+        cx, cy, ring, candidates = int(lat / cell), int(lng / cell), 1, []
+        while len(candidates) <= k and ring < 64:
+            candidates = [j for x in range(cx - ring, cx + ring + 1) for y in range(cy - ring, cy + ring + 1)
+                          for j in grid.get((x, y), ()) if j != i]
+            ring += 1
+        candidates.sort(key=lambda j: (points[j][0] - lat) ** 2 + (points[j][1] - lng) ** 2)
+        result.append(candidates[:k])
+    return result
+
+
+def generate(stations=1000, lines=80, stops_per_line=30, overlap=0.5, seed=1):
+    """Build a network bundle in the JSON layout read by NetworkImport
+
+    Returns:
+        dict: bus_stations, bus_lines and station_line lists of dicts
+    """
+    rng = random.Random(seed)
+    span = RADIUS_KM / 111
+    points = [(CENTER[0] + rng.uniform(-span, span), CENTER[1] + rng.uniform(-span, span)) for _ in range(stations)]
+    near = _neighbours(points, 12)
+    served = set()
+    bus_lines, station_line = [], []
+    for line in range(1, lines + 1):
+        current = rng.randrange(stations)
+        stops, start = [current], 5 * 60 + rng.randrange(0, 60, 5)
+        while len(stops) < min(stops_per_line, stations):
+            options = [j for j in near[current] if j not in stops]
+            if not options:
+                break
+            shared = [j for j in options if j in served]
+            current = rng.choice(shared if shared and rng.random() < overlap else options)
+            stops.append(current)
+        length, minute = 0.0, start
+        for seq, stop in enumerate(stops, 1):
+            distance = round(_km(points[stops[seq - 2]], points[stop]), 2) if seq > 1 else 0.0
+            length += distance
+            minute += round(distance * 3)
+            station_line.append({
+                'id_bus_station': stop + 1,
+                'id_bus_line': line,
+                'seq': seq,
+                'start_time_first': f"{minute // 60 % 24:02d}:{minute % 60:02d}:00",
+                'distance': distance
+            })
+        served.update(stops)
+        bus_lines.append({
+            'id': line,
+            'name': f"Line {line}",
+            'length': round(length, 2),
+            'price': rng.choice((5000, 6000, 7000)),
+            'number_of_trips': rng.randrange(80, 200),
+            'time_between_trips': rng.choice((5, 10, 15, 20)),
+            'start_time_first': f"{start // 60:02d}:{start % 60:02d}:00"
+        })
+    bus_stations = [{
+        'id': i + 1,
+        'name': f"Station {i + 1}",
+        'long': round(lng, 6),
+        'lat': round(lat, 6),
+        'address': f"{i + 1} Synthetic Street",
+        'id_ward': None
+    } for i, (lat, lng) in enumerate(points)]
+    return {'bus_stations': bus_stations, 'bus_lines': bus_lines, 'station_line': station_line}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--lines', type=int, default=80)
+    parser.add_argument('--stops-per-line', type=int, default=30)
+    parser.add_argument('--overlap', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.stations, args.lines, args.stops_per_line, args.overlap, args.seed)))
+
+
+if __name__ == '__main__':
+    main()
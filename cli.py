@@ -0,0 +1,184 @@
+import time
+
+import click
+import psycopg2
+
+from flask.cli import AppGroup
+
+from db import connect, migrate
+from models import GTFS, BundleError, MemoryStore, NetworkImport, StationLine, User, read_bundle
+from routing import routing_graph, snapshot
+
+db_cli = AppGroup('db', help='Database schema management.')
+users_cli = AppGroup('users', help='User management.')
+
+
+@db_cli.command('upgrade')
+def upgrade():
+    """Apply pending migrations from db/migrations."""
+    conn = connect()
+    try:
+        applied = migrate.upgrade(conn)
+    finally:
+        conn.close()
+    click.echo(f"Applied: {', '.join(applied)}" if applied else "Database is up to date")
+
+
+@db_cli.command('check-plans')
+def check_plans():
+    """EXPLAIN each model query and fail if one needs a sequential scan."""
+    conn = connect()
+    try:
+        results = migrate.check_plans(conn)
+    finally:
+        conn.close()
+    for result in results:
+        status = 'ok  ' if result['ok'] else 'FAIL'
+        click.echo(f"{status} {result['label']}: {'; '.join(result['scans'])}")
+    if not all(result['ok'] for result in results):
+        raise SystemExit(1)
+
+
+@db_cli.command('import')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--replace', is_flag=True, help='Replace the whole network instead of merging.')
+def import_network(path, replace):
+    """Bulk load a network bundle (.json, .zip or directory of CSV files)."""
+    conn = connect()
+    try:
+        with read_bundle(path) as bundle:
+            counts = NetworkImport(conn).import_bundle(bundle, replace=replace)
+    except BundleError as e:
+        for error in e.errors:
+            click.echo(error, err=True)
+        raise SystemExit(1)
+    finally:
+        conn.close()
+    click.echo(', '.join(f"{table}: {count}" for table, count in counts.items()))
+
+
+@db_cli.command('gtfs-import')
+@click.argument('feed', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True, help='Replace the whole network instead of merging.')
+def gtfs_import(feed, replace):
+    """Import a GTFS zip, collapsing trips into headway-based bus lines."""
+    conn = connect()
+    try:
+        counts = GTFS(conn).import_feed(feed, replace=replace)
+    except BundleError as e:
+        for error in e.errors:
+            click.echo(error, err=True)
+        raise SystemExit(1)
+    finally:
+        conn.close()
+    click.echo(', '.join(f"{table}: {count}" for table, count in counts.items()))
+
+
+@db_cli.command('gtfs-export')
+@click.argument('output', type=click.File('wb'))
+@click.option('--expand', is_flag=True, help='Write every trip instead of frequencies.txt.')
+def gtfs_export(output, expand):
+    """Export the network as a GTFS zip ("-" for stdout)."""
+    conn = connect()
+    try:
+        GTFS(conn).export_feed(output, expand=expand)
+    finally:
+        conn.close()
+
+
+@db_cli.command('routing-snapshot')
+@click.argument('path', type=click.Path(dir_okay=False), envvar='ROUTING_SNAPSHOT')
+def routing_snapshot(path):
+    """Build the routing graph and write its snapshot, e.g. before a deploy."""
+    conn = connect()
+    try:
+        version = snapshot.data_version(conn)
+        if version is None:
+            raise click.ClickException("network_version is missing, run `db upgrade` first")
+        state = routing_graph.build(StationLine(conn))
+        if snapshot.data_version(conn) != version:
+            raise click.ClickException("The network changed during the build, try again")
+    finally:
+        conn.close()
+    if not routing_graph.save(state, version, path):
+        raise SystemExit(1)
+    click.echo(f"Wrote {path} at network version {version}: "
+               f"{state.graph.number_of_nodes()} stations, {state.graph.number_of_edges()} edges")
+
+
+@db_cli.command('memory-snapshot')
+@click.argument('path', type=click.Path(dir_okay=False), envvar='MEMORY_SNAPSHOT')
+@click.option('--users', is_flag=True, help='Include users and their password hashes, for logins on the node.')
+def memory_snapshot(path, users):
+    """Write the tables read by STORAGE_BACKEND=memory nodes (.json or .json.gz)."""
+    conn = connect()
+    try:
+        store = MemoryStore.from_database(conn, users=users)
+    finally:
+        conn.close()
+    store.save(path, users=users)
+    click.echo(f"Wrote {path} at network version {store.network_version}: "
+               f"{len(store.bus_stations.rows)} stations, {len(store.bus_lines.rows)} lines, "
+               f"{len(store.station_line.rows)} stops")
+
+
+@db_cli.command('sqlite-sync')
+@click.argument('path', type=click.Path(dir_okay=False), envvar='SQLITE_PATH')
+@click.option('--users', is_flag=True, help='Copy users and their password hashes too, for logins on the depot.')
+@click.option('--full', is_flag=True, help='Copy everything instead of the changes since the last sync.')
+@click.option('--every', type=float, help='Keep running, syncing every this many seconds.')
+def sqlite_sync(path, users, full, every):
+    """Update the SQLite file of a STORAGE_BACKEND=sqlite depot server."""
+    from models import embedded
+
+    while True:
+        try:
+            conn = connect()
+            try:
+                result = embedded.sync(conn, path, users=users, full=full)
+            finally:
+                conn.close()
+            click.echo(f"{result['mode'].capitalize()} sync of {path}: "
+                       f"{result['copied']} rows copied, {result['deleted']} deleted")
+        except psycopg2.Error as e:
+            if not every:
+                raise click.ClickException(f"Sync failed: {e}")
+            click.echo(f"Sync failed, keeping the current copy: {e}", err=True)
+        if not every:
+            return
+        full = False
+        time.sleep(every)
+
+
+@db_cli.command('changelog-prune')
+@click.option('--days', type=int, default=30, show_default=True, help='Keep the entries of this many days.')
+def changelog_prune(days):
+    """Drop old changelog entries; depots that synced before them copy everything again."""
+    from models import embedded
+
+    conn = connect()
+    try:
+        removed = embedded.prune(conn, days)
+    finally:
+        conn.close()
+    click.echo(f"Removed {removed} changelog entries")
+
+
+@users_cli.command('set-admin')
+@click.argument('email')
+@click.option('--revoke', is_flag=True, help='Take admin rights away instead.')
+def set_admin(email, revoke):
+    """Grant a user access to the diagnostic endpoints."""
+    conn = connect()
+    try:
+        updated = User(conn).set_admin(email, not revoke)
+    finally:
+        conn.close()
+    if not updated:
+        raise click.ClickException(f"No user with email {email}")
+    click.echo(f"{email} is {'no longer ' if revoke else ''}an admin")
+
+
+def register_commands(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(users_cli)
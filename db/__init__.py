@@ -0,0 +1,3 @@
+from . import migrate, statements, tracing
+from .connection import connect, connection_params
+from .pool import ConnectionPool, PoolExhausted, create_pool
@@ -0,0 +1,26 @@
+import os
+
+import psycopg2
+
+from dotenv import load_dotenv
+from .tracing import TracingCursor
+
+
+def connection_params():
+    """Connection keyword arguments from the DB_* environment variables"""
+    load_dotenv()
+    return {
+        'dbname': os.getenv('DB_DATABASE', 'busline_gis'),
+        'user': os.getenv('DB_USERNAME', 'postgres'),
+        'password': os.getenv('DB_PASSWORD', '123456'),
+        'host': os.getenv('DB_HOST', 'localhost'),
+        'port': os.getenv('DB_PORT', '5432')
+    }
+
+
+def connect(**overrides):
+    """Open a connection; its cursors are traced unless DB_TRACE=false"""
+    params = connection_params()
+    if os.getenv('DB_TRACE', 'true').lower() in ['true', '1']:
+        params['cursor_factory'] = TracingCursor
+    return psycopg2.connect(**{**params, **overrides})
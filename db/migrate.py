@@ -0,0 +1,109 @@
+import json
+import os
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+
+def plan_checks():
+    """(label, query, params, table that must not be sequentially scanned) of
+    the model lookups, with the SQL the models run"""
+    from models import bus_line, bus_station, district, station_line, user, ward
+
+    return [
+        ('BusStation.get_bus_station_by_id', bus_station.BUS_STATION_BY_ID.sql, (1,), 'bus_stations'),
+        ('BusStation.get_bus_station_by_name', bus_station.BUS_STATION_BY_NAME, ('',), 'bus_stations'),
+        ('BusLine.get_bus_line_by_id', bus_line.BUS_LINE_BY_ID.sql, (1,), 'bus_lines'),
+        ('StationLine.get_station_line_by_id', station_line.STATION_LINE_BY_ID.sql, (1, 1), 'station_line'),
+        ('StationLine.get_all_bus_lines_by_id_bus_station',
+         station_line.STATION_LINES_BY_ID_BUS_STATION, (1,), 'station_line'),
+        ('StationLine.get_all_bus_stations_by_id_bus_line',
+         station_line.BUS_STATIONS_BY_ID_BUS_LINE, (1,), 'station_line'),
+        ('StationLine.get_all_schedules_by_id_bus_line',
+         station_line.SCHEDULES_BY_ID_BUS_LINE.sql, (1,), 'station_line'),
+        ('User.get_user_by_id', user.USER_BY_ID, (1,), 'users'),
+        ('User.get_user_by_email', user.USER_BY_EMAIL.sql, ('',), 'users'),
+        ('District.get_district_by_id', district.DISTRICT_BY_ID, ('',), 'districts'),
+        ('Ward.get_ward_by_id', ward.WARD_BY_ID, ('', ''), 'wards'),
+    ]
+
+
+def migrations():
+    """Sorted (version, path) pairs of the .sql files in db/migrations"""
+    return sorted(
+        (name.split('_', 1)[0], os.path.join(MIGRATIONS_DIR, name))
+        for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version VARCHAR(16) PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cursor.execute("SELECT version FROM schema_migrations;")
+        versions = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return versions
+
+
+def upgrade(conn):
+    """Apply pending migrations, each in its own transaction.
+
+    Returns:
+        list: versions that were applied
+    """
+    done = applied_versions(conn)
+    applied = []
+    for version, path in migrations():
+        if version in done:
+            continue
+        with open(path) as f:
+            sql = f.read()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version) VALUES (%s);", (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def check_plans(conn):
+    """EXPLAIN every model lookup with sequential scans disabled.
+
+    A sequential scan that survives `enable_seqscan = off` means no index
+    can serve the predicate.
+
+    Returns:
+        list: dicts with label, ok, and the scan nodes of the plan
+    """
+    results = []
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off;")
+        for label, query, params, table in plan_checks():
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = [
+                ' '.join([node['Node Type']]
+                         + ([f"on {node['Relation Name']}"] if 'Relation Name' in node else [])
+                         + ([f"using {node['Index Name']}"] if 'Index Name' in node else []))
+                for node in _plan_nodes(plan[0]['Plan']) if 'Relation Name' in node or 'Index Name' in node
+            ]
+            ok = f"Seq Scan on {table}" not in scans
+            results.append({'label': label, 'ok': ok, 'scans': scans})
+    conn.rollback()
+    return results
@@ -0,0 +1,49 @@
+-- Base schema used by models/. IF NOT EXISTS keeps this a no-op on
+-- databases that were set up by hand before migrations existed.
+
+CREATE TABLE IF NOT EXISTS districts (
+    id VARCHAR(4) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS wards (
+    id_ward VARCHAR(2) NOT NULL,
+    id_district VARCHAR(4) NOT NULL REFERENCES districts (id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    PRIMARY KEY (id_ward, id_district)
+);
+
+CREATE TABLE IF NOT EXISTS bus_stations (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    long DOUBLE PRECISION NOT NULL,
+    lat DOUBLE PRECISION NOT NULL,
+    address VARCHAR(255),
+    id_ward VARCHAR(6)
+);
+
+CREATE TABLE IF NOT EXISTS bus_lines (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    length NUMERIC(10, 2),
+    price NUMERIC(10, 2),
+    number_of_trips INTEGER,
+    time_between_trips INTEGER,
+    start_time_first TIME
+);
+
+CREATE TABLE IF NOT EXISTS station_line (
+    id_bus_station INTEGER NOT NULL REFERENCES bus_stations (id) ON DELETE CASCADE,
+    id_bus_line INTEGER NOT NULL REFERENCES bus_lines (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    start_time_first TIME,
+    distance NUMERIC(10, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_bus_station, id_bus_line)
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    name VARCHAR(255),
+    password VARCHAR(255) NOT NULL
+);
@@ -0,0 +1,16 @@
+-- Indexes for the predicates the models filter on. Composite lookups
+-- already covered by primary keys:
+--   station_line (id_bus_station, id_bus_line) also serves id_bus_station = %s
+--   wards (id_ward, id_district)
+
+-- get_all_schedules_by_id_bus_line, get_all_bus_stations_by_id_bus_line,
+-- init_graph: WHERE id_bus_line = %s ORDER BY seq, index-only for the
+-- station_line side of the join.
+CREATE INDEX IF NOT EXISTS station_line_id_bus_line_seq_idx
+    ON station_line (id_bus_line, seq) INCLUDE (id_bus_station, distance, start_time_first);
+
+-- get_user_by_email, login; also what makes create_user reject duplicates.
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_idx ON users (email);
+
+-- get_bus_station_by_name
+CREATE INDEX IF NOT EXISTS bus_stations_name_idx ON bus_stations (name);
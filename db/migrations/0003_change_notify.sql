@@ -0,0 +1,57 @@
+-- Publish committed changes on the network_changes channel so every worker
+-- can invalidate what it cached. Trigger arguments name the key columns;
+-- the payload is {"table", "op", "old", "new"} with only those keys.
+CREATE OR REPLACE FUNCTION notify_network_change() RETURNS trigger AS $$
+DECLARE
+    old_keys jsonb;
+    new_keys jsonb;
+    i integer;
+BEGIN
+    IF TG_LEVEL = 'ROW' THEN
+        old_keys := '{}'::jsonb;
+        new_keys := '{}'::jsonb;
+        FOR i IN 0 .. TG_NARGS - 1 LOOP
+            IF TG_OP <> 'INSERT' THEN
+                old_keys := old_keys || jsonb_build_object(TG_ARGV[i], to_jsonb(OLD) -> TG_ARGV[i]);
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                new_keys := new_keys || jsonb_build_object(TG_ARGV[i], to_jsonb(NEW) -> TG_ARGV[i]);
+            END IF;
+        END LOOP;
+        IF TG_OP = 'INSERT' THEN
+            old_keys := NULL;
+        ELSIF TG_OP = 'DELETE' THEN
+            new_keys := NULL;
+        END IF;
+    END IF;
+    PERFORM pg_notify('network_changes', json_build_object(
+        'table', TG_TABLE_NAME, 'op', TG_OP, 'old', old_keys, 'new', new_keys)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bus_stations_notify ON bus_stations;
+CREATE TRIGGER bus_stations_notify AFTER INSERT OR UPDATE OR DELETE ON bus_stations
+    FOR EACH ROW EXECUTE FUNCTION notify_network_change('id');
+
+DROP TRIGGER IF EXISTS bus_lines_notify ON bus_lines;
+CREATE TRIGGER bus_lines_notify AFTER INSERT OR UPDATE OR DELETE ON bus_lines
+    FOR EACH ROW EXECUTE FUNCTION notify_network_change('id');
+
+DROP TRIGGER IF EXISTS station_line_notify ON station_line;
+CREATE TRIGGER station_line_notify AFTER INSERT OR UPDATE OR DELETE ON station_line
+    FOR EACH ROW EXECUTE FUNCTION notify_network_change('id_bus_station', 'id_bus_line');
+
+-- wards and districts get no trigger: no worker caches them, so their
+-- notifications would only wake every listener for nothing.
+
+-- TRUNCATE carries no rows, listeners drop everything they cached.
+DROP TRIGGER IF EXISTS station_line_truncate_notify ON station_line;
+CREATE TRIGGER station_line_truncate_notify AFTER TRUNCATE ON station_line
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_network_change();
+DROP TRIGGER IF EXISTS bus_stations_truncate_notify ON bus_stations;
+CREATE TRIGGER bus_stations_truncate_notify AFTER TRUNCATE ON bus_stations
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_network_change();
+DROP TRIGGER IF EXISTS bus_lines_truncate_notify ON bus_lines;
+CREATE TRIGGER bus_lines_truncate_notify AFTER TRUNCATE ON bus_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_network_change();
@@ -0,0 +1,30 @@
+-- Monotonic version of the routing data, bumped by every statement that
+-- changes bus_stations, bus_lines or station_line. Routing graph snapshots
+-- are keyed to it. The bump takes a row lock, so it only becomes visible
+-- (and concurrent writers only proceed) once the writing transaction ends.
+CREATE TABLE IF NOT EXISTS network_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+INSERT INTO network_version (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_network_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE network_version SET version = version + 1, changed_at = now();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bus_stations_version ON bus_stations;
+CREATE TRIGGER bus_stations_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON bus_stations
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_network_version();
+
+DROP TRIGGER IF EXISTS bus_lines_version ON bus_lines;
+CREATE TRIGGER bus_lines_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON bus_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_network_version();
+
+DROP TRIGGER IF EXISTS station_line_version ON station_line;
+CREATE TRIGGER station_line_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON station_line
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_network_version();
@@ -0,0 +1,5 @@
+-- Publish user changes on network_changes too, so every worker drops its
+-- cached profile. Only the id is sent.
+DROP TRIGGER IF EXISTS users_notify ON users;
+CREATE TRIGGER users_notify AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_network_change('id');
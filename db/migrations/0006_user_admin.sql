@@ -0,0 +1,3 @@
+-- Admins may use the diagnostic endpoints (/debug/profile, ?profile=1).
+-- Granted with `flask --app server users set-admin EMAIL`.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin boolean NOT NULL DEFAULT false;
@@ -0,0 +1,96 @@
+-- Keys of every changed row, read by `flask db sqlite-sync` on depot servers
+-- to copy only what changed since their last run. txid is the writing
+-- transaction: once a transaction is older than every running one
+-- (pg_snapshot_xmin) it can add no more rows, so a sync reads up to that
+-- point and starts from it the next time. A NULL key is a TRUNCATE.
+CREATE TABLE IF NOT EXISTS changelog (
+    id BIGSERIAL PRIMARY KEY,
+    txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    table_name TEXT NOT NULL,
+    key JSONB,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS changelog_txid_idx ON changelog (txid);
+
+-- Newest transaction pruned from the changelog; a sync that stopped at or
+-- before it has missed changes and copies everything again.
+CREATE TABLE IF NOT EXISTS changelog_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    txid xid8 NOT NULL DEFAULT '0'
+);
+
+INSERT INTO changelog_horizon (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
+
+-- Trigger arguments name the key columns, as for notify_network_change.
+-- An update that changes the key logs the old and the new one.
+CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$
+DECLARE
+    old_keys jsonb := '{}'::jsonb;
+    new_keys jsonb := '{}'::jsonb;
+    i integer;
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        INSERT INTO changelog (table_name) VALUES (TG_TABLE_NAME);
+        RETURN NULL;
+    END IF;
+    FOR i IN 0 .. TG_NARGS - 1 LOOP
+        IF TG_OP <> 'INSERT' THEN
+            old_keys := old_keys || jsonb_build_object(TG_ARGV[i], to_jsonb(OLD) -> TG_ARGV[i]);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_keys := new_keys || jsonb_build_object(TG_ARGV[i], to_jsonb(NEW) -> TG_ARGV[i]);
+        END IF;
+    END LOOP;
+    IF TG_OP <> 'INSERT' THEN
+        INSERT INTO changelog (table_name, key) VALUES (TG_TABLE_NAME, old_keys);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND new_keys <> old_keys) THEN
+        INSERT INTO changelog (table_name, key) VALUES (TG_TABLE_NAME, new_keys);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS districts_changelog ON districts;
+CREATE TRIGGER districts_changelog AFTER INSERT OR UPDATE OR DELETE ON districts
+    FOR EACH ROW EXECUTE FUNCTION log_change('id');
+
+DROP TRIGGER IF EXISTS wards_changelog ON wards;
+CREATE TRIGGER wards_changelog AFTER INSERT OR UPDATE OR DELETE ON wards
+    FOR EACH ROW EXECUTE FUNCTION log_change('id_ward', 'id_district');
+
+DROP TRIGGER IF EXISTS bus_stations_changelog ON bus_stations;
+CREATE TRIGGER bus_stations_changelog AFTER INSERT OR UPDATE OR DELETE ON bus_stations
+    FOR EACH ROW EXECUTE FUNCTION log_change('id');
+
+DROP TRIGGER IF EXISTS bus_lines_changelog ON bus_lines;
+CREATE TRIGGER bus_lines_changelog AFTER INSERT OR UPDATE OR DELETE ON bus_lines
+    FOR EACH ROW EXECUTE FUNCTION log_change('id');
+
+DROP TRIGGER IF EXISTS station_line_changelog ON station_line;
+CREATE TRIGGER station_line_changelog AFTER INSERT OR UPDATE OR DELETE ON station_line
+    FOR EACH ROW EXECUTE FUNCTION log_change('id_bus_station', 'id_bus_line');
+
+DROP TRIGGER IF EXISTS users_changelog ON users;
+CREATE TRIGGER users_changelog AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION log_change('id');
+
+DROP TRIGGER IF EXISTS districts_truncate_changelog ON districts;
+CREATE TRIGGER districts_truncate_changelog AFTER TRUNCATE ON districts
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
+DROP TRIGGER IF EXISTS wards_truncate_changelog ON wards;
+CREATE TRIGGER wards_truncate_changelog AFTER TRUNCATE ON wards
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
+DROP TRIGGER IF EXISTS bus_stations_truncate_changelog ON bus_stations;
+CREATE TRIGGER bus_stations_truncate_changelog AFTER TRUNCATE ON bus_stations
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
+DROP TRIGGER IF EXISTS bus_lines_truncate_changelog ON bus_lines;
+CREATE TRIGGER bus_lines_truncate_changelog AFTER TRUNCATE ON bus_lines
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
+DROP TRIGGER IF EXISTS station_line_truncate_changelog ON station_line;
+CREATE TRIGGER station_line_truncate_changelog AFTER TRUNCATE ON station_line
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
+DROP TRIGGER IF EXISTS users_truncate_changelog ON users;
+CREATE TRIGGER users_truncate_changelog AFTER TRUNCATE ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION log_change();
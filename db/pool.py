@@ -0,0 +1,90 @@
+import os
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolExhausted(psycopg2.Error):
+    """Raised when every connection of the pool stays checked out"""
+
+
+class ConnectionPool:
+    """Connections owned by the current process, opened on demand.
+
+    The pool notices when it is used from a forked child and starts over
+    there. Inherited connections are never touched in the child, and the
+    parent closes its idle connections right before forking, so a
+    preloading master never hands a live socket to its workers.
+    """
+
+    def __init__(self, connect, maxconn=10, timeout=30):
+        self.connect = connect
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pid = os.getpid()
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._lock = threading.Lock()
+            self._slots = threading.BoundedSemaphore(self.maxconn)
+
+    def getconn(self):
+        self._check_pid()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhausted(f"No database connection available after {self.timeout}s")
+        try:
+            with self._lock:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if not conn.closed:
+                        return conn
+            return self.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """Return a connection, rolling back whatever it left open"""
+        if self._pid != os.getpid():
+            return
+        try:
+            if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        with self._lock:
+            if not conn.closed:
+                self._idle.append(conn)
+        self._slots.release()
+
+    def close(self):
+        """Close the idle connections of this process"""
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = []
+
+
+def create_pool(connect, maxconn=10, timeout=30):
+    pool = ConnectionPool(connect, maxconn=maxconn, timeout=timeout)
+    _pools.append(pool)
+    return pool
+
+
+def _close_all():
+    for pool in _pools:
+        pool.close()
+
+
+os.register_at_fork(before=_close_all)
@@ -0,0 +1,98 @@
+import re
+import threading
+import time
+import weakref
+
+import psycopg2.extensions
+
+
+class Statement:
+    """Parameterized SQL executed through PREPARE/EXECUTE on each connection"""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        params = iter(range(1, sql.count('%s') + 1))
+        self.prepare_sql = f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f"${next(params)}", sql)
+        placeholders = ', '.join(['%s'] * sql.count('%s'))
+        self.execute_sql = f"EXECUTE {name} ({placeholders});" if placeholders else f"EXECUTE {name};"
+        self.calls = 0
+        self.prepares = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+
+class StatementRegistry:
+    """Prepares registered statements lazily, once per connection session.
+
+    A connection is tracked weakly together with its backend pid, so a
+    reset or replaced connection gets its statements prepared again.
+    Connections that are not psycopg2 connections run the plain SQL.
+
+    A prepared plan is bound to the columns it returned when prepared, so
+    statements name their columns instead of using SELECT *: a migration
+    adding a column would otherwise make live connections fail with
+    "cached plan must not change result type".
+    """
+
+    def __init__(self):
+        self._statements = {}
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def register(self, name, sql):
+        if name in self._statements:
+            raise ValueError(f"Statement {name} is already registered")
+        statement = Statement(name, sql)
+        self._statements[name] = statement
+        return statement
+
+    def execute(self, cursor, statement, params=()):
+        conn = cursor.connection
+        start = time.perf_counter()
+        if isinstance(conn, psycopg2.extensions.connection):
+            self._ensure_prepared(cursor, conn, statement)
+            cursor.execute(statement.execute_sql, params)
+        else:
+            cursor.execute(statement.sql, params)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            statement.calls += 1
+            statement.total_time += elapsed
+            if elapsed > statement.max_time:
+                statement.max_time = elapsed
+
+    def _ensure_prepared(self, cursor, conn, statement):
+        pid = conn.get_backend_pid()
+        session = self._prepared.get(conn)
+        if session is not None and session[0] == pid and statement.name in session[1]:
+            return
+        with self._lock:
+            session = self._prepared.get(conn)
+            if session is None or session[0] != pid:
+                session = self._prepared[conn] = (pid, set())
+            if statement.name not in session[1]:
+                cursor.execute(statement.prepare_sql)
+                session[1].add(statement.name)
+                statement.prepares += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return [self._stats(statement) for statement in self._statements.values()]
+
+    @staticmethod
+    def _stats(statement):
+        return {
+            'name': statement.name,
+            'calls': statement.calls,
+            'prepares': statement.prepares,
+            'total_ms': round(statement.total_time * 1000, 3),
+            'avg_ms': round(statement.total_time * 1000 / statement.calls, 3) if statement.calls else 0,
+            'max_ms': round(statement.max_time * 1000, 3)
+        }
+
+
+registry = StatementRegistry()
+register = registry.register
+execute = registry.execute
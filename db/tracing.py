@@ -0,0 +1,150 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import time
+
+import psycopg2.extensions
+
+from utils.metrics import model_calls, registry
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 100))
+REPEAT_THRESHOLD = int(os.getenv('DB_REPEAT_THRESHOLD', 10))
+
+query_duration = registry.histogram(
+    'db_query_duration_seconds', "Time spent executing queries, by the model method issuing them", ('method',))
+query_rows = registry.counter(
+    'db_query_rows_total', "Rows returned or affected, by the model method issuing the query", ('method',))
+repeated_queries = registry.counter(
+    'db_repeated_queries_total', "Traces that ran one statement DB_REPEAT_THRESHOLD times or more", ('method',))
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\$\d+|%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(query):
+    """SQL with literals and placeholders replaced by ? and value lists collapsed"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    sql = _LISTS.sub('(...)', _LITERALS.sub('?', query))
+    return _SPACE.sub(' ', _ROWS.sub('(...), ...', sql)).strip()
+
+
+class Trace:
+    """Queries run during one request, or any block between begin() and finish()"""
+
+    def __init__(self, name=None):
+        self.name = name
+        self.queries = 0
+        self.seconds = 0.0
+        # normalized sql -> [calls, seconds, rows, model calls of the first run]
+        self.statements = {}
+
+    def add(self, sql, seconds, rows, calls):
+        self.queries += 1
+        self.seconds += seconds
+        entry = self.statements.get(sql)
+        if entry is None:
+            entry = self.statements[sql] = [0, 0.0, 0, calls]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += max(rows, 0)
+
+    def repeated(self, threshold=None):
+        """Statements run at least `threshold` times, the N+1 candidates"""
+        threshold = REPEAT_THRESHOLD if threshold is None else threshold
+        return [{
+            'sql': sql,
+            'calls': calls,
+            'ms': round(seconds * 1000, 3),
+            'rows': rows,
+            'method': ' > '.join(methods) or None
+        } for sql, (calls, seconds, rows, methods) in self.statements.items() if calls >= threshold]
+
+    def server_timing(self, total=None):
+        """Server-Timing header value splitting `total` seconds into db and app time"""
+        timing = f'db;dur={self.seconds * 1000:.1f};desc="{self.queries} queries"'
+        if total is not None:
+            timing += f', app;dur={max(total - self.seconds, 0) * 1000:.1f}'
+        return timing
+
+
+_current = contextvars.ContextVar('db_trace', default=None)
+
+
+def current():
+    return _current.get()
+
+
+def begin(name=None):
+    """Start collecting queries in this context
+
+    Returns:
+        tuple: the Trace and a token for finish()
+    """
+    trace = Trace(name)
+    return trace, _current.set(trace)
+
+
+def finish(trace, token):
+    """Stop collecting and log the statements that ran too often"""
+    _current.reset(token)
+    for statement in trace.repeated():
+        repeated_queries.inc((statement['method'] or 'none',))
+        _log('repeated_query', trace=trace.name, **statement)
+
+
+def _log(event, **fields):
+    logger.warning(json.dumps({'event': event, **fields}, default=str))
+
+
+def record(query, seconds, rows):
+    calls = model_calls.get()
+    labels = (calls[-1] if calls else 'none',)
+    query_duration.observe(labels, seconds)
+    if rows > 0:
+        query_rows.inc(labels, rows)
+    trace = _current.get()
+    if trace is None and seconds * 1000 < SLOW_QUERY_MS:
+        return
+    sql = normalize(query)
+    if trace is not None:
+        trace.add(sql, seconds, rows, calls)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        _log('slow_query', trace=trace.name if trace else None, sql=sql,
+             ms=round(seconds * 1000, 3), rows=rows, method=' > '.join(calls) or None)
+
+
+class TracingCursor(psycopg2.extensions.cursor):
+    """Cursor recording the time and row count of every query it runs"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record(self._text(query), time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record(self._text(query), time.perf_counter() - start, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        start = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record(self._text(sql), time.perf_counter() - start, self.rowcount)
+
+    def _text(self, query):
+        return query if isinstance(query, (str, bytes)) else query.as_string(self)
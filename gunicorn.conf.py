@@ -0,0 +1,15 @@
+import os
+
+# gunicorn -c gunicorn.conf.py; APP_PRELOAD=true loads the routing graph in
+# the master and shares it with the workers copy-on-write.
+wsgi_app = 'server:create_app()'
+bind = f"{os.getenv('APP_HOST', '0.0.0.0')}:{os.getenv('APP_PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+preload_app = os.getenv('APP_PRELOAD', 'false').lower() in ['true', '1']
+
+
+def post_fork(server, worker):
+    if preload_app:
+        import server as app_module
+
+        app_module.start_worker()
@@ -1,6 +1,9 @@
 from .bus_line import BusLine
 from .bus_station import BusStation
 from .district import District
+from .gtfs import GTFS
+from .memory import MemoryStore
+from .network_import import BundleError, NetworkImport, read_bundle
 from .station_line import StationLine
 from .user import User
 from .ward import Ward
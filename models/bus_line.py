@@ -1,6 +1,16 @@
 import psycopg2
 
+from db import statements
+from routing import events
+from utils.json_provider import RawJSON
+from utils.metrics import count_model_error, timed_methods
+from .records import BusLineRecord
 
+BUS_LINE_BY_ID = statements.register(
+    'bus_line_by_id', "SELECT id, name, length, price, number_of_trips, time_between_trips, start_time_first FROM bus_lines WHERE id = %s;")
+
+
+@timed_methods
 class BusLine:
     def __init__(self, conn):
         self.conn = conn
@@ -10,37 +20,49 @@ class BusLine:
             with self.conn.cursor() as cursor:
                 cursor.execute("SELECT * FROM bus_lines ORDER BY id;")
                 bus_lines = cursor.fetchall()
-            return [{
-                'id': bus_line[0],
-                'name': bus_line[1],
-                'length': bus_line[2],
-                'price': bus_line[3],
-                'number_of_trips': bus_line[4],
-                'time_between_trips': bus_line[5],
-                'start_time_first': bus_line[6]
-            } for bus_line in bus_lines]
+            return [BusLineRecord(*bus_line[:7]) for bus_line in bus_lines]
+        except psycopg2.Error as e:
+            count_model_error()
+            print(f"Error fetching all bus lines: {e}")
+            return None
+
+    def get_all_bus_lines_json(self):
+        """Same rows as get_all_bus_lines, aggregated into a JSON array by Postgres"""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT coalesce(json_agg(bl ORDER BY bl.id), '[]')::text
+                    FROM (SELECT id, name, length::text, price::text, number_of_trips, time_between_trips, start_time_first FROM bus_lines) AS bl;
+                """)
+                bus_lines = cursor.fetchone()[0]
+            return RawJSON(bus_lines)
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all bus lines: {e}")
             return None
 
+    def iter_bus_line_batches(self, batch_size=10000):
+        """Yield all bus lines as batches of tuples from a server-side cursor"""
+        with self.conn.cursor(name='bus_line_batches') as cursor:
+            cursor.execute(
+                "SELECT id, name, length::float8, price::float8, number_of_trips, time_between_trips, start_time_first FROM bus_lines ORDER BY id;")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
     def get_bus_line_by_id(self, bus_line_id):
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT * FROM bus_lines WHERE id = %s;", (bus_line_id,))
+                statements.execute(
+                    cursor, BUS_LINE_BY_ID, (bus_line_id,))
                 bus_line = cursor.fetchone()
                 if not bus_line:
                     return None
-            return {
-                'id': bus_line[0],
-                'name': bus_line[1],
-                'length': bus_line[2],
-                'price': bus_line[3],
-                'number_of_trips': bus_line[4],
-                'time_between_trips': bus_line[5],
-                'start_time_first': bus_line[6]
-            }
+            return BusLineRecord(*bus_line[:7])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching bus line with id {bus_line_id}: {e}")
             return None
 
@@ -52,16 +74,9 @@ class BusLine:
                 bus_line = cursor.fetchone()
                 if not bus_line:
                     return None
-            return {
-                'id': bus_line[0],
-                'name': bus_line[1],
-                'length': bus_line[2],
-                'price': bus_line[3],
-                'number_of_trips': bus_line[4],
-                'time_between_trips': bus_line[5],
-                'start_time_first': bus_line[6]
-            }
+            return BusLineRecord(*bus_line[:7])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error searching bus station by name {name}: {e}")
             return None
 
@@ -77,6 +92,7 @@ class BusLine:
                 self.conn.commit()
             return {'id': new_bus_line_id}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating bus station: {e}")
             return None
 
@@ -89,6 +105,7 @@ class BusLine:
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error updating bus line with id {bus_line_id}: {e}")
             return False
 
@@ -98,7 +115,9 @@ class BusLine:
                 cursor.execute(
                     "DELETE FROM bus_lines WHERE id = %s;", (bus_line_id,))
                 self.conn.commit()
-                return True
+            events.emit(events.LineRemoved(int(bus_line_id)), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error deleting bus line with id {bus_line_id}: {e}")
             return False
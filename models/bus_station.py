@@ -1,6 +1,17 @@
 import psycopg2
 
+from db import statements
+from routing import events
+from utils.json_provider import RawJSON
+from utils.metrics import count_model_error, timed_methods
+from .records import BusStationRecord
 
+BUS_STATION_BY_ID = statements.register(
+    'bus_station_by_id', "SELECT id, name, long, lat, address, id_ward FROM bus_stations WHERE id = %s;")
+BUS_STATION_BY_NAME = "SELECT * FROM bus_stations WHERE name = %s;"
+
+
+@timed_methods
 class BusStation:
     def __init__(self, conn):
         self.conn = conn
@@ -10,28 +21,49 @@ class BusStation:
             with self.conn.cursor() as cursor:
                 cursor.execute("SELECT * FROM bus_stations;")
                 bus_stations = cursor.fetchall()
-            return [{
-                'id': bus_station[0],
-                'name': bus_station[1],
-                'long': bus_station[2],
-                'lat': bus_station[3],
-                'address': bus_station[4],
-                'id_ward': bus_station[5]
-            } for bus_station in bus_stations]
+            return [BusStationRecord(*bus_station[:6]) for bus_station in bus_stations]
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all bus stations: {e}")
             return None
 
+    def get_all_bus_stations_json(self):
+        """Same rows as get_all_bus_stations, aggregated into a JSON array by Postgres"""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT coalesce(json_agg(bs), '[]')::text
+                    FROM (SELECT id, name, long, lat, address, id_ward FROM bus_stations) AS bs;
+                """)
+                bus_stations = cursor.fetchone()[0]
+            return RawJSON(bus_stations)
+        except psycopg2.Error as e:
+            count_model_error()
+            print(f"Error fetching all bus stations: {e}")
+            return None
+
+    def iter_bus_station_batches(self, batch_size=10000):
+        """Yield all bus stations as batches of tuples from a server-side cursor"""
+        with self.conn.cursor(name='bus_station_batches') as cursor:
+            cursor.execute(
+                "SELECT id, name, long::float8, lat::float8, address, id_ward FROM bus_stations ORDER BY id;")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
     def get_bus_station_by_id(self, bus_station_id):
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT * FROM bus_stations WHERE id = %s;", (bus_station_id,))
+                statements.execute(
+                    cursor, BUS_STATION_BY_ID, (bus_station_id,))
                 bus_station = cursor.fetchone()
                 if not bus_station:
                     return None
-            return {'id': bus_station[0], 'name': bus_station[1], 'long': bus_station[2], 'lat': bus_station[3], 'address': bus_station[4], 'id_ward': bus_station[5]}
+            return BusStationRecord(*bus_station[:6])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching bus station with id {bus_station_id}: {e}")
             return None
 
@@ -39,12 +71,13 @@ class BusStation:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM bus_stations WHERE name = %s;", (name,))
+                    BUS_STATION_BY_NAME, (name,))
                 bus_station = cursor.fetchone()
                 if not bus_station:
                     return None
-            return {'id': bus_station[0], 'name': bus_station[1], 'long': bus_station[2], 'lat': bus_station[3], 'address': bus_station[4], 'id_ward': bus_station[5]}
+            return BusStationRecord(*bus_station[:6])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error searching bus station by name {name}: {e}")
             return None
 
@@ -60,6 +93,7 @@ class BusStation:
                 self.conn.commit()
             return {'id': new_bus_station_id}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating bus station: {e}")
             return None
 
@@ -70,8 +104,11 @@ class BusStation:
                     UPDATE bus_stations SET name = %s, long = %s, lat = %s, address = %s, id_ward = %s WHERE id = %s;
                 """, (name, long, lat, address, id_ward, bus_station_id))
                 self.conn.commit()
-                return True
+            events.emit(events.StationMoved(
+                int(bus_station_id), float(lat), float(long), name), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error updating bus station with id {bus_station_id}: {e}")
             return False
 
@@ -81,7 +118,9 @@ class BusStation:
                 cursor.execute(
                     "DELETE FROM bus_stations WHERE id = %s;", (bus_station_id,))
                 self.conn.commit()
-                return True
+            events.emit(events.StationRemoved(int(bus_station_id)), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error deleting bus station with id {bus_station_id}: {e}")
             return False
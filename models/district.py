@@ -1,6 +1,12 @@
 import psycopg2
 
+from utils.metrics import count_model_error, timed_methods
+from .records import DistrictRecord
 
+DISTRICT_BY_ID = "SELECT * FROM districts WHERE id = %s;"
+
+
+@timed_methods
 class District:
     def __init__(self, conn):
         self.conn = conn
@@ -10,11 +16,9 @@ class District:
             with self.conn.cursor() as cursor:
                 cursor.execute("SELECT * FROM districts;")
                 districts = cursor.fetchall()
-            return [{
-                'id': district[0],
-                'name': district[1]
-            } for district in districts]
+            return [DistrictRecord(*district[:2]) for district in districts]
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all districts: {e}")
             return None
 
@@ -22,15 +26,13 @@ class District:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM districts WHERE id = %s;", (district_id,))
+                    DISTRICT_BY_ID, (district_id,))
                 district = cursor.fetchone()
                 if not district:
                     return None
-            return {
-                'id': district[0],
-                'name': district[1]
-            }
+            return DistrictRecord(*district[:2])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching district with id {district_id}: {e}")
             return None
 
@@ -42,11 +44,9 @@ class District:
                 district = cursor.fetchone()
                 if not district:
                     return None
-            return {
-                'id': district[0],
-                'name': district[1]
-            }
+            return DistrictRecord(*district[:2])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error searching district by name {name}: {e}")
             return None
 
@@ -62,6 +62,7 @@ class District:
                 self.conn.commit()
             return {'id': new_district_id}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating district: {e}")
             return None
 
@@ -74,6 +75,7 @@ class District:
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error updating district with id {district_id}: {e}")
             return False
 
@@ -85,5 +87,6 @@ class District:
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error deleting district with id {district_id}: {e}")
             return False
@@ -0,0 +1,347 @@
+"""SQLite copy of the central database for depot servers (STORAGE_BACKEND=sqlite).
+
+`flask db sqlite-sync PATH` copies the tables of memory.TABLES into a
+SQLite file. After the first run it only fetches the rows named in the
+central changelog (migration 0007) since the previous run, so a depot on a
+slow or intermittent link keeps up cheaply and keeps serving its last copy
+while offline. Each sync also records the keys it wrote in local_changes,
+and trims the entries of the sync before the previous one.
+
+Workers read the file into a MemoryStore at startup and answer from the
+memory models; a Follower thread applies local_changes to that store after
+every sync.
+"""
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+
+from decimal import Decimal
+
+from routing import events
+from . import memory
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS districts (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wards (
+    id_ward TEXT NOT NULL,
+    id_district TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (id_ward, id_district)
+);
+CREATE TABLE IF NOT EXISTS bus_stations (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    long REAL NOT NULL,
+    lat REAL NOT NULL,
+    address TEXT,
+    id_ward TEXT
+);
+CREATE TABLE IF NOT EXISTS bus_lines (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    length TEXT,
+    price TEXT,
+    number_of_trips INTEGER,
+    time_between_trips INTEGER,
+    start_time_first TEXT
+);
+CREATE TABLE IF NOT EXISTS station_line (
+    id_bus_station INTEGER NOT NULL,
+    id_bus_line INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    start_time_first TEXT,
+    distance TEXT NOT NULL,
+    PRIMARY KEY (id_bus_station, id_bus_line)
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    email TEXT NOT NULL,
+    name TEXT,
+    password TEXT NOT NULL,
+    is_admin INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS local_changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    key TEXT
+);
+"""
+
+# table -> primary key columns
+KEYS = {
+    'districts': ('id',),
+    'wards': ('id_ward', 'id_district'),
+    'bus_stations': ('id',),
+    'bus_lines': ('id',),
+    'station_line': ('id_bus_station', 'id_bus_line'),
+    'users': ('id',),
+}
+
+NETWORK_TABLES = {'bus_stations', 'bus_lines', 'station_line'}
+
+
+def connect(path):
+    """Open the SQLite file, creating its tables on first use"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _value(value):
+    """Column value as stored in SQLite: exact decimals and times as text"""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+def _insert(lite, table, rows):
+    columns = memory.TABLES[table]
+    lite.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});",
+        [tuple(_value(value) for value in row) for row in rows])
+
+
+def _copy_table(cursor, lite, table):
+    cursor.execute(f"SELECT {', '.join(memory.TABLES[table])} FROM {table};")
+    rows = cursor.fetchall()
+    lite.execute(f"DELETE FROM {table};")
+    _insert(lite, table, rows)
+    return len(rows)
+
+
+def _copy_keys(cursor, lite, table, keys):
+    """Refresh the rows of the given keys, deleting those gone from Postgres"""
+    key_columns = KEYS[table]
+    wanted = {tuple(key[column] for column in key_columns) for key in keys}
+    cursor.execute(f"SELECT {', '.join(memory.TABLES[table])} FROM {table} WHERE ({', '.join(key_columns)}) IN %s;",
+                   (tuple(wanted),))
+    rows = cursor.fetchall()
+    positions = [memory.TABLES[table].index(column) for column in key_columns]
+    present = {tuple(row[i] for i in positions) for row in rows}
+    _insert(lite, table, rows)
+    where = ' AND '.join(f"{column} = ?" for column in key_columns)
+    lite.executemany(f"DELETE FROM {table} WHERE {where};",
+                     [tuple(_value(value) for value in key) for key in wanted - present])
+    lite.executemany("INSERT INTO local_changes (table_name, key) VALUES (?, ?);",
+                     [(table, json.dumps(dict(zip(key_columns, key)))) for key in wanted])
+    return len(rows), len(wanted - present)
+
+
+def sync(conn, path, users=False, full=False):
+    """Bring the SQLite file at path up to date with Postgres
+
+    Reads in one repeatable read transaction the changelog entries of every
+    transaction that finished since the last sync, and the current rows of
+    the keys they name. Falls back to a full copy on the first run, when
+    --users changed or when the changelog was pruned past the last sync.
+
+    Returns:
+        dict: mode (full or incremental), rows copied and deleted, changelog position
+    """
+    tables = [table for table in memory.TABLES if users or table != 'users']
+    lite = connect(path)
+    try:
+        state = dict(lite.execute("SELECT key, value FROM sync_state;"))
+        conn.rollback()
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT pg_snapshot_xmin(pg_current_snapshot())::text,
+                           (SELECT txid::text FROM changelog_horizon),
+                           (SELECT version FROM network_version);
+                """)
+                until, pruned, version = cursor.fetchone()
+                since = state.get('since')
+                full = (full or since is None or state.get('users') != str(users)
+                        or int(pruned or 0) >= int(since))
+                copied = deleted = 0
+                with lite:
+                    # followers get one sync interval to apply a sync's changes, then
+                    # they are trimmed; a follower still behind them reloads the file
+                    trim = state.pop('trim_next', None)
+                    if trim is not None:
+                        lite.execute("DELETE FROM local_changes WHERE id <= ?;", (int(trim),))
+                        state['trimmed'] = trim
+                    state['trim_next'] = str(lite.execute("SELECT coalesce(max(id), 0) FROM local_changes;").fetchone()[0])
+                    if full:
+                        for table in memory.TABLES:
+                            if table in tables:
+                                copied += _copy_table(cursor, lite, table)
+                            else:
+                                lite.execute(f"DELETE FROM {table};")
+                        lite.execute("DELETE FROM local_changes;")
+                        state['generation'] = str(int(state.get('generation', 0)) + 1)
+                    else:
+                        cursor.execute("""
+                            SELECT table_name, key FROM changelog
+                            WHERE txid >= %s::xid8 AND txid < %s::xid8 AND table_name = ANY(%s)
+                            GROUP BY table_name, key;
+                        """, (since, until, tables))
+                        changes = {}
+                        for table, key in cursor.fetchall():
+                            changes.setdefault(table, []).append(key)
+                        for table, keys in changes.items():
+                            if None in keys:
+                                copied += _copy_table(cursor, lite, table)
+                                lite.execute("INSERT INTO local_changes (table_name, key) VALUES (?, NULL);", (table,))
+                                continue
+                            rows, gone = _copy_keys(cursor, lite, table, keys)
+                            copied, deleted = copied + rows, deleted + gone
+                    state.update(since=until, users=str(users), network_version=str(version))
+                    lite.executemany("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?);", state.items())
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly=False)
+    finally:
+        lite.close()
+    return {'mode': 'full' if full else 'incremental', 'copied': copied, 'deleted': deleted, 'since': until}
+
+
+def prune(conn, days):
+    """Drop changelog entries older than `days`
+
+    Returns:
+        int: number of entries removed
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            WITH pruned AS (
+                DELETE FROM changelog WHERE changed_at < now() - make_interval(days => %s) RETURNING txid
+            )
+            UPDATE changelog_horizon SET txid = greatest(txid, (SELECT max(txid) FROM pruned))
+            RETURNING (SELECT count(*) FROM pruned);
+        """, (days,))
+        removed = cursor.fetchone()[0]
+    conn.commit()
+    return removed
+
+
+def _version(state):
+    version = state.get('network_version')
+    return int(version) if version and version != 'None' else None
+
+
+def _rows(lite, table, where='', params=()):
+    columns = memory.TABLES[table]
+    cursor = lite.execute(f"SELECT {', '.join(columns)} FROM {table} {where};", params)
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class Follower:
+    """Keeps this process' MemoryStore in step with the SQLite file.
+
+    `load` reads the whole file; the daemon thread then polls local_changes
+    every `interval` seconds, reloads the rows named there and emits
+    NetworkChanged (or UserChanged) so cached graphs and profiles follow.
+    A full sync starts a new generation, which is reloaded from scratch, as
+    is the file when the changes since the last poll were already trimmed.
+    """
+
+    def __init__(self, path=None, interval=2):
+        self.path = path
+        self.interval = interval
+        self.generation = None
+        self.position = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Read the SQLite file into a new store and install it"""
+        lite = connect(self.path)
+        try:
+            state = dict(lite.execute("SELECT key, value FROM sync_state;"))
+            store = memory.MemoryStore({table: _rows(lite, table) for table in memory.TABLES})
+            store.network_version = _version(state)
+            self.position = max(lite.execute("SELECT coalesce(max(id), 0) FROM local_changes;").fetchone()[0],
+                                int(state.get('trimmed', 0)))
+            self.generation = state.get('generation')
+        finally:
+            lite.close()
+        return memory.use(store)
+
+    def start(self):
+        if self.generation is None:
+            self.load()
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name='sqlite-follower', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def poll(self, lite):
+        """Apply the changes of syncs made since the last poll
+
+        Returns:
+            int: number of changed keys applied
+        """
+        state = dict(lite.execute("SELECT key, value FROM sync_state;"))
+        if state.get('generation') != self.generation or self.position < int(state.get('trimmed', 0)):
+            self.load()
+            events.emit(events.NetworkChanged())
+            return 1
+        changes = lite.execute(
+            "SELECT id, table_name, key FROM local_changes WHERE id > ? ORDER BY id;", (self.position,)).fetchall()
+        if not changes:
+            return 0
+        store = memory.get_store()
+        network = False
+        for _, table, key in changes:
+            network = network or table in NETWORK_TABLES
+            if key is None:
+                rows = _rows(lite, table)
+                with store.lock:
+                    for existing in list(getattr(store, table).rows):
+                        getattr(store, table).remove(existing)
+                    store.load_dict({table: rows})
+                continue
+            key = json.loads(key)
+            rows = _rows(lite, table, 'WHERE ' + ' AND '.join(f"{column} = ?" for column in key), tuple(key.values()))
+            values = tuple(key[column] for column in KEYS[table])
+            with store.lock:
+                getattr(store, table).remove(values[0] if len(values) == 1 else values)
+                store.load_dict({table: rows})
+            if table == 'users':
+                events.emit(events.UserChanged(int(key['id'])))
+        # only once every change applied, a failed poll is retried whole
+        self.position = changes[-1][0]
+        store.network_version = _version(state)
+        if network:
+            events.emit(events.NetworkChanged())
+        return len(changes)
+
+    def _run(self):
+        lite = None
+        while not self._stop.wait(self.interval):
+            try:
+                lite = lite or connect(self.path)
+                self.poll(lite)
+            except sqlite3.Error as e:
+                logger.warning("Error following %s: %s", self.path, e)
+                if lite is not None:
+                    lite.close()
+                lite = None
+            except Exception:
+                # keep following, the failed changes are retried next time
+                logger.exception("Error applying changes from %s", self.path)
+
+
+follower = Follower()
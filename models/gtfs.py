@@ -0,0 +1,247 @@
+import csv
+import io
+import zipfile
+
+import psycopg2
+import psycopg2.extensions
+
+from utils.metrics import timed_methods
+from .network_import import BundleError, NetworkImport
+
+FEED_FILES = ('stops.txt', 'routes.txt', 'trips.txt', 'stop_times.txt')
+OPTIONAL_FEED_FILES = ('frequencies.txt',)
+BATCH_SIZE = 10000
+
+# GTFS times are HH:MM:SS and may run past 24:00:00
+_SECONDS = "(split_part({0}, ':', 1)::int * 3600 + split_part({0}, ':', 2)::int * 60 + split_part({0}, ':', 3)::int)"
+_TIME = "make_interval(secs => mod({0}, 86400))::time"
+
+_HAVERSINE_KM = """
+    2 * 6371 * asin(sqrt(
+        power(sin(radians({lat2} - {lat1}) / 2), 2)
+        + cos(radians({lat1})) * cos(radians({lat2})) * power(sin(radians({lon2} - {lon1}) / 2), 2)))"""
+
+STAGE_SQL = [
+    # Feed ids -> integer ids. A feed replacing the network keeps numeric ids and
+    # is numbered from 1 otherwise. A merged feed is always numbered after the
+    # existing rows, so its ids never overwrite stations or lines it doesn't own.
+    """
+    CREATE TEMP TABLE gtfs_stop_ids ON COMMIT DROP AS
+    SELECT stop_id, CASE WHEN %(replace)s AND bool_and(stop_id ~ '^[0-9]+$') OVER () THEN stop_id::int
+        ELSE (SELECT CASE WHEN %(replace)s THEN 0 ELSE coalesce(max(id), 0) END FROM bus_stations)
+            + row_number() OVER (ORDER BY stop_id)::int END AS id
+    FROM gtfs_stops;
+    """,
+    """
+    CREATE TEMP TABLE gtfs_route_ids ON COMMIT DROP AS
+    SELECT route_id, CASE WHEN %(replace)s AND bool_and(route_id ~ '^[0-9]+$') OVER () THEN route_id::int
+        ELSE (SELECT CASE WHEN %(replace)s THEN 0 ELSE coalesce(max(id), 0) END FROM bus_lines)
+            + row_number() OVER (ORDER BY route_id)::int END AS id
+    FROM gtfs_routes;
+    """,
+    # One row per trip: route, first departure and the ordered stop pattern
+    f"""
+    CREATE TEMP TABLE gtfs_trip_starts ON COMMIT DROP AS
+    SELECT st.trip_id, t.route_id,
+        min({_SECONDS.format("coalesce(nullif(st.departure_time, ''), st.arrival_time)")}) AS start_secs,
+        string_agg(st.stop_id, ',' ORDER BY st.stop_sequence::int) AS pattern
+    FROM gtfs_stop_times st JOIN gtfs_trips t ON t.trip_id = st.trip_id
+    WHERE coalesce(nullif(st.departure_time, ''), st.arrival_time) <> ''
+    GROUP BY st.trip_id, t.route_id;
+    """,
+    # Collapse every route to its most frequent stop pattern; the earliest trip
+    # of that pattern becomes the template for station_line
+    """
+    CREATE TEMP TABLE gtfs_patterns ON COMMIT DROP AS
+    SELECT DISTINCT ON (route_id) route_id, trips, first_trip_id, first_start, last_start
+    FROM (
+        SELECT route_id, pattern, count(*) AS trips, (array_agg(trip_id ORDER BY start_secs))[1] AS first_trip_id,
+            min(start_secs) AS first_start, max(start_secs) AS last_start
+        FROM gtfs_trip_starts GROUP BY route_id, pattern
+    ) p
+    ORDER BY route_id, trips DESC, first_start;
+    """,
+    f"""
+    INSERT INTO import_bus_stations (id, name, long, lat, address)
+    SELECT ids.id, s.stop_name, s.stop_lon::float8, s.stop_lat::float8, nullif(s.stop_desc, '')
+    FROM gtfs_stops s JOIN gtfs_stop_ids ids ON ids.stop_id = s.stop_id
+    WHERE coalesce(s.location_type, '') IN ('', '0');
+    """,
+    f"""
+    INSERT INTO import_bus_lines (id, name, number_of_trips, time_between_trips, start_time_first)
+    SELECT ids.id, coalesce(nullif(r.route_short_name, ''), r.route_long_name),
+        coalesce(f.trips, p.trips),
+        coalesce(f.headway_secs / 60, CASE WHEN p.trips > 1 THEN round((p.last_start - p.first_start) / 60.0 / (p.trips - 1)) END),
+        {_TIME.format("coalesce(f.start_secs, p.first_start)")}
+    FROM gtfs_routes r
+    JOIN gtfs_route_ids ids ON ids.route_id = r.route_id
+    JOIN gtfs_patterns p ON p.route_id = r.route_id
+    LEFT JOIN (
+        SELECT trip_id, min({_SECONDS.format('start_time')}) AS start_secs, min(headway_secs::int) AS headway_secs,
+            sum(({_SECONDS.format('end_time')} - {_SECONDS.format('start_time')}) / headway_secs::int) AS trips
+        FROM gtfs_frequencies GROUP BY trip_id
+    ) f ON f.trip_id = p.first_trip_id;
+    """,
+    f"""
+    INSERT INTO import_station_line (id_bus_station, id_bus_line, seq, start_time_first, distance)
+    SELECT stop_ids.id, route_ids.id, row_number() OVER (PARTITION BY p.route_id ORDER BY st.stop_sequence::int),
+        {_TIME.format(_SECONDS.format("coalesce(nullif(st.departure_time, ''), nullif(st.arrival_time, ''), '0:0:0')"))},
+        round(coalesce(
+            lead(nullif(st.shape_dist_traveled, '')::numeric) OVER w - nullif(st.shape_dist_traveled, '')::numeric,
+            ({_HAVERSINE_KM.format(lat1='s.stop_lat::float8', lon1='s.stop_lon::float8',
+                                   lat2='lead(s.stop_lat::float8) OVER w', lon2='lead(s.stop_lon::float8) OVER w')})::numeric,
+            0), 2)
+    FROM gtfs_patterns p
+    JOIN gtfs_stop_times st ON st.trip_id = p.first_trip_id
+    JOIN gtfs_stops s ON s.stop_id = st.stop_id
+    JOIN gtfs_stop_ids stop_ids ON stop_ids.stop_id = st.stop_id
+    JOIN gtfs_route_ids route_ids ON route_ids.route_id = p.route_id
+    WINDOW w AS (PARTITION BY p.route_id ORDER BY st.stop_sequence::int);
+    """,
+]
+
+# Optional columns every staged GTFS table needs, so STAGE_SQL can refer to them
+STAGE_COLUMNS = {
+    'stops.txt': ('stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'stop_desc', 'location_type'),
+    'routes.txt': ('route_id', 'route_short_name', 'route_long_name'),
+    'trips.txt': ('trip_id', 'route_id'),
+    'stop_times.txt': ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'shape_dist_traveled'),
+    'frequencies.txt': ('trip_id', 'start_time', 'end_time', 'headway_secs'),
+}
+
+
+def _gtfs_time(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+@timed_methods
+class GTFS(NetworkImport):
+    """GTFS feed import/export.
+
+    bus_stations map to stops, bus_lines to routes with a headway
+    (time_between_trips, in minutes) and station_line to the stop_times of
+    one template trip. Import collapses the trips of a route into that shape,
+    export either writes one trip per line plus frequencies.txt or expands
+    every trip. Both directions stream: feeds are COPYed from the zip into
+    temporary tables and exports are written from server-side cursors.
+    """
+
+    def import_feed(self, source, replace=False):
+        """Import a GTFS zip (path or binary file object)
+
+        With replace=True numeric stop and route ids become the station and
+        line ids. Merged feeds get new ids after the existing ones, so
+        merging a feed twice adds its stations and lines twice.
+
+        Returns:
+            dict: number of imported rows per table
+        """
+        if not zipfile.is_zipfile(source):
+            raise BundleError(["GTFS feed must be a zip file"])
+        with zipfile.ZipFile(source) as feed:
+            return self.import_bundle(feed, replace=replace)
+
+    def _stage_bundle(self, cursor, feed, replace):
+        names = {name.rsplit('/', 1)[-1]: name for name in feed.namelist()}
+        missing = [name for name in FEED_FILES if name not in names]
+        if missing:
+            raise BundleError([f"GTFS feed is missing {', '.join(missing)}"])
+        for name in FEED_FILES + OPTIONAL_FEED_FILES:
+            table = 'gtfs_' + name[:-4]
+            with feed.open(names[name]) if name in names else io.BytesIO(b'') as raw:
+                stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+                header = [column.strip() for column in next(csv.reader([stream.readline()]), [])]
+                columns = list(dict.fromkeys(header + list(STAGE_COLUMNS[name])))
+                columns = [psycopg2.extensions.quote_ident(column, cursor) for column in columns]
+                cursor.execute(
+                    f"CREATE TEMP TABLE {table} ({', '.join(f'{column} TEXT' for column in columns)}) ON COMMIT DROP;")
+                if header:
+                    cursor.copy_expert(
+                        f"COPY {table} ({', '.join(columns[:len(header)])}) FROM STDIN WITH (FORMAT csv)", stream)
+        for query in STAGE_SQL:
+            cursor.execute(query, {'replace': replace})
+
+    def export_feed(self, fileobj, expand=False):
+        """Write the network as a GTFS zip
+
+        Args:
+            fileobj: writable binary file object (seekable or not)
+            expand (bool): one trip per departure instead of frequencies.txt
+        """
+        try:
+            with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as feed:
+                self._write(feed, 'agency.txt', ('agency_id', 'agency_name', 'agency_url', 'agency_timezone'),
+                            [[('1', 'Bus network', 'http://localhost', 'Asia/Ho_Chi_Minh')]])
+                self._write(feed, 'calendar.txt', ('service_id', 'monday', 'tuesday', 'wednesday', 'thursday',
+                                                   'friday', 'saturday', 'sunday', 'start_date', 'end_date'),
+                            [[('daily', 1, 1, 1, 1, 1, 1, 1, '20000101', '20991231')]])
+                self._write(feed, 'stops.txt', ('stop_id', 'stop_name', 'stop_lat', 'stop_lon', 'stop_desc'), self._batches(
+                    "SELECT id, name, lat, long, address FROM bus_stations ORDER BY id;"))
+                self._write(feed, 'routes.txt', ('route_id', 'agency_id', 'route_short_name', 'route_type'), self._batches(
+                    "SELECT id, 1, name, 3 FROM bus_lines ORDER BY id;"))
+                if expand:
+                    self._write_expanded(feed)
+                else:
+                    self._write_collapsed(feed)
+        except psycopg2.Error as e:
+            print(f"Error exporting GTFS feed: {e}")
+            raise
+
+    def _write_collapsed(self, feed):
+        self._write(feed, 'trips.txt', ('route_id', 'service_id', 'trip_id'), self._batches(
+            "SELECT id, 'daily', id FROM bus_lines ORDER BY id;"))
+        self._write(feed, 'frequencies.txt', ('trip_id', 'start_time', 'end_time', 'headway_secs', 'exact_times'), (
+            [(id_bus_line, _gtfs_time(start), _gtfs_time(start + trips * headway), headway, 1)
+             for id_bus_line, start, trips, headway in rows]
+            for rows in self._batches("""
+                SELECT id, extract(epoch FROM start_time_first)::int, number_of_trips, time_between_trips * 60
+                FROM bus_lines
+                WHERE start_time_first IS NOT NULL AND number_of_trips > 0 AND time_between_trips > 0
+                ORDER BY id;
+            """)))
+        self._write_stop_times(feed, "SELECT id AS id_bus_line, 0 AS trip, id::text AS trip_id, 0 AS offset_secs FROM bus_lines")
+
+    def _write_expanded(self, feed):
+        trips = """
+            SELECT id AS id_bus_line, trip, id || '_' || trip AS trip_id, trip * coalesce(time_between_trips, 0) * 60 AS offset_secs
+            FROM bus_lines, generate_series(0, greatest(coalesce(number_of_trips, 1), 1) - 1) AS trip
+        """
+        self._write(feed, 'trips.txt', ('route_id', 'service_id', 'trip_id'), self._batches(
+            f"SELECT id_bus_line, 'daily', trip_id FROM ({trips}) trips ORDER BY id_bus_line, trip;"))
+        self._write_stop_times(feed, trips)
+
+    def _write_stop_times(self, feed, trips):
+        query = f"""
+            SELECT trips.trip_id,
+                extract(epoch FROM coalesce(stl.start_time_first, bl.start_time_first, time '00:00'))::int + trips.offset_secs,
+                stl.id_bus_station, stl.seq,
+                coalesce(sum(stl.distance) OVER (PARTITION BY trips.trip_id ORDER BY stl.seq
+                    ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0)
+            FROM ({trips}) trips
+            JOIN bus_lines bl ON bl.id = trips.id_bus_line
+            JOIN station_line stl ON stl.id_bus_line = trips.id_bus_line
+            ORDER BY trips.id_bus_line, trips.trip, stl.seq;
+        """
+        self._write(feed, 'stop_times.txt',
+                    ('trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'shape_dist_traveled'), (
+                        [(trip_id, _gtfs_time(secs), _gtfs_time(secs), stop_id, seq, dist)
+                         for trip_id, secs, stop_id, seq, dist in rows]
+                        for rows in self._batches(query)))
+
+    def _batches(self, query):
+        with self.conn.cursor(name='gtfs_export') as cursor:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+
+    @staticmethod
+    def _write(feed, name, header, batches):
+        with feed.open(name, 'w', force_zip64=True) as raw, io.TextIOWrapper(raw, encoding='utf-8', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(header)
+            for rows in batches:
+                writer.writerows(rows)
@@ -0,0 +1,590 @@
+"""In-memory backend of the models, for tests and read-only edge nodes.
+
+Each Memory* class subclasses its Postgres model and overrides the methods
+that query the database, so routing, login and profile caching are shared.
+They answer from a MemoryStore: one dict per table keyed by primary key,
+plus the secondary indexes the model queries look rows up by. A store is
+loaded from a snapshot written by `flask db memory-snapshot` (JSON,
+gzipped when the name ends in .gz) or from any dict in that layout, such
+as a network bundle from benchmarks.network.
+
+Writes go to the store only and emit the same change events as the
+Postgres models; they are lost when the process exits.
+"""
+import datetime
+import gzip
+import json
+import os
+import tempfile
+import threading
+
+from decimal import Decimal
+
+from flask_jwt_extended import create_access_token
+from routing import events
+from utils.metrics import timed_methods
+from utils.passwords import HashPoolBusy
+from .bus_line import BusLine
+from .bus_station import BusStation
+from .district import District
+from .records import BusLineRecord, BusStationRecord, DistrictRecord, ScheduleRecord, StationLineRecord, WardRecord
+from .station_line import StationLine
+from .user import User, hasher
+from .ward import Ward
+
+SNAPSHOT_FORMAT = 'busline-memory'
+SNAPSHOT_VERSION = 1
+
+# table -> columns, in the order of the Postgres tables
+TABLES = {
+    'districts': ('id', 'name'),
+    'wards': ('id_ward', 'id_district', 'name'),
+    'bus_stations': ('id', 'name', 'long', 'lat', 'address', 'id_ward'),
+    'bus_lines': ('id', 'name', 'length', 'price', 'number_of_trips', 'time_between_trips', 'start_time_first'),
+    'station_line': ('id_bus_station', 'id_bus_line', 'seq', 'start_time_first', 'distance'),
+    'users': ('id', 'email', 'name', 'password', 'is_admin'),
+}
+
+
+def _int(value):
+    """Integer key of a path parameter, None when it is not one"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decimal(value):
+    return None if value is None else Decimal(str(value))
+
+
+def _time(value):
+    if value is None or isinstance(value, datetime.time):
+        return value
+    return datetime.time.fromisoformat(str(value))
+
+
+def _json_default(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, datetime.time):
+        return o.isoformat()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class Table:
+    """Rows by primary key, with secondary indexes of key sets"""
+
+    def __init__(self, lock, key, **indexes):
+        self.lock = lock
+        self.key = key
+        self.indexes = {name: (getter, {}) for name, getter in indexes.items()}
+        self.rows = {}
+        self._sorted = None
+
+    def get(self, key):
+        return self.rows.get(key)
+
+    def all(self):
+        """Rows ordered by primary key"""
+        with self.lock:
+            if self._sorted is None:
+                self._sorted = [self.rows[key] for key in sorted(self.rows)]
+            return self._sorted
+
+    def find(self, index, value):
+        """Rows whose `index` equals value, ordered by primary key"""
+        with self.lock:
+            keys = self.indexes[index][1].get(value, ())
+            return [self.rows[key] for key in sorted(keys)]
+
+    def first(self, index, value):
+        found = self.find(index, value)
+        return found[0] if found else None
+
+    def put(self, row):
+        with self.lock:
+            key = self.key(row)
+            self.remove(key)
+            self.rows[key] = row
+            for getter, entries in self.indexes.values():
+                entries.setdefault(getter(row), set()).add(key)
+            self._sorted = None
+
+    def remove(self, key):
+        with self.lock:
+            row = self.rows.pop(key, None)
+            if row is None:
+                return None
+            for getter, entries in self.indexes.values():
+                keys = entries.get(getter(row))
+                keys.discard(key)
+                if not keys:
+                    del entries[getter(row)]
+            self._sorted = None
+            return row
+
+    def next_id(self):
+        with self.lock:
+            return max(self.rows, default=0) + 1
+
+
+class MemoryStore:
+    """Every table the models read, indexed for their lookups"""
+
+    def __init__(self, data=None):
+        self.lock = threading.RLock()
+        self.districts = Table(self.lock, lambda row: row.id, name=lambda row: row.name)
+        self.wards = Table(self.lock, lambda row: (row.id_ward, row.id_district), name=lambda row: row.name,
+                           id_district=lambda row: row.id_district)
+        self.bus_stations = Table(self.lock, lambda row: row.id, name=lambda row: row.name)
+        self.bus_lines = Table(self.lock, lambda row: row.id, name=lambda row: row.name)
+        self.station_line = Table(self.lock, lambda row: (row.id_bus_station, row.id_bus_line),
+                                  id_bus_line=lambda row: row.id_bus_line,
+                                  id_bus_station=lambda row: row.id_bus_station)
+        self.users = Table(self.lock, lambda row: row['id'], email=lambda row: row['email'])
+        self.network_version = None
+        if data:
+            self.load_dict(data)
+
+    def load_dict(self, data):
+        """Add the rows of a {table: [row dict]} mapping, in the snapshot layout"""
+        with self.lock:
+            for row in data.get('districts', ()):
+                self.districts.put(DistrictRecord(row['id'], row['name']))
+            for row in data.get('wards', ()):
+                self.wards.put(WardRecord(row['id_ward'], row['id_district'], row['name']))
+            for row in data.get('bus_stations', ()):
+                self.bus_stations.put(BusStationRecord(int(row['id']), row['name'], float(row['long']),
+                                                       float(row['lat']), row.get('address'), row.get('id_ward')))
+            for row in data.get('bus_lines', ()):
+                self.bus_lines.put(BusLineRecord(int(row['id']), row['name'], _decimal(row.get('length')),
+                                                 _decimal(row.get('price')), row.get('number_of_trips'),
+                                                 row.get('time_between_trips'), _time(row.get('start_time_first'))))
+            for row in data.get('station_line', ()):
+                self.station_line.put(StationLineRecord(int(row['id_bus_station']), int(row['id_bus_line']),
+                                                        int(row['seq']), _time(row.get('start_time_first')),
+                                                        _decimal(row.get('distance') or 0)))
+            for row in data.get('users', ()):
+                self.users.put({key: row.get(key) for key in TABLES['users']} | {'is_admin': bool(row.get('is_admin'))})
+            self.network_version = data.get('network_version', self.network_version)
+        return self
+
+    def as_dict(self, users=False):
+        """The store in the snapshot layout; users carry password hashes and are left out by default"""
+        with self.lock:
+            data = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION, 'network_version': self.network_version}
+            for table, columns in TABLES.items():
+                if table == 'users' and not users:
+                    continue
+                rows = getattr(self, table).all()
+                data[table] = [dict(row) if table == 'users' else {column: getattr(row, column) for column in columns}
+                               for row in rows]
+            return data
+
+    @classmethod
+    def load(cls, path):
+        """Read a snapshot written by save"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != SNAPSHOT_FORMAT or data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} memory snapshot")
+        return cls(data)
+
+    def save(self, path, users=False):
+        """Write the store atomically to path"""
+        opener = gzip.open if path.endswith('.gz') else open
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.memory-snapshot-')
+        os.close(fd)
+        try:
+            with opener(temp, 'wt', encoding='utf-8') as f:
+                json.dump(self.as_dict(users), f, default=_json_default)
+            os.replace(temp, path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    @classmethod
+    def from_database(cls, conn, users=False):
+        """Copy every table the models read out of Postgres"""
+        data = {'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION}
+        with conn.cursor() as cursor:
+            for table, columns in TABLES.items():
+                if table == 'users' and not users:
+                    continue
+                cursor.execute(f"SELECT {', '.join(columns)} FROM {table};")
+                data[table] = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            cursor.execute("SELECT version FROM network_version;")
+            row = cursor.fetchone()
+            data['network_version'] = row[0] if row else None
+        conn.rollback()
+        return cls(data)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Store of this process, loaded from MEMORY_SNAPSHOT on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.getenv('MEMORY_SNAPSHOT')
+            _store = MemoryStore.load(path) if path else MemoryStore()
+        return _store
+
+
+def use(store):
+    """Install the store the memory models of this process read from"""
+    global _store
+    with _store_lock:
+        _store = store
+    return store
+
+
+@timed_methods
+class MemoryBusStation(BusStation):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def get_all_bus_stations(self):
+        return list(self.store.bus_stations.all())
+
+    def get_all_bus_stations_json(self):
+        return self.get_all_bus_stations()
+
+    def iter_bus_station_batches(self, batch_size=10000):
+        rows = [(row.id, row.name, float(row.long), float(row.lat), row.address, row.id_ward)
+                for row in self.store.bus_stations.all()]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    def get_bus_station_by_id(self, bus_station_id):
+        return self.store.bus_stations.get(_int(bus_station_id))
+
+    def get_bus_station_by_name(self, name):
+        return self.store.bus_stations.first('name', name)
+
+    def create_bus_station(self, name, long, lat, address, id_ward):
+        with self.store.lock:
+            new_bus_station_id = self.store.bus_stations.next_id()
+            self.store.bus_stations.put(
+                BusStationRecord(new_bus_station_id, name, float(long), float(lat), address, id_ward))
+        return {'id': new_bus_station_id}
+
+    def update_bus_station(self, bus_station_id, name, long, lat, address, id_ward):
+        with self.store.lock:
+            if self.store.bus_stations.get(_int(bus_station_id)) is None:
+                return True
+            self.store.bus_stations.put(
+                BusStationRecord(_int(bus_station_id), name, float(long), float(lat), address, id_ward))
+        events.emit(events.StationMoved(int(bus_station_id), float(lat), float(long), name))
+        return True
+
+    def delete_bus_station(self, bus_station_id):
+        with self.store.lock:
+            self.store.bus_stations.remove(_int(bus_station_id))
+            for stop in self.store.station_line.find('id_bus_station', _int(bus_station_id)):
+                self.store.station_line.remove((stop.id_bus_station, stop.id_bus_line))
+        events.emit(events.StationRemoved(int(bus_station_id)))
+        return True
+
+
+@timed_methods
+class MemoryBusLine(BusLine):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def get_all_bus_lines(self):
+        return list(self.store.bus_lines.all())
+
+    def get_all_bus_lines_json(self):
+        return self.get_all_bus_lines()
+
+    def iter_bus_line_batches(self, batch_size=10000):
+        rows = [(row.id, row.name, None if row.length is None else float(row.length),
+                 None if row.price is None else float(row.price), row.number_of_trips, row.time_between_trips,
+                 row.start_time_first) for row in self.store.bus_lines.all()]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    def get_bus_line_by_id(self, bus_line_id):
+        return self.store.bus_lines.get(_int(bus_line_id))
+
+    def get_bus_line_by_name(self, name):
+        return self.store.bus_lines.first('name', name)
+
+    def create_bus_line(self, name, length, price, number_of_trips, time_between_trips, start_time_first):
+        with self.store.lock:
+            new_bus_line_id = self.store.bus_lines.next_id()
+            self.store.bus_lines.put(BusLineRecord(new_bus_line_id, name, _decimal(length), _decimal(price),
+                                                   number_of_trips, time_between_trips, _time(start_time_first)))
+        return {'id': new_bus_line_id}
+
+    def update_bus_line(self, bus_line_id, name, length, price, number_of_trips, time_between_trips, start_time_first):
+        with self.store.lock:
+            if self.store.bus_lines.get(_int(bus_line_id)) is not None:
+                self.store.bus_lines.put(BusLineRecord(_int(bus_line_id), name, _decimal(length), _decimal(price),
+                                                       number_of_trips, time_between_trips, _time(start_time_first)))
+        return True
+
+    def delete_bus_line(self, bus_line_id):
+        with self.store.lock:
+            self.store.bus_lines.remove(_int(bus_line_id))
+            for stop in self.store.station_line.find('id_bus_line', _int(bus_line_id)):
+                self.store.station_line.remove((stop.id_bus_station, stop.id_bus_line))
+        events.emit(events.LineRemoved(int(bus_line_id)))
+        return True
+
+
+@timed_methods
+class MemoryStationLine(StationLine):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def _stops(self, id_bus_line):
+        return sorted(self.store.station_line.find('id_bus_line', _int(id_bus_line)),
+                      key=lambda stop: (stop.seq, stop.id_bus_station))
+
+    def get_all_id_bus_lines(self):
+        return [{'id_bus_line': bus_line.id} for bus_line in self.store.bus_lines.all()]
+
+    def _stations(self, id_bus_line):
+        """(stop, station) pairs of a line, skipping stops of missing
+        stations as the join of the Postgres queries does"""
+        with self.store.lock:
+            pairs = [(stop, self.store.bus_stations.get(stop.id_bus_station)) for stop in self._stops(id_bus_line)]
+        return [(stop, station) for stop, station in pairs if station is not None]
+
+    def get_all_bus_stations_by_id_bus_line(self, id_bus_line):
+        return [station for _, station in self._stations(id_bus_line)]
+
+    def get_all_schedules_by_id_bus_line(self, id_bus_line):
+        schedules = []
+        for stop, station in self._stations(id_bus_line):
+            schedules.append(ScheduleRecord(stop.id_bus_station, stop.id_bus_line, stop.seq, stop.start_time_first,
+                                            stop.distance, station.lat, station.long, station.name))
+        return schedules
+
+    def get_all_bus_stations_by_id_bus_line_json(self, id_bus_line):
+        return self.get_all_bus_stations_by_id_bus_line(id_bus_line)
+
+    def get_all_schedules_by_id_bus_line_json(self, id_bus_line):
+        return self.get_all_schedules_by_id_bus_line(id_bus_line)
+
+    def iter_schedule_batches(self, id_bus_line=None, batch_size=10000):
+        if id_bus_line is None:
+            lines = [bus_line.id for bus_line in self.store.bus_lines.all()]
+        else:
+            lines = [id_bus_line]
+        rows = [(schedule.id_bus_station, schedule.id_bus_line, schedule.seq, schedule.start_time_first,
+                 None if schedule.distance is None else float(schedule.distance),
+                 float(schedule.lat), float(schedule.long), schedule.name)
+                for line in lines for schedule in self.get_all_schedules_by_id_bus_line(line)]
+        for start in range(0, len(rows), batch_size):
+            yield rows[start:start + batch_size]
+
+    def get_all_bus_lines_by_id_bus_station(self, id_bus_station):
+        return self.store.station_line.find('id_bus_station', _int(id_bus_station))
+
+    def get_station_line_by_id(self, id_bus_station, id_bus_line):
+        return self.store.station_line.get((_int(id_bus_station), _int(id_bus_line)))
+
+    def create_station_line(self, id_bus_station, id_bus_line, seq, start_time_first, distance):
+        key = (_int(id_bus_station), _int(id_bus_line))
+        with self.store.lock:
+            if (self.store.station_line.get(key) is not None or self.store.bus_stations.get(key[0]) is None
+                    or self.store.bus_lines.get(key[1]) is None):
+                return None
+            stop = StationLineRecord(*key, int(seq), _time(start_time_first), _decimal(distance))
+            self.store.station_line.put(stop)
+        events.emit(events.StopChanged(id_bus_line=stop.id_bus_line, id_bus_station=stop.id_bus_station,
+                                       seq=stop.seq, distance=stop.distance))
+        return {'id_bus_station': stop.id_bus_station, 'id_bus_line': stop.id_bus_line}
+
+    def update_station_line(self, id_bus_station, id_bus_line, seq, start_time_first, distance):
+        key = (_int(id_bus_station), _int(id_bus_line))
+        with self.store.lock:
+            if self.store.station_line.get(key) is None:
+                return True
+            stop = StationLineRecord(*key, int(seq), _time(start_time_first), _decimal(distance))
+            self.store.station_line.put(stop)
+        events.emit(events.StopChanged(id_bus_line=stop.id_bus_line, id_bus_station=stop.id_bus_station,
+                                       seq=stop.seq, distance=stop.distance))
+        return True
+
+    def delete_station_line(self, id_bus_station, id_bus_line):
+        self.store.station_line.remove((_int(id_bus_station), _int(id_bus_line)))
+        events.emit(events.StopRemoved(int(id_bus_line), int(id_bus_station)))
+        return True
+
+    def resequence(self, id_bus_line, stops):
+        with self.store.lock:
+            if any(self.store.bus_stations.get(_int(stop['id_bus_station'])) is None for stop in stops):
+                return None
+            keep = {_int(stop['id_bus_station']) for stop in stops}
+            removed = 0
+            for stop in self.store.station_line.find('id_bus_line', _int(id_bus_line)):
+                if stop.id_bus_station not in keep:
+                    self.store.station_line.remove((stop.id_bus_station, stop.id_bus_line))
+                    removed += 1
+            upserted = 0
+            for seq, stop in enumerate(stops, start=1):
+                row = StationLineRecord(_int(stop['id_bus_station']), _int(id_bus_line), seq,
+                                        _time(stop.get('start_time_first')), _decimal(stop['distance']))
+                if self.store.station_line.get((row.id_bus_station, row.id_bus_line)) != row:
+                    self.store.station_line.put(row)
+                    upserted += 1
+        events.emit(events.LineChanged(int(id_bus_line)))
+        return {'removed': removed, 'upserted': upserted}
+
+
+@timed_methods
+class MemoryDistrict(District):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def get_all_districts(self):
+        return list(self.store.districts.all())
+
+    def get_district_by_id(self, district_id):
+        return self.store.districts.get(district_id)
+
+    def get_district_by_name(self, name):
+        return self.store.districts.first('name', name)
+
+    def create_district(self, district_id, name):
+        with self.store.lock:
+            if self.store.districts.get(district_id) is not None:
+                return None
+            self.store.districts.put(DistrictRecord(district_id, name))
+        return {'id': district_id}
+
+    def update_district(self, district_id, name):
+        with self.store.lock:
+            if self.store.districts.get(district_id) is not None:
+                self.store.districts.put(DistrictRecord(district_id, name))
+        return True
+
+    def delete_district(self, district_id):
+        with self.store.lock:
+            self.store.districts.remove(district_id)
+            for ward in self.store.wards.find('id_district', district_id):
+                self.store.wards.remove((ward.id_ward, ward.id_district))
+        return True
+
+
+@timed_methods
+class MemoryWard(Ward):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def get_all_wards(self):
+        return list(self.store.wards.all())
+
+    def get_ward_by_id(self, ward_id, district_id):
+        return self.store.wards.get((ward_id, district_id))
+
+    def get_ward_by_name(self, name):
+        return self.store.wards.first('name', name)
+
+    def create_ward(self, id_ward, id_district, name):
+        with self.store.lock:
+            if self.store.wards.get((id_ward, id_district)) is not None or self.store.districts.get(id_district) is None:
+                return None
+            self.store.wards.put(WardRecord(id_ward, id_district, name))
+        return {'id_ward': id_ward, 'id_district': id_district}
+
+    def update_ward(self, ward_id, district_id, name):
+        with self.store.lock:
+            if self.store.wards.get((ward_id, district_id)) is not None:
+                self.store.wards.put(WardRecord(ward_id, district_id, name))
+        return True
+
+    def delete_ward(self, ward_id, district_id):
+        self.store.wards.remove((ward_id, district_id))
+        return True
+
+
+@timed_methods
+class MemoryUser(User):
+    def __init__(self, store):
+        super().__init__(None)
+        self.store = store
+
+    def get_all_users(self):
+        return [{key: user[key] for key in ('id', 'email', 'name', 'password')} for user in self.store.users.all()]
+
+    def get_user_by_id(self, user_id):
+        user = self.store.users.get(_int(user_id))
+        return dict(user) if user else None
+
+    def get_user_by_email(self, email):
+        user = self.store.users.first('email', email)
+        return {key: user[key] for key in ('id', 'email', 'name', 'password')} if user else None
+
+    def create_user(self, email, name, password):
+        password = self.encrypt_password(password)
+        with self.store.lock:
+            if self.store.users.first('email', email) is not None:
+                return None
+            new_user_id = self.store.users.next_id()
+            self.store.users.put({'id': new_user_id, 'email': email, 'name': name, 'password': password,
+                                  'is_admin': False})
+        return {
+            "access_token": create_access_token(identity=str(new_user_id)),
+            "token_type": "bearer",
+        }
+
+    def update_user(self, user_id, email, name, password):
+        password = self.encrypt_password(password)
+        with self.store.lock:
+            user = self.store.users.get(_int(user_id))
+            if user is None:
+                return True
+            self.store.users.put(user | {'email': email, 'name': name, 'password': password})
+        events.emit(events.UserChanged(int(user_id)))
+        return True
+
+    def delete_user(self, user_id):
+        self.store.users.remove(_int(user_id))
+        events.emit(events.UserChanged(int(user_id)))
+        return True
+
+    def set_admin(self, email, is_admin=True):
+        with self.store.lock:
+            user = self.store.users.first('email', email)
+            if user is None:
+                return False
+            self.store.users.put(user | {'is_admin': is_admin})
+        events.emit(events.UserChanged(user['id']))
+        return True
+
+    def rehash_password(self, user_id, old_hash, password):
+        try:
+            new_hash = hasher.hash(password)
+        except HashPoolBusy:
+            return False
+        with self.store.lock:
+            user = self.store.users.get(_int(user_id))
+            if user is not None and user['password'] == old_hash:
+                self.store.users.put(user | {'password': new_hash})
+        return True
+
+
+# Postgres model -> memory model answering the same calls
+MODELS = {
+    BusStation: MemoryBusStation,
+    BusLine: MemoryBusLine,
+    StationLine: MemoryStationLine,
+    District: MemoryDistrict,
+    Ward: MemoryWard,
+    User: MemoryUser,
+}
@@ -0,0 +1,185 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import zipfile
+
+import psycopg2
+import psycopg2.extras
+
+from routing import events
+from utils.metrics import timed_methods
+
+COLUMNS = {
+    'bus_stations': ('id', 'name', 'long', 'lat', 'address', 'id_ward'),
+    'bus_lines': ('id', 'name', 'length', 'price', 'number_of_trips', 'time_between_trips', 'start_time_first'),
+    'station_line': ('id_bus_station', 'id_bus_line', 'seq', 'start_time_first', 'distance')
+}
+
+# (message, query returning offending keys); staging tables are import_<table>
+VALIDATIONS = [
+    ("Duplicate bus station id", """
+        SELECT id FROM import_bus_stations GROUP BY id HAVING count(*) > 1"""),
+    ("Duplicate bus line id", """
+        SELECT id FROM import_bus_lines GROUP BY id HAVING count(*) > 1"""),
+    ("Duplicate station on a line", """
+        SELECT id_bus_station, id_bus_line FROM import_station_line
+        GROUP BY id_bus_station, id_bus_line HAVING count(*) > 1"""),
+    ("Duplicate seq on a line", """
+        SELECT id_bus_line, seq FROM import_station_line
+        GROUP BY id_bus_line, seq HAVING count(*) > 1"""),
+    ("Unknown bus station", """
+        SELECT DISTINCT stl.id_bus_station FROM import_station_line stl
+        WHERE NOT EXISTS (SELECT 1 FROM import_bus_stations bs WHERE bs.id = stl.id_bus_station)
+        AND (%(replace)s OR NOT EXISTS (SELECT 1 FROM bus_stations bs WHERE bs.id = stl.id_bus_station))"""),
+    ("Unknown bus line", """
+        SELECT DISTINCT stl.id_bus_line FROM import_station_line stl
+        WHERE NOT EXISTS (SELECT 1 FROM import_bus_lines bl WHERE bl.id = stl.id_bus_line)
+        AND (%(replace)s OR NOT EXISTS (SELECT 1 FROM bus_lines bl WHERE bl.id = stl.id_bus_line))"""),
+]
+
+
+class BundleError(ValueError):
+    """Raised when a network bundle is malformed or fails validation"""
+
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+@contextlib.contextmanager
+def read_bundle(source):
+    """Open a network bundle as {table: rows} where rows is either a CSV text
+    stream (header line first) or a list of dicts. The files it opens are
+    closed when the block exits.
+
+    Args:
+        source: dict parsed from JSON, a path to a .json/.zip file or a
+            directory of <table>.csv files, or a binary file object of a zip
+
+    Yields:
+        dict: table name -> CSV stream or list of dicts
+    """
+    with contextlib.ExitStack() as stack:
+        yield _open_bundle(source, stack)
+
+
+def _open_bundle(source, stack):
+    if isinstance(source, dict):
+        bundle = {table: source[table] for table in COLUMNS if table in source}
+        for table, rows in bundle.items():
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise BundleError([f"{table} must be an array of objects"])
+        return bundle
+    if isinstance(source, str) and os.path.isdir(source):
+        return {table: stack.enter_context(open(os.path.join(source, f"{table}.csv"), newline='', encoding='utf-8'))
+                for table in COLUMNS if os.path.exists(os.path.join(source, f"{table}.csv"))}
+    if isinstance(source, str) and source.endswith('.json'):
+        with open(source, encoding='utf-8') as f:
+            return _open_bundle(json.load(f), stack)
+    if not (isinstance(source, str) or hasattr(source, 'read')) or not zipfile.is_zipfile(source):
+        raise BundleError(["Bundle must be JSON, a zip or a directory of CSV files"])
+    archive = stack.enter_context(zipfile.ZipFile(source))
+    names = {os.path.basename(name): name for name in archive.namelist()}
+    return {table: stack.enter_context(io.TextIOWrapper(archive.open(names[f"{table}.csv"]),
+                                                        encoding='utf-8', newline=''))
+            for table in COLUMNS if f"{table}.csv" in names}
+
+
+@timed_methods
+class NetworkImport:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def import_bundle(self, bundle, replace=False):
+        """Load stations, lines and station_line sequences in one transaction.
+
+        Rows are bulk loaded into temporary staging tables (COPY for CSV,
+        execute_values for JSON), validated with set-based queries and then
+        moved into the real tables. With replace=True the existing network is
+        swapped out; otherwise staged stations and lines are upserted, and
+        every line with rows in station_line gets exactly those stops.
+        Lines and stations missing from the bundle are left as they are.
+
+        Args:
+            bundle (dict): output of read_bundle
+            replace (bool): replace the whole network instead of merging
+
+        Returns:
+            dict: number of imported rows per table
+        """
+        try:
+            with self.conn.cursor() as cursor:
+                for table in COLUMNS:
+                    cursor.execute(
+                        f"CREATE TEMP TABLE import_{table} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP;")
+                self._stage_bundle(cursor, bundle, replace)
+                errors = self._validate(cursor, replace)
+                if errors:
+                    raise BundleError(errors)
+                counts = self._swap(cursor, replace)
+            self.conn.commit()
+            events.emit(events.NetworkChanged(), self.conn)
+            return counts
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # bad values and missing required columns are the bundle's fault
+            self.conn.rollback()
+            raise BundleError([str(e).strip()])
+        except (psycopg2.Error, BundleError):
+            self.conn.rollback()
+            raise
+
+    def _stage_bundle(self, cursor, bundle, replace):
+        """Fill the import_<table> staging tables from the bundle"""
+        for table, columns in COLUMNS.items():
+            if table in bundle:
+                self._stage(cursor, table, columns, bundle[table])
+
+    def _stage(self, cursor, table, columns, rows):
+        if isinstance(rows, list):
+            psycopg2.extras.execute_values(
+                cursor, f"INSERT INTO import_{table} ({', '.join(columns)}) VALUES %s",
+                [tuple(row.get(column) for column in columns) for row in rows], page_size=1000)
+            return
+        header = next(csv.reader([rows.readline()]))
+        unknown = set(header) - set(columns)
+        if unknown:
+            raise BundleError([f"{table}.csv has unknown columns: {', '.join(sorted(unknown))}"])
+        cursor.copy_expert(
+            f"COPY import_{table} ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)", rows)
+
+    def _validate(self, cursor, replace):
+        errors = []
+        for message, query in VALIDATIONS:
+            cursor.execute(query + " LIMIT 10;", {'replace': replace})
+            keys = cursor.fetchall()
+            if keys:
+                errors.append(f"{message}: {', '.join(str(key[0] if len(key) == 1 else key) for key in keys)}")
+        return errors
+
+    def _swap(self, cursor, replace):
+        counts = {}
+        if replace:
+            cursor.execute("DELETE FROM station_line;")
+            cursor.execute("DELETE FROM bus_lines;")
+            cursor.execute("DELETE FROM bus_stations;")
+        else:
+            cursor.execute(
+                "DELETE FROM station_line WHERE id_bus_line IN (SELECT id_bus_line FROM import_station_line);")
+        for table in ('bus_stations', 'bus_lines'):
+            columns = COLUMNS[table]
+            updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+            cursor.execute(f"""
+                INSERT INTO {table} ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM import_{table}
+                ON CONFLICT (id) DO UPDATE SET {updates};
+            """)
+            counts[table] = cursor.rowcount
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 0) + 1, false) FROM {table};")
+        columns = ', '.join(COLUMNS['station_line'])
+        cursor.execute(
+            f"INSERT INTO station_line ({columns}) SELECT {columns} FROM import_station_line;")
+        counts['station_line'] = cursor.rowcount
+        return counts
@@ -0,0 +1,60 @@
+import datetime
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+
+@dataclass(slots=True)
+class BusStationRecord:
+    id: int
+    name: str
+    long: float
+    lat: float
+    address: Optional[str]
+    id_ward: Optional[str]
+
+
+@dataclass(slots=True)
+class BusLineRecord:
+    id: int
+    name: str
+    length: Optional[Decimal]
+    price: Optional[Decimal]
+    number_of_trips: Optional[int]
+    time_between_trips: Optional[int]
+    start_time_first: Optional[datetime.time]
+
+
+@dataclass(slots=True)
+class StationLineRecord:
+    id_bus_station: int
+    id_bus_line: int
+    seq: int
+    start_time_first: Optional[datetime.time]
+    distance: Decimal
+
+
+@dataclass(slots=True)
+class ScheduleRecord:
+    id_bus_station: int
+    id_bus_line: int
+    seq: int
+    start_time_first: Optional[datetime.time]
+    distance: Decimal
+    lat: float
+    long: float
+    name: str
+
+
+@dataclass(slots=True)
+class DistrictRecord:
+    id: str
+    name: str
+
+
+@dataclass(slots=True)
+class WardRecord:
+    id_ward: str
+    id_district: str
+    name: str
@@ -1,8 +1,41 @@
 import heapq
-import networkx as nx
+import time
+
+from decimal import Decimal
+
 import psycopg2
+import psycopg2.extras
+
+from db import statements
+from routing import SearchStats, events, routing_graph
+from utils.json_provider import RawJSON
+from utils.metrics import COUNT_BUCKETS, count_model_error, registry, timed_methods
+from .records import BusStationRecord, ScheduleRecord, StationLineRecord
+
+STATION_LINE_BY_ID = statements.register(
+    'station_line_by_id', "SELECT id_bus_station, id_bus_line, seq, start_time_first, distance FROM station_line WHERE id_bus_station = %s AND id_bus_line = %s;")
+SCHEDULES_BY_ID_BUS_LINE = statements.register(
+    'schedules_by_id_bus_line', "SELECT stl.id_bus_station, stl.id_bus_line, stl.seq, stl.start_time_first, stl.distance, bst.lat, bst.long, bst.name FROM station_line stl, bus_stations bst WHERE stl.id_bus_station = bst.id AND stl.id_bus_line = %s ORDER BY stl.seq ASC, stl.id_bus_station ASC;")
+STATION_LINES_BY_ID_BUS_STATION = "SELECT * FROM station_line WHERE id_bus_station = %s;"
+BUS_STATIONS_BY_ID_BUS_LINE = "SELECT * FROM bus_stations AS bs JOIN (SELECT id_bus_station, seq FROM station_line WHERE id_bus_line = %s) AS bid ON bs.id = bid.id_bus_station ORDER BY seq;"
+
+searches = registry.counter(
+    'routing_searches_total', "Route searches by kind and whether a route was found", ('kind', 'result'))
+route_sizes = registry.histogram(
+    'routing_result_size', "Stations on the shortest route, or number of routes listed", ('kind',), COUNT_BUCKETS)
+
+
+def _total(weight):
+    """A route's summed float edge weights as the Decimal the database sums to.
+
+    Distances are NUMERIC(10, 2); the graph keeps them as floats for its
+    arrays, so totals are rounded back to cents. The 0 of an empty route
+    stays an int.
+    """
+    return Decimal(f"{weight:.2f}") if isinstance(weight, float) else weight
 
 
+@timed_methods
 class StationLine:
     def __init__(self, conn):
         self.conn = conn
@@ -16,6 +49,7 @@ class StationLine:
                 'id_bus_line': bus_line[0]
             } for bus_line in bus_lines]
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all bus lines: {e}")
             return None
 
@@ -31,17 +65,11 @@ class StationLine:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM bus_stations AS bs JOIN (SELECT id_bus_station, seq FROM station_line WHERE id_bus_line = %s) AS bid ON bs.id = bid.id_bus_station ORDER BY seq;", (id_bus_line,))
+                    BUS_STATIONS_BY_ID_BUS_LINE, (id_bus_line,))
                 bus_stations = cursor.fetchall()
-            return [{
-                'id': bus_stations[0],
-                'name': bus_stations[1],
-                'long': bus_stations[2],
-                'lat': bus_stations[3],
-                'address': bus_stations[4],
-                'id_ward': bus_stations[5]
-            } for bus_stations in bus_stations]
+            return [BusStationRecord(*bus_station[:6]) for bus_station in bus_stations]
         except psycopg2.Error as e:
+            count_model_error()
             print(
                 f"Error fetching station_line with bus line id {id_bus_line}: {e}")
             return None
@@ -57,38 +85,78 @@ class StationLine:
         """
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT stl.id_bus_station, stl.id_bus_line, stl.seq, stl.start_time_first, stl.distance, bst.lat, bst.long, bst.name FROM station_line stl, bus_stations bst WHERE stl.id_bus_station = bst.id AND stl.id_bus_line = %s ORDER BY stl.seq ASC;", (id_bus_line,))
+                statements.execute(
+                    cursor, SCHEDULES_BY_ID_BUS_LINE, (id_bus_line,))
                 station_lines = cursor.fetchall()
-            return [{
-                'id_bus_station': station_line[0],
-                'id_bus_line': station_line[1],
-                'seq': station_line[2],
-                'start_time_first': station_line[3],
-                'distance': station_line[4],
-                'lat': station_line[5],
-                'long': station_line[6],
-                'name': station_line[7]
-            } for station_line in station_lines]
+            return [ScheduleRecord(*station_line[:8]) for station_line in station_lines]
+        except psycopg2.Error as e:
+            count_model_error()
+            print(
+                f"Error fetching station_line with bus line id {id_bus_line}: {e}")
+            return None
+
+    def get_all_bus_stations_by_id_bus_line_json(self, id_bus_line):
+        """Same rows as get_all_bus_stations_by_id_bus_line, aggregated into a JSON array by Postgres"""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT coalesce(json_agg(json_build_object('id', bs.id, 'name', bs.name, 'long', bs.long, 'lat', bs.lat, 'address', bs.address, 'id_ward', bs.id_ward) ORDER BY stl.seq), '[]')::text
+                    FROM station_line stl JOIN bus_stations bs ON bs.id = stl.id_bus_station
+                    WHERE stl.id_bus_line = %s;
+                """, (id_bus_line,))
+                bus_stations = cursor.fetchone()[0]
+            return RawJSON(bus_stations)
         except psycopg2.Error as e:
+            count_model_error()
             print(
                 f"Error fetching station_line with bus line id {id_bus_line}: {e}")
             return None
 
+    def get_all_schedules_by_id_bus_line_json(self, id_bus_line):
+        """Same rows as get_all_schedules_by_id_bus_line, aggregated into a JSON array by Postgres"""
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT coalesce(json_agg(json_build_object('id_bus_station', stl.id_bus_station, 'id_bus_line', stl.id_bus_line, 'seq', stl.seq, 'start_time_first', stl.start_time_first, 'distance', stl.distance::text, 'lat', bst.lat, 'long', bst.long, 'name', bst.name) ORDER BY stl.seq), '[]')::text
+                    FROM station_line stl JOIN bus_stations bst ON stl.id_bus_station = bst.id
+                    WHERE stl.id_bus_line = %s;
+                """, (id_bus_line,))
+                station_lines = cursor.fetchone()[0]
+            return RawJSON(station_lines)
+        except psycopg2.Error as e:
+            count_model_error()
+            print(
+                f"Error fetching station_line with bus line id {id_bus_line}: {e}")
+            return None
+
+    def iter_schedule_batches(self, id_bus_line=None, batch_size=10000):
+        """Yield schedules as batches of tuples from a server-side cursor
+
+        Args:
+            id_bus_line (int, optional): restrict to one bus line, all lines if None
+            batch_size (int): rows per batch
+
+        Yields:
+            list: tuples in get_all_schedules_by_id_bus_line column order
+        """
+        with self.conn.cursor(name='schedule_batches') as cursor:
+            cursor.execute(
+                "SELECT stl.id_bus_station, stl.id_bus_line, stl.seq, stl.start_time_first, stl.distance::float8, bst.lat::float8, bst.long::float8, bst.name FROM station_line stl JOIN bus_stations bst ON stl.id_bus_station = bst.id WHERE %(id_bus_line)s IS NULL OR stl.id_bus_line = %(id_bus_line)s ORDER BY stl.id_bus_line, stl.seq;", {'id_bus_line': id_bus_line})
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
     def get_all_bus_lines_by_id_bus_station(self, id_bus_station):
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM station_line WHERE id_bus_station = %s;", (id_bus_station,))
+                    STATION_LINES_BY_ID_BUS_STATION, (id_bus_station,))
                 station_lines = cursor.fetchall()
-            return [{
-                'id_bus_station': station_line[0],
-                'id_bus_line': station_line[1],
-                'seq': station_line[2],
-                'start_time_first': station_line[3],
-                'distance': station_line[4]
-            } for station_line in station_lines]
+            return [StationLineRecord(*station_line[:5]) for station_line in station_lines]
         except psycopg2.Error as e:
+            count_model_error()
             print(
                 f"Error fetching station_line with bus station id {id_bus_station}: {e}")
             return None
@@ -96,17 +164,14 @@ class StationLine:
     def get_station_line_by_id(self, id_bus_station, id_bus_line):
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute(
-                    "SELECT * FROM station_line WHERE id_bus_station = %s AND id_bus_line = %s;", (id_bus_station, id_bus_line))
+                statements.execute(
+                    cursor, STATION_LINE_BY_ID, (id_bus_station, id_bus_line))
                 station_line = cursor.fetchone()
-            return {
-                'id_bus_station': station_line[0],
-                'id_bus_line': station_line[1],
-                'seq': station_line[2],
-                'start_time_first': station_line[3],
-                'distance': station_line[4]
-            }
+            if not station_line:
+                return None
+            return StationLineRecord(*station_line[:5])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating bus station: {e}")
             return None
 
@@ -116,12 +181,15 @@ class StationLine:
                 cursor.execute("""
                     INSERT INTO station_line (id_bus_station, id_bus_line, seq, start_time_first, distance)
                     VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id_bus_station, id_bus_line;
+                    RETURNING id_bus_station, id_bus_line, seq, distance;
                 """, (id_bus_station, id_bus_line, seq, start_time_first, distance))
                 new_station_line_id = cursor.fetchone()
                 self.conn.commit()
+            events.emit(events.StopChanged(
+                id_bus_line=new_station_line_id[1], id_bus_station=new_station_line_id[0], seq=new_station_line_id[2], distance=new_station_line_id[3]), self.conn)
             return {'id_bus_station': new_station_line_id[0], 'id_bus_line': new_station_line_id[1]}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating bus station: {e}")
             return None
 
@@ -129,11 +197,17 @@ class StationLine:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute("""
-                    UPDATE station_line SET seq = %s, start_time_first = %s, distance = %s WHERE id_bus_station = %s AND id_bus_line = %s;
+                    UPDATE station_line SET seq = %s, start_time_first = %s, distance = %s WHERE id_bus_station = %s AND id_bus_line = %s
+                    RETURNING id_bus_station, id_bus_line, seq, distance;
                 """, (seq, start_time_first, distance, id_bus_station, id_bus_line))
+                updated = cursor.fetchone()
                 self.conn.commit()
-                return True
+            if updated:
+                events.emit(events.StopChanged(
+                    id_bus_line=updated[1], id_bus_station=updated[0], seq=updated[2], distance=updated[3]), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(
                 f"Error updating station_line with id {id_bus_station, id_bus_line}: {e}")
             return False
@@ -144,14 +218,66 @@ class StationLine:
                 cursor.execute(
                     "DELETE FROM station_line WHERE id_bus_station = %s AND id_bus_line = %s;", (id_bus_station, id_bus_line))
                 self.conn.commit()
-                return True
+            events.emit(events.StopRemoved(
+                int(id_bus_line), int(id_bus_station)), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(
                 f"Error deleting station_line with id {id_bus_station, id_bus_line}: {e}")
             return False
 
+    def resequence(self, id_bus_line, stops):
+        """Replace the ordered stop list of a bus line in one statement
+
+        Stops are numbered by their position. Stops missing from the list are
+        removed, the rest go through a multi-row upsert that only touches
+        rows whose seq, start time or distance changed.
+
+        Args:
+            id_bus_line (int): bus line id
+            stops (list): dicts with id_bus_station, distance and optional start_time_first
+
+        Returns:
+            dict: number of removed and upserted rows
+        """
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    WITH gone AS (
+                        DELETE FROM station_line
+                        WHERE id_bus_line = %(id_bus_line)s::int AND NOT (id_bus_station = ANY(%(stations)s::int[]))
+                        RETURNING 1
+                    ), upserted AS (
+                        INSERT INTO station_line (id_bus_station, id_bus_line, seq, start_time_first, distance)
+                        SELECT stop.id_bus_station, %(id_bus_line)s::int, stop.seq, stop.start_time_first, stop.distance
+                        FROM unnest(%(stations)s::int[], %(starts)s::time[], %(distances)s::numeric[])
+                            WITH ORDINALITY AS stop (id_bus_station, start_time_first, distance, seq)
+                        ON CONFLICT (id_bus_station, id_bus_line) DO UPDATE
+                        SET seq = EXCLUDED.seq, start_time_first = EXCLUDED.start_time_first, distance = EXCLUDED.distance
+                        WHERE (station_line.seq, station_line.start_time_first, station_line.distance)
+                            IS DISTINCT FROM (EXCLUDED.seq, EXCLUDED.start_time_first, EXCLUDED.distance)
+                        RETURNING 1
+                    )
+                    SELECT (SELECT count(*) FROM gone), (SELECT count(*) FROM upserted);
+                """, {'id_bus_line': id_bus_line,
+                      'stations': [stop['id_bus_station'] for stop in stops],
+                      'starts': [stop.get('start_time_first') for stop in stops],
+                      'distances': [stop['distance'] for stop in stops]})
+                removed, upserted = cursor.fetchone()
+                self.conn.commit()
+            events.emit(events.LineChanged(int(id_bus_line)), self.conn)
+            return {'removed': removed, 'upserted': upserted}
+        except psycopg2.Error as e:
+            count_model_error()
+            self.conn.rollback()
+            print(
+                f"Error resequencing station_line with bus line id {id_bus_line}: {e}")
+            return None
+
     def init_graph(self, start, end):
-        """Initialize graph of start, end station id
+        """Get the routing graph of all bus lines, built on first use and then
+        kept up to date by the station_line write methods
 
         Args:
             start (int): start station id
@@ -160,25 +286,41 @@ class StationLine:
         Returns:
             DiGraph: DiGraph of routing between start station and end station
         """
-        G = nx.DiGraph()
-        bus_lines = self.get_all_id_bus_lines()
-        for bus_line in bus_lines:
-            stations = self.get_all_schedules_by_id_bus_line(
-                bus_line['id_bus_line'])
-            for station in stations:
-                G.add_node(station['id_bus_station'],
-                           lat=station['lat'], lng=station['long'], name=station['name'])
-            for i in range(len(stations) - 1):
-                G.add_edge(stations[i]['id_bus_station'], stations[i + 1]
-                           ['id_bus_station'], weight=stations[i]['distance'])
-        return G
-
-    def shortest_path(self, start, end):
-        graph = self.init_graph(start, end)
+        return routing_graph.get(self)
+
+    def shortest_path(self, start, end, stats=None):
+        """Dijkstra over the frozen routing graph
+
+        Args:
+            start (int): start station id
+            end (int): end station id
+            stats (SearchStats, optional): filled in with what the search cost
+
+        Returns:
+            dict: 'routing' station ids and total 'distance'
+        """
+        stats = stats if stats is not None else SearchStats()
+        started = time.perf_counter()
+        graph = routing_graph.frozen(self)
+        searching = time.perf_counter()
+        stats.graph_version = graph.version
+        stats.graph_seconds = searching - started
+        result = self._shortest_path(graph, start, end, stats)
+        stats.search_seconds = time.perf_counter() - searching
+        found = isinstance(result, dict)
+        stats.result_size = len(result['routing']) if found else 0
+        stats.observe()
+        searches.inc(('shortest', 'found' if found else 'none'))
+        if found:
+            route_sizes.observe(('shortest',), stats.result_size)
+        return result
+
+    def _shortest_path(self, graph, start, end, stats):
         dist = {start: 0}
         previous = {}
         visited = set()
         heap = [(0, start)]
+        relaxed, pushes = 0, 1
 
         while heap:
             (d, v) = heapq.heappop(heap)
@@ -186,18 +328,17 @@ class StationLine:
                 continue
             visited.add(v)
 
-            for neighbor, edge_attr in graph[v].items():
-                weight = edge_attr['weight']
-                print(f"weight: {weight}\n")
+            for neighbor, weight in graph.successors(v):
+                relaxed += 1
                 distance = dist[v] + weight
-                print(f"distance: {distance}\n")
 
                 if neighbor not in dist or distance < dist[neighbor]:
                     dist[neighbor] = distance
                     previous[neighbor] = v
                     heapq.heappush(heap, (distance, neighbor))
+                    pushes += 1
+        stats.settled, stats.relaxed, stats.pushes = len(visited), relaxed, pushes
         if end not in dist:
-            print(f"No path found from {start} to {end}.")
             return None, float('inf')
         # Reconstruct path from start to end
         path = []
@@ -206,11 +347,14 @@ class StationLine:
             path.insert(0, current)
             current = previous[current]
         path.insert(0, start)
-        return {"routing": path, "distance": dist[end]}
+        return {"routing": path, "distance": _total(dist[end])}
 
     def find_all_paths(self, start, end):
         """Find all paths from start to end in the directed graph and calculate the total weight of each path.
 
+        Searches the frozen routing graph, an immutable copy, so the
+        enumeration does not hold the graph lock.
+
         Args:
             start (int): The starting node id.
             end (int): The target node id.
@@ -218,37 +362,34 @@ class StationLine:
         Returns:
             List[dict]: List of paths, each path is a dictionary containing 'nodes' (list of node info) and 'total_weight'.
         """
-        # Initialize the graph
-        G = self.init_graph(start, end)
+        paths = self._find_all_paths(routing_graph.frozen(self), start, end)
+        searches.inc(('all', 'found' if paths else 'none'))
+        route_sizes.observe(('all',), len(paths))
+        return paths
+
+    def _find_all_paths(self, graph, start, end):
+        def stop(node):
+            lat, lng, name = graph.node(node)
+            return {'id_bus_station': node, 'lat': lat, 'lng': lng, 'name': name}
 
-        def dfs(current_node, path, weight_total):
+        def dfs(current_node, path, on_path, weight_total):
             if current_node == end:
                 # Append the path with total weight to all_paths
                 all_paths.append({
                     'nodes': path.copy(),
-                    'total_weight': weight_total
+                    'total_weight': _total(weight_total)
                 })
                 return
-            for neighbor in G.neighbors(current_node):
-                if neighbor not in [node['id_bus_station'] for node in path]:
-                    edge_weight = G.get_edge_data(
-                        current_node, neighbor, default={'weight': 0})['weight']
-                    path.append({
-                        'id_bus_station': neighbor,
-                        'lat': G.nodes[neighbor]['lat'],
-                        'lng': G.nodes[neighbor]['lng'],
-                        'name': G.nodes[neighbor]['name']
-                    })
-                    dfs(neighbor, path, weight_total + edge_weight)
+            for neighbor, edge_weight in graph.successors(current_node):
+                if neighbor not in on_path:
+                    path.append(stop(neighbor))
+                    on_path.add(neighbor)
+                    dfs(neighbor, path, on_path, weight_total + edge_weight)
+                    on_path.discard(neighbor)
                     path.pop()
 
         all_paths = []
         # Start DFS from the start node
-        dfs(start, [{
-            'id_bus_station': start,
-            'lat': G.nodes[start]['lat'],
-            'lng': G.nodes[start]['lng'],
-            'name': G.nodes[start]['name']
-        }], 0)
+        dfs(start, [stop(start)], {start}, 0)
 
         return all_paths
@@ -1,9 +1,33 @@
+import os
+
 import psycopg2
 
 from flask_jwt_extended import create_access_token
-from werkzeug.security import generate_password_hash, check_password_hash
+from db import statements
+from routing import events
+from utils.cache import TTLCache
+from utils.metrics import count_model_error, timed_methods
+from utils.passwords import HashPool, HashPoolBusy
+
+USER_BY_EMAIL = statements.register(
+    'user_by_email', "SELECT id, email, name, password FROM users WHERE email = %s;")
+USER_BY_ID = "SELECT id, email, name, password, is_admin FROM users WHERE id = %s;"
+
+# Profiles (no password hash) keyed by JWT identity
+profiles = TTLCache(ttl=int(os.getenv('USER_CACHE_TTL', 30)))
+
+hasher = HashPool.from_env()
 
 
+@events.subscribe
+def forget_profile(event, conn=None):
+    if isinstance(event, events.UserChanged):
+        profiles.pop(str(event.id))
+    elif isinstance(event, events.NetworkChanged):
+        profiles.clear()
+
+
+@timed_methods
 class User:
     def __init__(self, conn):
         self.conn = conn
@@ -11,10 +35,11 @@ class User:
     def get_all_users(self):
         try:
             with self.conn.cursor() as cursor:
-                cursor.execute("SELECT * FROM users;")
+                cursor.execute("SELECT id, email, name, password FROM users;")
                 users = cursor.fetchall()
             return [{'id': user[0], 'email': user[1], 'name': user[2], 'password': user[3]} for user in users]
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all users: {e}")
             return None
 
@@ -22,15 +47,34 @@ class User:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM users WHERE id = %s;", (user_id,))
+                    USER_BY_ID, (user_id,))
                 user = cursor.fetchone()
                 if not user:
                     return None
-            return {'id': user[0], 'email': user[1], 'name': user[2], 'password': user[3]}
+            return {'id': user[0], 'email': user[1], 'name': user[2], 'password': user[3], 'is_admin': user[4]}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching user with id {user_id}: {e}")
             return None
 
+    def get_profile(self, user_id):
+        """User without the password hash, cached for USER_CACHE_TTL seconds
+
+        Args:
+            user_id: JWT identity
+
+        Returns:
+            dict: id, email, name and is_admin, or None when the user does not exist
+        """
+        profile = profiles.get(str(user_id))
+        if profile is None:
+            user = self.get_user_by_id(user_id)
+            if not user:
+                return None
+            profile = {'id': user['id'], 'email': user['email'], 'name': user['name'], 'is_admin': user['is_admin']}
+            profiles.set(str(user_id), profile)
+        return dict(profile)
+
     def create_user(self, email, name, password):
         try:
             with self.conn.cursor() as cursor:
@@ -42,12 +86,13 @@ class User:
                 new_user_id = cursor.fetchone()[0]
                 self.conn.commit()
                 access_token = create_access_token(
-                    identity=new_user_id)
+                    identity=str(new_user_id))
             return {
                 "access_token": access_token,
                 "token_type": "bearer",
             }
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating user: {e}")
             return None
 
@@ -58,8 +103,10 @@ class User:
                     UPDATE users SET email = %s, name = %s, password = %s WHERE id = %s;
                 """, (email, name, self.encrypt_password(password), user_id))
                 self.conn.commit()
-                return True
+            events.emit(events.UserChanged(int(user_id)), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error updating user with id {user_id}: {e}")
             return False
 
@@ -68,35 +115,79 @@ class User:
             with self.conn.cursor() as cursor:
                 cursor.execute("DELETE FROM users WHERE id = %s;", (user_id,))
                 self.conn.commit()
-                return True
+            events.emit(events.UserChanged(int(user_id)), self.conn)
+            return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error deleting user with id {user_id}: {e}")
             return False
 
-    def get_user_by_email(self, email):
+    def set_admin(self, email, is_admin=True):
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM users WHERE email = %s;", (email,))
+                    "UPDATE users SET is_admin = %s WHERE email = %s RETURNING id;", (is_admin, email))
+                user = cursor.fetchone()
+                self.conn.commit()
+            if not user:
+                return False
+            events.emit(events.UserChanged(user[0]), self.conn)
+            return True
+        except psycopg2.Error as e:
+            count_model_error()
+            print(f"Error updating admin flag of user with email {email}: {e}")
+            return False
+
+    def rehash_password(self, user_id, old_hash, password):
+        """Store a fresh hash of a verified password, unless it changed meanwhile"""
+        try:
+            new_hash = hasher.hash(password)
+            with self.conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE users SET password = %s WHERE id = %s AND password = %s;", (new_hash, user_id, old_hash))
+                self.conn.commit()
+            return True
+        except HashPoolBusy:
+            return False
+        except psycopg2.Error as e:
+            count_model_error()
+            print(f"Error rehashing password of user with id {user_id}: {e}")
+            return False
+
+    def get_user_by_email(self, email):
+        try:
+            with self.conn.cursor() as cursor:
+                statements.execute(cursor, USER_BY_EMAIL, (email,))
                 user = cursor.fetchone()
                 if not user:
                     return None
             return {'id': user[0], 'email': user[1], 'name': user[2], 'password': user[3]}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching user with id {email}: {e}")
             return None
 
     def encrypt_password(self, password):
-        """Encrypts the password using a secure hash function."""
-        return generate_password_hash(password)
+        """Encrypts the password using a secure hash function.
+
+        Raises:
+            HashPoolBusy: when the hashing pool has no room left
+        """
+        return hasher.hash(password)
 
     def login(self, email, password):
-        """Attempts to log in a user with the provided email and password."""
+        """Attempts to log in a user with the provided email and password.
+
+        A password stored with another hash method than PASSWORD_HASH_METHOD
+        is rehashed with the current one.
+        """
         user = self.get_user_by_email(email)
-        if not user or not check_password_hash(user["password"], password):
+        if not user or not hasher.verify(user["password"], password):
             return None
+        if hasher.needs_rehash(user["password"]):
+            self.rehash_password(user["id"], user["password"], password)
         access_token = create_access_token(
-            identity=user['id'])
+            identity=str(user['id']))
         return {
             "access_token": access_token,
             "token_type": "bearer",
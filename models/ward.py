@@ -1,6 +1,12 @@
 import psycopg2
 
+from utils.metrics import count_model_error, timed_methods
+from .records import WardRecord
 
+WARD_BY_ID = "SELECT * FROM wards WHERE id_ward = %s AND id_district = %s;"
+
+
+@timed_methods
 class Ward:
     def __init__(self, conn):
         self.conn = conn
@@ -10,12 +16,9 @@ class Ward:
             with self.conn.cursor() as cursor:
                 cursor.execute("SELECT * FROM wards;")
                 wards = cursor.fetchall()
-            return [{
-                'id_ward': ward[0],
-                'id_district': ward[1],
-                'name': ward[2]
-            } for ward in wards]
+            return [WardRecord(*ward[:3]) for ward in wards]
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching all wards: {e}")
             return None
 
@@ -23,16 +26,13 @@ class Ward:
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(
-                    "SELECT * FROM wards WHERE id_ward = %s AND id_district = %s;", (ward_id, district_id))
+                    WARD_BY_ID, (ward_id, district_id))
                 ward = cursor.fetchone()
                 if not ward:
                     return None
-            return {
-                'id_ward': ward[0],
-                'id_district': ward[1],
-                'name': ward[2]
-            }
+            return WardRecord(*ward[:3])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error fetching ward with id {district_id, ward_id}: {e}")
             return None
 
@@ -44,12 +44,9 @@ class Ward:
                 ward = cursor.fetchone()
                 if not ward:
                     return None
-            return {
-                'id_ward': ward[0],
-                'id_district': ward[1],
-                'name': ward[2]
-            }
+            return WardRecord(*ward[:3])
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error searching ward by name {name}: {e}")
             return None
 
@@ -65,6 +62,7 @@ class Ward:
                 self.conn.commit()
             return {'id_ward': new_ward_id[0], 'id_district': new_ward_id[1]}
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error creating ward: {e}")
             return None
 
@@ -77,6 +75,7 @@ class Ward:
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error updating ward with id {district_id, ward_id}: {e}")
             return False
 
@@ -88,5 +87,6 @@ class Ward:
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
+            count_model_error()
             print(f"Error deleting ward with id {district_id, ward_id}: {e}")
             return False
@@ -0,0 +1,5 @@
+from . import events
+from .graph import RoutingGraph, routing_graph
+from .maintainer import GraphMaintainer, maintainer
+from .listener import ChangeListener, listener
+from .stats import SearchStats
@@ -0,0 +1,69 @@
+from array import array
+from bisect import bisect_left
+
+
+class CompactGraph:
+    """Read-only copy of the routing graph in flat arrays (CSR layout).
+
+    Stations are sorted by id; the successors of the station at index i are
+    targets[offsets[i]:offsets[i + 1]] with the matching weights. Reading
+    an array creates new int/float objects instead of touching shared
+    ones, so pages inherited from a preloading master stay shared between
+    workers.
+    """
+
+    __slots__ = ('version', 'ids', 'lat', 'lng', 'name_offsets', 'names', 'offsets', 'targets', 'weights')
+
+    def __init__(self, version, ids, lat, lng, name_offsets, names, offsets, targets, weights):
+        self.version = version
+        self.ids = ids
+        self.lat = lat
+        self.lng = lng
+        self.name_offsets = name_offsets
+        self.names = names
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_graph(cls, graph, version=0):
+        """Freeze a networkx DiGraph with lat/lng/name nodes and weighted edges"""
+        nodes = sorted(graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        lat, lng, name_offsets, names = array('d'), array('d'), array('I', [0]), bytearray()
+        offsets, targets, weights = array('I', [0]), array('I'), array('d')
+        for node in nodes:
+            data = graph.nodes[node]
+            lat.append(data.get('lat') or 0.0)
+            lng.append(data.get('lng') or 0.0)
+            names += (data.get('name') or '').encode('utf-8')
+            name_offsets.append(len(names))
+            for neighbor, edge in sorted(graph[node].items()):
+                targets.append(index[neighbor])
+                weights.append(edge['weight'])
+            offsets.append(len(targets))
+        return cls(version, array('q', nodes), lat, lng, name_offsets, bytes(names), offsets, targets, weights)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, node):
+        i = bisect_left(self.ids, node)
+        return i < len(self.ids) and self.ids[i] == node
+
+    def index(self, node):
+        i = bisect_left(self.ids, node)
+        if i == len(self.ids) or self.ids[i] != node:
+            raise KeyError(node)
+        return i
+
+    def successors(self, node):
+        """(neighbor id, weight) pairs of the edges leaving node"""
+        i = self.index(node)
+        ids, targets, weights = self.ids, self.targets, self.weights
+        return [(ids[targets[j]], weights[j]) for j in range(self.offsets[i], self.offsets[i + 1])]
+
+    def node(self, node):
+        """(lat, lng, name) of a station"""
+        i = self.index(node)
+        return self.lat[i], self.lng[i], self.names[self.name_offsets[i]:self.name_offsets[i + 1]].decode('utf-8')
@@ -0,0 +1,86 @@
+import logging
+
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_handlers = []
+
+
+@dataclass(slots=True, frozen=True)
+class StopChanged:
+    """A station_line row was inserted or updated"""
+    id_bus_line: int
+    id_bus_station: int
+    seq: int
+    distance: float
+
+
+@dataclass(slots=True, frozen=True)
+class StopRemoved:
+    id_bus_line: int
+    id_bus_station: int
+
+
+@dataclass(slots=True, frozen=True)
+class LineChanged:
+    """Several stops of a line changed at once, reload the whole line"""
+    id_bus_line: int
+
+
+@dataclass(slots=True, frozen=True)
+class LineRemoved:
+    id_bus_line: int
+
+
+@dataclass(slots=True, frozen=True)
+class StationMoved:
+    """A bus station's position or name changed"""
+    id_bus_station: int
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    name: Optional[str] = None
+
+
+@dataclass(slots=True, frozen=True)
+class StationRemoved:
+    id_bus_station: int
+
+
+@dataclass(slots=True, frozen=True)
+class UserChanged:
+    """A user was updated or removed"""
+    id: int
+
+
+@dataclass(slots=True, frozen=True)
+class NetworkChanged:
+    """Bulk change, cached structures have to be rebuilt"""
+
+
+def subscribe(handler):
+    """Register handler(event, conn), called after the write is committed"""
+    if handler not in _handlers:
+        _handlers.append(handler)
+    return handler
+
+
+def unsubscribe(handler):
+    if handler in _handlers:
+        _handlers.remove(handler)
+
+
+def emit(event, conn=None):
+    """Deliver a change event to every subscriber
+
+    Args:
+        event: one of the event classes of this module
+        conn: connection that committed the change, subscribers may read
+            through it to see their own writes
+    """
+    for handler in list(_handlers):
+        try:
+            handler(event, conn)
+        except Exception:
+            logger.exception("Error handling %s", event)
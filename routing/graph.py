@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+
+from collections import defaultdict
+
+from utils.metrics import registry
+from . import snapshot
+from .compact import CompactGraph
+
+logger = logging.getLogger(__name__)
+
+build_seconds = registry.histogram(
+    'routing_graph_build_seconds', "Time to build the graph from the database or a snapshot, or to freeze it",
+    ('source',))
+
+
+class _State:
+    """Graph plus the per-line indexes needed to patch it"""
+
+    def __init__(self):
+        import networkx as nx
+
+        self.graph = nx.DiGraph()
+        self.line_stops = {}
+        self.edge_lines = defaultdict(dict)
+        self.node_lines = defaultdict(set)
+
+
+def _line_edges(stops):
+    return {(stops[i][0], stops[i + 1][0]): stops[i][2] for i in range(len(stops) - 1)}
+
+
+class RoutingGraph:
+    """Process-wide routing graph, built once and patched in place.
+
+    Every bus line keeps its ordered stops as (id_bus_station, seq, distance)
+    so a change to one line is turned into the edge insertions, deletions and
+    weight changes it implies. When two lines share a hop the graph keeps the
+    shortest distance. Updates hold `lock`; searches hold it only to
+    take the frozen copy they run on.
+
+    With `snapshot_path` set, the first build is restored from a snapshot
+    file taken at the database's current network_version, and a fresh
+    build writes one for the next worker.
+    """
+
+    def __init__(self, snapshot_path=None):
+        self.lock = threading.RLock()
+        self.version = 0
+        self.snapshot_path = snapshot_path
+        self._state = None
+        self._frozen = None
+
+    @property
+    def built(self):
+        return self._state is not None
+
+    def get(self, station_line):
+        """Return the graph, building it from the database on first use
+
+        Args:
+            station_line (StationLine): model used to load the schedules
+
+        Returns:
+            DiGraph: routing graph of all bus lines
+        """
+        with self.lock:
+            if self._state is None:
+                self._state = self._load(station_line)
+                self.version += 1
+            return self._state.graph
+
+    def frozen(self, station_line):
+        """Return a CompactGraph of the current graph, rebuilt after changes"""
+        with self.lock:
+            graph = self.get(station_line)
+            if self._frozen is None or self._frozen.version != self.version:
+                start = time.perf_counter()
+                self._frozen = CompactGraph.from_graph(graph, self.version)
+                build_seconds.observe(('freeze',), time.perf_counter() - start)
+            return self._frozen
+
+    def _load(self, station_line):
+        if not self.snapshot_path:
+            return self.build(station_line)
+        version = snapshot.data_version(station_line.conn)
+        if version is not None:
+            try:
+                restored = snapshot.read(self.snapshot_path, version)
+            except (OSError, snapshot.SnapshotError) as e:
+                logger.warning("Ignoring routing graph snapshot: %s", e)
+                restored = None
+            if restored is not None:
+                return self.restore(*restored)
+        state = self.build(station_line)
+        # only a build that saw no concurrent commit matches the version
+        if version is not None and snapshot.data_version(station_line.conn) == version:
+            self.save(state, version)
+        return state
+
+    def build(self, station_line):
+        """Load every bus line into a new state, without touching the current one"""
+        start = time.perf_counter()
+        state = _State()
+        for bus_line in station_line.get_all_id_bus_lines():
+            stations = station_line.get_all_schedules_by_id_bus_line(bus_line['id_bus_line'])
+            self._replace_line(state, bus_line['id_bus_line'], stations)
+        build_seconds.observe(('database',), time.perf_counter() - start)
+        return state
+
+    def restore(self, nodes, line_stops):
+        """Assemble a state from the contents of a snapshot"""
+        start = time.perf_counter()
+        state = _State()
+        for node, lat, lng, name in nodes:
+            state.graph.add_node(node, lat=lat, lng=lng, name=name)
+        for id_bus_line, stops in line_stops.items():
+            self._set_line_stops(state, id_bus_line, stops)
+        build_seconds.observe(('snapshot',), time.perf_counter() - start)
+        return state
+
+    def save(self, state, version, path=None):
+        """Write state to a snapshot tagged with the given network_version"""
+        path = path or self.snapshot_path
+        nodes = [(node, data['lat'], data['lng'], data['name']) for node, data in state.graph.nodes(data=True)]
+        try:
+            snapshot.write(path, nodes, state.line_stops, version)
+        except (OSError, snapshot.SnapshotError) as e:
+            logger.warning("Error writing routing graph snapshot: %s", e)
+            return False
+        return True
+
+    def swap(self, state, expected_version=None):
+        """Install a state returned by build, unless the graph changed meanwhile"""
+        with self.lock:
+            if expected_version is not None and expected_version != self.version:
+                return False
+            self._state = state
+            self.version += 1
+            return True
+
+    def invalidate(self):
+        with self.lock:
+            self._state = None
+
+    def refresh_line(self, station_line, id_bus_line, attempts=3):
+        """Reload one bus line's stops and patch the graph with the difference
+
+        The stops are read before taking the lock, so nothing waits on the
+        database while holding it. When another patch lands between the read
+        and the lock the read may be stale and is retried; after `attempts`
+        tries the graph is dropped and rebuilt on next use.
+        """
+        for _ in range(attempts):
+            version = self.version
+            if self._state is None:
+                return
+            stations = station_line.get_all_schedules_by_id_bus_line(id_bus_line)
+            with self.lock:
+                if self._state is None or self.version != version:
+                    continue
+                if stations is None:
+                    self._state = None
+                    return
+                self._replace_line(self._state, int(id_bus_line), stations)
+                self.version += 1
+                return
+        self.invalidate()
+
+    def upsert_stop(self, id_bus_line, id_bus_station, seq, distance):
+        """Insert or move one stop of a line
+
+        Returns:
+            bool: False when the station is not in the graph yet and the line
+                has to be reloaded instead
+        """
+        with self.lock:
+            state = self._state
+            if state is None:
+                return True
+            if id_bus_station not in state.graph:
+                return False
+            stops = [stop for stop in state.line_stops.get(id_bus_line, []) if stop[0] != id_bus_station]
+            stops.append((id_bus_station, seq, float(distance)))
+            self._set_line_stops(state, id_bus_line, sorted(stops, key=lambda stop: (stop[1], stop[0])))
+            self.version += 1
+            return True
+
+    def remove_stop(self, id_bus_line, id_bus_station):
+        with self.lock:
+            state = self._state
+            if state is None or id_bus_line not in state.line_stops:
+                return
+            self._set_line_stops(state, id_bus_line, [
+                stop for stop in state.line_stops[id_bus_line] if stop[0] != id_bus_station])
+            self.version += 1
+
+    def remove_line(self, id_bus_line):
+        with self.lock:
+            if self._state is None:
+                return
+            self._set_line_stops(self._state, id_bus_line, [])
+            self.version += 1
+
+    def move_station(self, id_bus_station, lat, lng, name):
+        with self.lock:
+            if self._state is None or id_bus_station not in self._state.graph:
+                return
+            self._state.graph.nodes[id_bus_station].update(lat=lat, lng=lng, name=name)
+            self.version += 1
+
+    def remove_station(self, id_bus_station):
+        with self.lock:
+            state = self._state
+            if state is None:
+                return
+            for id_bus_line in list(state.node_lines.get(id_bus_station, ())):
+                self._set_line_stops(state, id_bus_line, [
+                    stop for stop in state.line_stops[id_bus_line] if stop[0] != id_bus_station])
+            self.version += 1
+
+    def snapshot(self):
+        """Nodes with attributes and edges with weights, for consistency checks"""
+        with self.lock:
+            if self._state is None:
+                return None
+            return self.describe(self._state)
+
+    @staticmethod
+    def describe(state):
+        return (dict(state.graph.nodes(data=True)),
+                {(u, v): data['weight'] for u, v, data in state.graph.edges(data=True)})
+
+    def _replace_line(self, state, id_bus_line, stations):
+        for station in stations:
+            if station.id_bus_station not in state.graph:
+                state.graph.add_node(station.id_bus_station,
+                                     lat=station.lat, lng=station.long, name=station.name)
+        self._set_line_stops(state, int(id_bus_line), [
+            (station.id_bus_station, station.seq, float(station.distance)) for station in stations])
+
+    def _set_line_stops(self, state, id_bus_line, stops):
+        G = state.graph
+        old_stops = state.line_stops.pop(id_bus_line, [])
+        if stops:
+            state.line_stops[id_bus_line] = stops
+        old_edges, new_edges = _line_edges(old_stops), _line_edges(stops)
+        for edge in old_edges.keys() - new_edges.keys():
+            state.edge_lines[edge].pop(id_bus_line, None)
+            self._set_edge(state, edge)
+        for edge, weight in new_edges.items():
+            if old_edges.get(edge) != weight:
+                state.edge_lines[edge][id_bus_line] = weight
+                self._set_edge(state, edge)
+        new_nodes = {stop[0] for stop in stops}
+        for node in new_nodes:
+            state.node_lines[node].add(id_bus_line)
+        for node in {stop[0] for stop in old_stops} - new_nodes:
+            lines = state.node_lines[node]
+            lines.discard(id_bus_line)
+            if not lines:
+                del state.node_lines[node]
+                if G.has_node(node):
+                    G.remove_node(node)
+
+    @staticmethod
+    def _set_edge(state, edge):
+        weights = state.edge_lines.get(edge)
+        if weights:
+            state.graph.add_edge(*edge, weight=min(weights.values()))
+            return
+        state.edge_lines.pop(edge, None)
+        if state.graph.has_edge(*edge):
+            state.graph.remove_edge(*edge)
+
+
+routing_graph = RoutingGraph()
+
+
+def _graph_size():
+    with routing_graph.lock:
+        state = routing_graph._state
+        if state is None:
+            return {}
+        return {('nodes',): state.graph.number_of_nodes(), ('edges',): state.graph.number_of_edges()}
+
+
+registry.gauge('routing_graph_version', "Builds and patches applied to the routing graph",
+               lambda: routing_graph.version)
+registry.gauge('routing_graph_size', "Stations and hops in the routing graph", _graph_size, ('kind',))
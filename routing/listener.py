@@ -0,0 +1,137 @@
+import json
+import logging
+import select
+import threading
+import weakref
+
+import psycopg2
+import psycopg2.extensions
+
+from . import events
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'network_changes'
+
+
+class ChangeListener:
+    """Turns network_changes notifications from other workers into events.
+
+    Runs LISTEN on a dedicated autocommit connection in a daemon thread.
+    Notifications sent by this process's own connections are skipped, their
+    writes already emitted events locally. A batch larger than `max_batch`
+    (a bulk import, say) or a reconnect is reported as NetworkChanged.
+    """
+
+    def __init__(self, connect=None, max_batch=1000, timeout=5):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.received = 0
+        self._own = weakref.WeakKeyDictionary()
+        self._own_lock = threading.Lock()
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ignore(self, conn):
+        """Skip notifications caused by writes made through conn, for as
+        long as it stays open"""
+        with self._own_lock:
+            self._own[conn] = conn.get_backend_pid()
+
+    def _own_pids(self):
+        with self._own_lock:
+            return {pid for conn, pid in self._own.items() if not conn.closed}
+
+    def start(self):
+        if self.connect and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name='network-listener', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self):
+        conn = self.connect()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL};")
+        return conn
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._conn = self._listen()
+                self.poll_forever()
+            except psycopg2.Error as e:
+                logger.warning("Error listening for network changes: %s", e)
+            finally:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            if self._stop.is_set():
+                break
+            # changes made while disconnected are lost
+            events.emit(events.NetworkChanged())
+            self._stop.wait(self.timeout)
+
+    def poll_forever(self):
+        conn = self._conn
+        while not self._stop.is_set():
+            if select.select([conn], [], [], self.timeout) == ([], [], []):
+                continue
+            conn.poll()
+            notifies, conn.notifies[:] = list(conn.notifies), []
+            own = self._own_pids()
+            self.dispatch([notify.payload for notify in notifies if notify.pid not in own], conn)
+
+    def dispatch(self, payloads, conn=None):
+        """Emit the events implied by a batch of notification payloads"""
+        if not payloads:
+            return
+        self.received += len(payloads)
+        if len(payloads) > self.max_batch:
+            events.emit(events.NetworkChanged(), conn)
+            return
+        pending = {}
+        for payload in payloads:
+            change = json.loads(payload)
+            for event in self._events(change, conn):
+                pending.pop(event, None)
+                pending[event] = None
+                if isinstance(event, events.NetworkChanged):
+                    events.emit(event, conn)
+                    return
+        for event in pending:
+            events.emit(event, conn)
+
+    def _events(self, change, conn):
+        table, op = change['table'], change['op']
+        keys = [row for row in (change['old'], change['new']) if row]
+        if op == 'TRUNCATE':
+            yield events.NetworkChanged()
+        elif table == 'station_line':
+            for row in keys:
+                yield events.LineChanged(row['id_bus_line'])
+        elif table == 'bus_lines' and op == 'DELETE':
+            yield events.LineRemoved(change['old']['id'])
+        elif table == 'bus_stations' and op == 'DELETE':
+            yield events.StationRemoved(change['old']['id'])
+        elif table == 'bus_stations' and op == 'UPDATE':
+            yield self._station_moved(change['new']['id'], conn)
+        elif table == 'users' and op != 'INSERT':
+            yield events.UserChanged(change['old']['id'])
+
+    @staticmethod
+    def _station_moved(id_bus_station, conn):
+        from models.bus_station import BusStation
+
+        station = BusStation(conn).get_bus_station_by_id(id_bus_station) if conn else None
+        if station is None:
+            return events.StationRemoved(id_bus_station)
+        return events.StationMoved(station.id, lat=station.lat, lng=station.long, name=station.name)
+
+
+listener = ChangeListener()
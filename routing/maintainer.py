@@ -0,0 +1,95 @@
+import logging
+import threading
+
+from . import events
+from .graph import routing_graph
+
+logger = logging.getLogger(__name__)
+
+
+class GraphMaintainer:
+    """Applies model change events to the cached routing graph in place.
+
+    A daemon thread periodically rebuilds the graph from the database on its
+    own connection and installs it only when it differs from the patched one,
+    as a consistency check for writes that bypass the models.
+    """
+
+    def __init__(self, graph=routing_graph, connect=None, interval=600):
+        self.graph = graph
+        self.connect = connect
+        self.interval = interval
+        self.repairs = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        events.subscribe(self.apply)
+        if self.connect and self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._run, name='routing-consistency', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        events.unsubscribe(self.apply)
+        self._stop.set()
+
+    def apply(self, event, conn=None):
+        graph = self.graph
+        if isinstance(event, events.StopChanged):
+            if not graph.upsert_stop(event.id_bus_line, event.id_bus_station, event.seq, event.distance):
+                self._reload_line(event.id_bus_line, conn)
+        elif isinstance(event, events.StopRemoved):
+            graph.remove_stop(event.id_bus_line, event.id_bus_station)
+        elif isinstance(event, events.LineChanged):
+            self._reload_line(event.id_bus_line, conn)
+        elif isinstance(event, events.LineRemoved):
+            graph.remove_line(event.id_bus_line)
+        elif isinstance(event, events.StationMoved):
+            graph.move_station(event.id_bus_station, event.lat, event.lng, event.name)
+        elif isinstance(event, events.StationRemoved):
+            graph.remove_station(event.id_bus_station)
+        elif isinstance(event, events.NetworkChanged):
+            graph.invalidate()
+
+    def _reload_line(self, id_bus_line, conn):
+        from models.station_line import StationLine
+
+        if conn is None:
+            self.graph.invalidate()
+            return
+        self.graph.refresh_line(StationLine(conn), id_bus_line)
+
+    def check(self):
+        """Rebuild from the database and repair the cached graph if it drifted
+
+        Returns:
+            bool: True when the cached graph was consistent (or not built)
+        """
+        from models.station_line import StationLine
+
+        if not self.graph.built:
+            return True
+        version = self.graph.version
+        conn = self.connect()
+        try:
+            state = self.graph.build(StationLine(conn))
+        finally:
+            conn.close()
+        current = self.graph.snapshot()
+        if current is None or current == self.graph.describe(state):
+            return True
+        if self.graph.swap(state, expected_version=version):
+            self.repairs += 1
+            logger.warning("Routing graph drifted from the database, replaced it with a fresh build")
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Error checking routing graph consistency")
+
+
+maintainer = GraphMaintainer()
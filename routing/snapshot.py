@@ -0,0 +1,134 @@
+import math
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+from array import array
+
+import psycopg2
+
+MAGIC = b'BLGS'
+FORMAT_VERSION = 1
+
+# magic, format version, data version, nodes, lines, stops, name bytes, crc32
+HEADER = struct.Struct('<4sHxxQIIIII')
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is truncated or does not match its checksum"""
+
+
+def data_version(conn):
+    """Current network_version of the database, None before migration 0004"""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version FROM network_version;")
+            row = cursor.fetchone()
+        return row[0] if row else None
+    except psycopg2.Error:
+        conn.rollback()
+        return None
+
+
+def _pad(length):
+    return -length % 8
+
+
+def _sections(nodes, line_stops):
+    ids, lats, lngs, offsets, names = array('q'), array('d'), array('d'), array('I', [0]), bytearray()
+    for node, lat, lng, name in nodes:
+        ids.append(node)
+        lats.append(math.nan if lat is None else lat)
+        lngs.append(math.nan if lng is None else lng)
+        names += (name or '').encode('utf-8')
+        offsets.append(len(names))
+    lines, stop_offsets = array('q'), array('I', [0])
+    stations, seqs, distances = array('q'), array('i'), array('d')
+    for id_bus_line, stops in line_stops.items():
+        lines.append(id_bus_line)
+        for id_bus_station, seq, distance in stops:
+            stations.append(id_bus_station)
+            seqs.append(seq)
+            distances.append(distance)
+        stop_offsets.append(len(stations))
+    return [ids, lats, lngs, offsets, bytes(names), lines, stop_offsets, stations, seqs, distances]
+
+
+def write(path, nodes, line_stops, version):
+    """Write nodes [(id, lat, lng, name)] and {id_bus_line: [(id_bus_station,
+    seq, distance)]} atomically to path, tagged with the data version.
+    """
+    if sys.byteorder != 'little':
+        raise SnapshotError("Snapshots are only written on little-endian hosts")
+    sections = _sections(nodes, line_stops)
+    body = bytearray()
+    for section in sections:
+        data = section if isinstance(section, bytes) else section.tobytes()
+        body += data + bytes(_pad(len(data)))
+    checksum = zlib.crc32(body, zlib.crc32(struct.pack('<Q', version)))
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, version, len(sections[0]), len(sections[5]),
+                         len(sections[7]), len(sections[4]), checksum)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(body)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def read(path, version):
+    """Read a snapshot and decode it
+
+    Returns:
+        tuple: (nodes, line_stops) as given to write, or None when the file
+            is missing, from another format or taken at another data version
+    """
+    if sys.byteorder != 'little' or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise SnapshotError(f"{path} is truncated")
+    magic, format_version, snapshot_version, n_nodes, n_lines, n_stops, n_names, checksum = HEADER.unpack_from(data)
+    if magic != MAGIC or format_version != FORMAT_VERSION or snapshot_version != version:
+        return None
+    try:
+        with memoryview(data) as view, view[HEADER.size:] as body:
+            if zlib.crc32(body, zlib.crc32(struct.pack('<Q', version))) != checksum:
+                raise SnapshotError(f"{path} does not match its checksum")
+            return _decode(body, n_nodes, n_lines, n_stops, n_names)
+    except (struct.error, TypeError, IndexError) as e:
+        raise SnapshotError(f"{path} is truncated: {e}")
+
+
+def _decode(body, n_nodes, n_lines, n_stops, n_names):
+    position = 0
+
+    def take(typecode, count):
+        nonlocal position
+        size = struct.calcsize(typecode) * count
+        with body[position:position + size] as chunk, chunk.cast(typecode) as typed:
+            values = typed.tolist() if typecode != 'B' else bytes(typed)
+        position += size + _pad(size)
+        return values
+
+    ids, lats, lngs = take('q', n_nodes), take('d', n_nodes), take('d', n_nodes)
+    offsets, names = take('I', n_nodes + 1), take('B', n_names)
+    lines, stop_offsets = take('q', n_lines), take('I', n_lines + 1)
+    stations, seqs, distances = take('q', n_stops), take('i', n_stops), take('d', n_stops)
+    nodes = [(ids[i],
+              None if math.isnan(lats[i]) else lats[i],
+              None if math.isnan(lngs[i]) else lngs[i],
+              names[offsets[i]:offsets[i + 1]].decode('utf-8'))
+             for i in range(n_nodes)]
+    line_stops = {}
+    for i, id_bus_line in enumerate(lines):
+        start, end = stop_offsets[i], stop_offsets[i + 1]
+        line_stops[id_bus_line] = list(zip(stations[start:end], seqs[start:end], distances[start:end]))
+    return nodes, line_stops
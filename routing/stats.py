@@ -0,0 +1,35 @@
+from dataclasses import asdict, dataclass
+
+from utils.metrics import COUNT_BUCKETS, registry
+
+search_seconds = registry.histogram(
+    'routing_search_phase_seconds', "Shortest path time spent getting the graph and searching it", ('phase',))
+search_work = registry.histogram(
+    'routing_search_work', "Nodes settled, edges relaxed and heap pushes per shortest path search",
+    ('counter',), COUNT_BUCKETS)
+
+
+@dataclass(slots=True)
+class SearchStats:
+    """What one shortest path search cost"""
+    graph_version: int = 0
+    graph_seconds: float = 0.0
+    search_seconds: float = 0.0
+    settled: int = 0
+    relaxed: int = 0
+    pushes: int = 0
+    result_size: int = 0
+
+    def observe(self):
+        """Feed the search into the routing metrics"""
+        search_seconds.observe(('graph',), self.graph_seconds)
+        search_seconds.observe(('search',), self.search_seconds)
+        search_work.observe(('settled',), self.settled)
+        search_work.observe(('relaxed',), self.relaxed)
+        search_work.observe(('pushes',), self.pushes)
+
+    def as_dict(self):
+        stats = asdict(self)
+        stats['graph_ms'] = round(stats.pop('graph_seconds') * 1000, 3)
+        stats['search_ms'] = round(stats.pop('search_seconds') * 1000, 3)
+        return stats
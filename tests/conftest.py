@@ -0,0 +1,77 @@
+import os
+
+import psycopg2
+import pytest
+
+from flask_jwt_extended import create_access_token
+
+from benchmarks.network import generate
+from db import connect, migrate
+from models import MemoryStore, memory
+
+
+def small_network(seed):
+    """A network small enough to compare graphs row by row, with shared stops"""
+    return generate(stations=60, lines=6, stops_per_line=8, overlap=0.6, seed=seed)
+
+
+@pytest.fixture
+def network():
+    return small_network(seed=3)
+
+
+@pytest.fixture
+def other_network():
+    return small_network(seed=9)
+
+
+@pytest.fixture
+def store(network):
+    """A memory store of the small network, installed for the memory models"""
+    previous = memory.get_store() if memory._store is not None else None
+    yield memory.use(MemoryStore(network))
+    memory.use(previous)
+
+
+@pytest.fixture
+def app(store, monkeypatch):
+    """The app on the memory backend, without the per-process background threads"""
+    import server
+    from models import user
+
+    user.profiles.clear()
+    monkeypatch.setattr(server, 'storage_backend', 'memory')
+    monkeypatch.setattr(server, '_worker_pid', os.getpid())
+    app = server.create_app(preload_network=False)
+    app.config['TESTING'] = True
+    app.config['JWT_SECRET_KEY'] = 'test-secret-long-enough-for-hs256-keys'
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(app, store):
+    """Authorization header of an admin user added to the store"""
+    store.users.put({'id': 1, 'name': "Admin", 'email': "admin@example.com", 'password': None, 'is_admin': True})
+    with app.app_context():
+        return {'Authorization': f"Bearer {create_access_token(identity='1')}"}
+
+
+@pytest.fixture
+def pg_conn():
+    """Connection to TEST_DB_DATABASE, migrated. Tests replace its network,
+    so never point it at a database whose data matters."""
+    dbname = os.getenv('TEST_DB_DATABASE')
+    if not dbname:
+        pytest.skip("TEST_DB_DATABASE is not set")
+    try:
+        conn = connect(dbname=dbname)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"cannot connect to {dbname}: {e}")
+    migrate.upgrade(conn)
+    yield conn
+    conn.close()
@@ -0,0 +1,56 @@
+import io
+
+import pytest
+
+from utils import columnar
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def read_stream(response):
+    assert response.status_code == 200
+    assert response.mimetype == columnar.ARROW_STREAM
+    return pa.ipc.open_stream(response.get_data()).read_all()
+
+
+def test_bus_stations_as_arrow(client, store):
+    table = read_stream(client.get('/bus_stations?format=arrow'))
+    assert table.schema.names == ['id', 'name', 'long', 'lat', 'address', 'id_ward']
+    assert sorted(table.column('id').to_pylist()) == sorted(station.id for station in store.bus_stations.all())
+
+
+def test_accept_header(client, store):
+    table = read_stream(client.get('/bus_lines', headers={'Accept': columnar.ARROW_STREAM}))
+    assert table.num_rows == len(store.bus_lines.all())
+    assert client.get('/bus_lines', headers={'Accept': 'application/json'}).mimetype == columnar.JSON
+
+
+def test_schedules_as_parquet(client, store):
+    bus_line = store.bus_lines.all()[0].id
+    response = client.get(f'/bus_lines/{bus_line}/schedules?format=parquet')
+    assert response.mimetype == columnar.PARQUET
+    table = pq.read_table(io.BytesIO(response.get_data()))
+    assert set(table.column('id_bus_line').to_pylist()) == {bus_line}
+    assert table.column('seq').to_pylist() == sorted(table.column('seq').to_pylist())
+
+
+def test_export_defaults_to_arrow(client, store):
+    response = client.get('/export/schedules')
+    assert response.headers['Content-Disposition'].endswith('.arrows')
+    assert read_stream(response).num_rows == len(store.station_line.all())
+
+
+def test_empty_export(client, store):
+    for bus_station in store.bus_stations.all():
+        store.bus_stations.remove(bus_station.id)
+    table = read_stream(client.get('/export/bus_stations'))
+    assert table.num_rows == 0 and table.schema.names[0] == 'id'
+
+
+def test_not_acceptable(client, monkeypatch):
+    response = client.get('/bus_stations?format=csv')
+    assert response.status_code == 406
+    assert response.get_json()['message'] == "Requested format is not available"
+    monkeypatch.setattr(columnar, 'available', lambda: False)
+    assert client.get('/bus_stations?format=arrow').status_code == 406
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from models import NetworkImport, embedded, memory, read_bundle
+from models.embedded import Follower
+
+
+@pytest.fixture
+def path(tmp_path, network, store):
+    """A SQLite file holding the network, as a first sync leaves it"""
+    path = str(tmp_path / 'depot.sqlite3')
+    lite = embedded.connect(path)
+    with lite:
+        for table, columns in memory.TABLES.items():
+            embedded._insert(lite, table, [tuple(row.get(column) for column in columns)
+                                           for row in network.get(table, ())])
+        lite.execute("INSERT INTO sync_state (key, value) VALUES ('generation', '1');")
+    lite.close()
+    return path
+
+
+def change(path, sql, params, table, key):
+    lite = embedded.connect(path)
+    with lite:
+        lite.execute(sql, params)
+        lite.execute("INSERT INTO local_changes (table_name, key) VALUES (?, ?);", (table, json.dumps(key)))
+    return lite
+
+
+def test_poll_applies_keyed_changes(path, network):
+    follower = Follower(path)
+    store = follower.load()
+    first, second = network['bus_stations'][0]['id'], network['bus_stations'][1]['id']
+    lite = change(path, "UPDATE bus_stations SET name = 'Renamed' WHERE id = ?;", (first,), 'bus_stations', {'id': first})
+    change(path, "DELETE FROM bus_stations WHERE id = ?;", (second,), 'bus_stations', {'id': second}).close()
+    assert follower.poll(lite) == 2
+    assert memory.get_store() is store
+    assert store.bus_stations.get(first).name == 'Renamed'
+    assert store.bus_stations.get(second) is None
+    assert follower.poll(lite) == 0
+    lite.close()
+
+
+def test_poll_reloads_after_a_new_generation_or_trimmed_changes(path):
+    follower = Follower(path)
+    store = follower.load()
+    lite = embedded.connect(path)
+    with lite:
+        lite.execute("INSERT INTO sync_state (key, value) VALUES ('trimmed', ?);", (str(follower.position + 5),))
+    follower.poll(lite)
+    assert memory.get_store() is not store
+    assert follower.position == 5, "a reload must not leave the follower behind the trimmed changes"
+    store = memory.get_store()
+    with lite:
+        lite.execute("UPDATE sync_state SET value = '2' WHERE key = 'generation';")
+    follower.poll(lite)
+    assert memory.get_store() is not store
+    lite.close()
+
+
+def test_sync_trims_changes_followers_had_a_sync_to_apply(pg_conn, network, tmp_path, store):
+    with read_bundle(network) as opened:
+        NetworkImport(pg_conn).import_bundle(opened, replace=True)
+    path = str(tmp_path / 'depot.sqlite3')
+    station = network['bus_stations'][0]['id']
+    embedded.sync(pg_conn, path)
+    ids = []
+    for name in ('A', 'B', 'C'):
+        with pg_conn.cursor() as cursor:
+            cursor.execute("UPDATE bus_stations SET name = %s WHERE id = %s;", (name, station))
+        pg_conn.commit()
+        assert embedded.sync(pg_conn, path)['mode'] == 'incremental'
+        lite = embedded.connect(path)
+        ids.append(lite.execute("SELECT max(id) FROM local_changes;").fetchone()[0])
+        lite.close()
+    lite = embedded.connect(path)
+    kept = [row[0] for row in lite.execute("SELECT id FROM local_changes ORDER BY id;")]
+    assert kept == ids[1:], "only the changes of the last two syncs are kept"
+    assert dict(lite.execute("SELECT key, value FROM sync_state;"))['trimmed'] == str(ids[0])
+    lite.close()
@@ -0,0 +1,43 @@
+import io
+
+from models import GTFS, NetworkImport, read_bundle
+
+
+def rows(conn, query):
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+def exported(conn):
+    feed = io.BytesIO()
+    GTFS(conn).export_feed(feed)
+    conn.rollback()
+    feed.seek(0)
+    return feed
+
+
+def test_replace_keeps_numeric_ids(pg_conn, network, other_network):
+    with read_bundle(network) as opened:
+        NetworkImport(pg_conn).import_bundle(opened, replace=True)
+    feed = exported(pg_conn)
+    with read_bundle(other_network) as opened:
+        NetworkImport(pg_conn).import_bundle(opened, replace=True)
+    GTFS(pg_conn).import_feed(feed, replace=True)
+    assert [row[0] for row in rows(pg_conn, "SELECT id FROM bus_stations ORDER BY id;")] == \
+        [station['id'] for station in network['bus_stations']]
+
+
+def test_merge_never_overwrites_existing_rows(pg_conn, network):
+    with read_bundle(network) as opened:
+        NetworkImport(pg_conn).import_bundle(opened, replace=True)
+    stations = rows(pg_conn, "SELECT id, name, long, lat FROM bus_stations ORDER BY id;")
+    lines = rows(pg_conn, "SELECT id, name FROM bus_lines ORDER BY id;")
+    stops = rows(pg_conn, "SELECT * FROM station_line ORDER BY id_bus_line, seq;")
+    counts = GTFS(pg_conn).import_feed(exported(pg_conn))
+    assert rows(pg_conn, f"SELECT id, name, long, lat FROM bus_stations WHERE id <= {stations[-1][0]} ORDER BY id;") \
+        == stations
+    assert rows(pg_conn, f"SELECT id, name FROM bus_lines WHERE id <= {lines[-1][0]} ORDER BY id;") == lines
+    assert rows(pg_conn, f"SELECT * FROM station_line WHERE id_bus_line <= {lines[-1][0]} "
+                         "ORDER BY id_bus_line, seq;") == stops
+    assert len(rows(pg_conn, "SELECT id FROM bus_lines;")) == len(lines) + counts['bus_lines']
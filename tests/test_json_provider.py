@@ -0,0 +1,61 @@
+import datetime
+import json
+
+from decimal import Decimal
+
+import pytest
+
+from flask import Flask
+
+from models.records import BusLineRecord
+from utils import json_provider
+from utils.json_provider import JSONProvider, RawJSON
+
+LINE = BusLineRecord(id=1, name='Line 1', length=Decimal('12.50'), price=Decimal('7000'), number_of_trips=40,
+                     time_between_trips=15, start_time_first=datetime.time(5, 30))
+
+EXPECTED = {'id': 1, 'name': 'Line 1', 'length': '12.50', 'price': '7000', 'number_of_trips': 40,
+            'time_between_trips': 15, 'start_time_first': '05:30:00'}
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def provider(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    elif json_provider.orjson is None:
+        pytest.skip('orjson is not installed')
+    app = Flask(__name__)
+    app.json = JSONProvider(app)
+    # the provider only holds a weak reference to its app, keep it alive
+    yield app.json
+
+
+def test_decimals_are_strings(provider):
+    assert json.loads(provider.dumps({'distance': Decimal('1.10'), 'whole': Decimal('3')})) == \
+        {'distance': '1.10', 'whole': '3'}
+
+
+def test_records_and_times(provider):
+    assert json.loads(provider.dumps({'data': [LINE]})) == {'data': [EXPECTED]}
+
+
+def test_timedelta_is_seconds(provider):
+    assert json.loads(provider.dumps(datetime.timedelta(minutes=2, seconds=3))) == 123
+
+
+def test_raw_json_is_spliced(provider):
+    text = json.dumps([{'id': 1, 'length': '12.50'}])
+    assert json.loads(provider.dumps({'message': 'ok', 'data': RawJSON(text)})) == \
+        {'message': 'ok', 'data': [{'id': 1, 'length': '12.50'}]}
+
+
+def test_response(provider):
+    with provider._app.app_context():
+        response = provider.response({'data': LINE})
+    assert response.mimetype == 'application/json'
+    assert json.loads(response.get_data()) == {'data': EXPECTED}
+
+
+def test_unknown_type(provider):
+    with pytest.raises(TypeError):
+        provider.dumps({'data': object()})
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import pytest
+
+from db import connect
+from models import NetworkImport, read_bundle
+from routing import events
+from routing.listener import ChangeListener
+
+
+@pytest.fixture
+def emitted():
+    """Events delivered to subscribers while the test runs"""
+    received = []
+
+    def record(event, conn):
+        received.append(event)
+
+    events.subscribe(record)
+    yield received
+    events.unsubscribe(record)
+
+
+def payload(table, op, old=None, new=None):
+    return json.dumps({'table': table, 'op': op, 'old': old, 'new': new})
+
+
+def test_changes_become_events(emitted):
+    ChangeListener().dispatch([
+        payload('station_line', 'UPDATE', {'id_bus_line': 4, 'id_bus_station': 1},
+                {'id_bus_line': 5, 'id_bus_station': 1}),
+        payload('station_line', 'INSERT', new={'id_bus_line': 4, 'id_bus_station': 2}),
+        payload('bus_lines', 'DELETE', old={'id': 6}),
+        payload('bus_lines', 'UPDATE', {'id': 7}, {'id': 7}),
+        payload('bus_stations', 'DELETE', old={'id': 8}),
+        payload('users', 'INSERT', new={'id': 9}),
+        payload('users', 'UPDATE', {'id': 10}, {'id': 10}),
+    ])
+    assert emitted == [events.LineChanged(5), events.LineChanged(4), events.LineRemoved(6),
+                       events.StationRemoved(8), events.UserChanged(10)]
+
+
+def test_truncate_is_a_network_change(emitted):
+    ChangeListener().dispatch([
+        payload('bus_lines', 'DELETE', old={'id': 6}),
+        payload('station_line', 'TRUNCATE'),
+        payload('bus_lines', 'DELETE', old={'id': 7}),
+    ])
+    assert emitted == [events.NetworkChanged()]
+
+
+def test_large_batch_is_a_network_change(emitted):
+    listener = ChangeListener(max_batch=2)
+    listener.dispatch([payload('bus_lines', 'DELETE', old={'id': i}) for i in range(3)])
+    assert emitted == [events.NetworkChanged()]
+    assert listener.received == 3
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_notifications_from_other_connections(pg_conn, network, emitted):
+    with read_bundle(network) as opened:
+        NetworkImport(pg_conn).import_bundle(opened, replace=True)
+    emitted.clear()
+    own, other = network['bus_stations'][0]['id'], network['bus_stations'][1]['id']
+    listener = ChangeListener(connect=lambda: connect(dbname=os.getenv('TEST_DB_DATABASE')), timeout=0.1)
+    listener.ignore(pg_conn)
+    listener.start()
+    writer = connect(dbname=os.getenv('TEST_DB_DATABASE'))
+    try:
+        assert wait_for(lambda: listener._conn is not None)
+        for conn, station in ((pg_conn, own), (writer, other)):
+            with conn.cursor() as cursor:
+                cursor.execute("UPDATE bus_stations SET name = 'Moved' WHERE id = %s;", (station,))
+            conn.commit()
+        assert wait_for(lambda: events.StationMoved in map(type, emitted))
+    finally:
+        listener.stop()
+        writer.close()
+    assert listener.received == 1, "the listener's own connection was not skipped"
+    assert [(event.id_bus_station, event.name) for event in emitted] == [(other, 'Moved')]
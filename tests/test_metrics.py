@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from utils import metrics
+from utils.metrics import Registry
+
+
+def test_counter():
+    registry = Registry()
+    counter = registry.counter('jobs_total', "Jobs by queue", ('queue',))
+    counter.inc(('b',))
+    counter.inc(('a "quoted"\\',), 2)
+    counter.inc(('b',))
+    assert registry.render().splitlines() == [
+        '# HELP jobs_total Jobs by queue',
+        '# TYPE jobs_total counter',
+        'jobs_total{queue="a \\"quoted\\"\\\\"} 2',
+        'jobs_total{queue="b"} 2',
+    ]
+
+
+def test_histogram():
+    registry = Registry()
+    histogram = registry.histogram('wait_seconds', "Wait", buckets=(.1, 1))
+    for value in (.05, .1, .5, 3):
+        histogram.observe((), value)
+    assert registry.render().splitlines()[2:] == [
+        'wait_seconds_bucket{le="0.1"} 2',
+        'wait_seconds_bucket{le="1"} 3',
+        'wait_seconds_bucket{le="+Inf"} 4',
+        'wait_seconds_sum 3.65',
+        'wait_seconds_count 4',
+    ]
+
+
+def test_shards_are_summed():
+    registry = Registry()
+    counter = registry.counter('hits_total', "Hits")
+    threads = [threading.Thread(target=lambda: [counter.inc() for _ in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 'hits_total 4000' in registry.render().splitlines()
+
+
+def test_gauges():
+    registry = Registry()
+    registry.gauge('size', "Size", lambda: {('nodes',): 3, ('edges',): None}, ('kind',))
+    registry.gauge('broken', "Broken", lambda: 1 / 0)
+    registry.gauge('version', "Version", lambda: 7)
+    assert registry.render().splitlines() == [
+        '# HELP size Size', '# TYPE size gauge', 'size{kind="nodes"} 3',
+        '# HELP version Version', '# TYPE version gauge', 'version 7',
+    ]
+
+
+def test_names_are_unique():
+    registry = Registry()
+    registry.counter('jobs_total', "Jobs")
+    with pytest.raises(ValueError):
+        registry.counter('jobs_total', "Jobs again")
+
+
+@metrics.timed_methods
+class Model:
+    def find(self):
+        return metrics.model_calls.get()
+
+    def fail(self):
+        raise LookupError
+
+    def batches(self):
+        yield metrics.model_calls.get()
+        yield metrics.model_calls.get()
+
+
+def samples(metric, labels):
+    return metric._merged().get(labels)
+
+
+def test_timed_methods():
+    before = samples(metrics.model_duration, ('Model.find',))
+    assert Model().find() == ('Model.find',)
+    assert metrics.model_calls.get() == ()
+    counts = samples(metrics.model_duration, ('Model.find',))[0]
+    assert sum(counts) == (sum(before[0]) if before else 0) + 1
+    errors = samples(metrics.model_errors, ('Model.fail',)) or 0
+    with pytest.raises(LookupError):
+        Model().fail()
+    assert samples(metrics.model_errors, ('Model.fail',)) == errors + 1
+
+
+def test_timed_generators():
+    batches = Model().batches()
+    assert next(batches) == ('Model.batches',)
+    assert metrics.model_calls.get() == (), "set between the batches"
+    assert list(batches) == [('Model.batches',)]
+
+
+def test_metrics_endpoint(client):
+    assert client.get('/bus_stations').status_code == 200
+    client.get('/no/such/page')
+    response = client.get('/metrics')
+    assert response.content_type == metrics.CONTENT_TYPE
+    lines = response.get_data(as_text=True).splitlines()
+    assert '# TYPE http_requests_total counter' in lines
+    assert any(line.startswith('http_requests_total{endpoint="stations.get_all_bus_stations",method="GET",'
+                               'status="200"}') for line in lines)
+    assert any(line.startswith('http_requests_total{endpoint="unmatched",method="GET",status="404"}')
+               for line in lines)
+    assert any(line.startswith('http_request_duration_seconds_count{endpoint="stations.get_all_bus_stations"')
+               for line in lines)
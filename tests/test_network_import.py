@@ -0,0 +1,86 @@
+import pytest
+
+from models import BundleError, NetworkImport, read_bundle
+
+
+def stops_by_line(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT id_bus_line, id_bus_station, seq FROM station_line ORDER BY id_bus_line, seq;")
+        rows = cursor.fetchall()
+    lines = {}
+    for id_bus_line, id_bus_station, seq in rows:
+        lines.setdefault(id_bus_line, []).append((id_bus_station, seq))
+    return lines
+
+
+def load(conn, bundle, replace=False):
+    with read_bundle(bundle) as opened:
+        return NetworkImport(conn).import_bundle(opened, replace=replace)
+
+
+def test_replace_swaps_the_whole_network(pg_conn, network, other_network):
+    load(pg_conn, other_network, replace=True)
+    counts = load(pg_conn, network, replace=True)
+    assert counts == {table: len(network[table]) for table in ('bus_stations', 'bus_lines', 'station_line')}
+    expected = {}
+    for stop in network['station_line']:
+        expected.setdefault(stop['id_bus_line'], []).append((stop['id_bus_station'], stop['seq']))
+    assert stops_by_line(pg_conn) == {line: sorted(stops, key=lambda stop: stop[1])
+                                      for line, stops in expected.items()}
+
+
+def test_merge_of_line_fields_keeps_their_stops(pg_conn, network):
+    load(pg_conn, network, replace=True)
+    before = stops_by_line(pg_conn)
+    renamed = [dict(line, name=f"{line['name']} renamed") for line in network['bus_lines'][:2]]
+    load(pg_conn, {'bus_lines': renamed})
+    assert stops_by_line(pg_conn) == before
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM bus_lines WHERE id = %s;", (renamed[0]['id'],))
+        assert cursor.fetchone()[0] == renamed[0]['name']
+
+
+def test_merge_replaces_only_the_stops_of_lines_in_the_bundle(pg_conn, network):
+    load(pg_conn, network, replace=True)
+    before = stops_by_line(pg_conn)
+    line = network['bus_lines'][0]['id']
+    kept = [stop for stop in network['station_line'] if stop['id_bus_line'] == line][:3]
+    load(pg_conn, {'station_line': kept})
+    after = stops_by_line(pg_conn)
+    assert after[line] == [(stop['id_bus_station'], stop['seq']) for stop in kept]
+    assert {key: value for key, value in after.items() if key != line} == \
+        {key: value for key, value in before.items() if key != line}
+
+
+def test_merge_rejects_stops_of_unknown_stations(pg_conn, network):
+    load(pg_conn, network, replace=True)
+    before = stops_by_line(pg_conn)
+    bad = [{'id_bus_station': 10 ** 6, 'id_bus_line': network['bus_lines'][0]['id'], 'seq': 1, 'distance': 0}]
+    with pytest.raises(BundleError, match="Unknown bus station"):
+        load(pg_conn, {'station_line': bad})
+    assert stops_by_line(pg_conn) == before
+
+
+@pytest.mark.parametrize('bundle', [{'bus_lines': [1, 2]}, {'bus_lines': 'x'}, [1]])
+def test_malformed_bundles_raise_bundle_error(bundle):
+    with pytest.raises(BundleError):
+        with read_bundle(bundle):
+            pass
+
+
+def test_directory_bundle_files_are_closed(tmp_path):
+    (tmp_path / 'bus_lines.csv').write_text("id,name\n")
+    with read_bundle(str(tmp_path)) as bundle:
+        stream = bundle['bus_lines']
+        assert not stream.closed
+    assert stream.closed
+
+
+def test_missing_required_column_is_a_bundle_error(pg_conn, network):
+    load(pg_conn, network, replace=True)
+    before = stops_by_line(pg_conn)
+    nameless = [{key: value for key, value in station.items() if key != 'name'}
+                for station in network['bus_stations'][:1]]
+    with pytest.raises(BundleError, match='"name"'):
+        load(pg_conn, {'bus_stations': nameless})
+    assert stops_by_line(pg_conn) == before
@@ -0,0 +1,68 @@
+import contextlib
+import threading
+
+import pytest
+
+from models import user
+from utils.passwords import HashPool, HashPoolBusy
+
+FAST = 'pbkdf2:sha256:1000'
+
+
+@contextlib.contextmanager
+def occupied(pool, calls=1):
+    """Hold `calls` of the pool's slots with hashes that wait for the block to end"""
+    started, release = threading.Semaphore(0), threading.Event()
+
+    def hold():
+        started.release()
+        release.wait(5)
+
+    threads = [threading.Thread(target=pool._run, args=(hold,)) for _ in range(calls)]
+    for thread in threads:
+        thread.start()
+    for _ in range(min(calls, pool.workers)):
+        assert started.acquire(timeout=5)
+    try:
+        yield
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_hash_and_verify():
+    pool = HashPool(FAST)
+    pwhash = pool.hash('secret')
+    assert pool.verify(pwhash, 'secret') and not pool.verify(pwhash, 'other')
+    assert not pool.needs_rehash(pwhash)
+    assert HashPool('pbkdf2:sha256:2000').needs_rehash(pwhash)
+
+
+def test_inline_without_workers():
+    pool = HashPool(FAST, workers=0)
+    assert pool.verify(pool.hash('secret'), 'secret')
+    assert pool._executor is None
+
+
+def test_full_pool_rejects_instead_of_queueing():
+    pool = HashPool(FAST, workers=1, queue=1, retry_after=3)
+    with occupied(pool, calls=2):
+        with pytest.raises(HashPoolBusy) as busy:
+            pool.hash('secret')
+        assert busy.value.retry_after == 3
+    assert pool.rejected == 1
+    assert pool.verify(pool.hash('secret'), 'secret'), "slots were not given back"
+
+
+def test_busy_login_is_503(client, monkeypatch):
+    pool = HashPool(FAST, workers=1, queue=0, retry_after=3)
+    monkeypatch.setattr(user, 'hasher', pool)
+    credentials = {'email': 'rider@example.com', 'name': 'Rider', 'password': 'secret'}
+    assert client.post('/auth/register', json=credentials).status_code == 200
+    with occupied(pool):
+        response = client.post('/auth/login', json=credentials)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.get_json()['message'] == "Too many logins in progress, please retry"
+    assert client.post('/auth/login', json=credentials).status_code == 200
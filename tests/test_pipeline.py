@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.fixture
+def ward(store):
+    store.load_dict({'districts': [{'id': '0001', 'name': "District 1"}],
+                     'wards': [{'id_ward': '01', 'id_district': '0001', 'name': "Ward 1"}]})
+    return '000101'
+
+
+def test_success_envelope(client, ward):
+    response = client.get(f"/wards/{ward}")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'message': "Successfully retrieved a ward",
+        'data': {'id_ward': '01', 'id_district': '0001', 'name': "Ward 1"},
+    }
+
+
+def test_not_found_envelope(client, ward):
+    response = client.get("/wards/000102")
+    assert response.status_code == 404
+    assert response.get_json() == {'message': "ward not found", 'error': "Not found", 'data': None}
+
+
+def test_update_ward(client, auth_headers, store, ward):
+    response = client.put(f"/wards/{ward}", json={'name': "Renamed"}, headers=auth_headers)
+    assert response.status_code == 201
+    assert response.get_json()['message'] == "Successfully updated a ward"
+    assert store.wards.get(('01', '0001')).name == "Renamed"
+
+
+def test_update_missing_ward(client, auth_headers, ward):
+    response = client.put("/wards/000102", json={'name': "Renamed"}, headers=auth_headers)
+    assert response.status_code == 404
+    assert response.get_json()['error'] == "Not found"
+
+
+def test_delete_ward(client, auth_headers, store, ward):
+    response = client.delete(f"/wards/{ward}", headers=auth_headers)
+    assert response.status_code == 204
+    assert store.wards.get(('01', '0001')) is None
+
+
+def test_writes_need_a_token(client, store, ward):
+    response = client.delete(f"/wards/{ward}")
+    assert response.status_code == 401
+    assert store.wards.get(('01', '0001')) is not None
+
+
+def test_http_exception_envelope(client, auth_headers, ward):
+    response = client.put(f"/wards/{ward}", data="name=Renamed", headers=auth_headers)
+    assert response.status_code == 415
+    body = response.get_json()
+    assert body['error'] == "Unsupported Media Type"
+    assert body['data'] is None
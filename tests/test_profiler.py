@@ -0,0 +1,49 @@
+import threading
+import time
+
+from utils import profiler
+
+
+def busy_until(event):
+    while not event.is_set():
+        sum(range(1000))
+
+
+def wait_for(client, location, headers, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(location, headers=headers)
+        if response.status_code != 202 or time.monotonic() > deadline:
+            return response
+        time.sleep(0.05)
+
+
+def test_samples_other_threads_in_the_background(client, auth_headers, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    done = threading.Event()
+    worker = threading.Thread(target=busy_until, args=(done,))
+    worker.start()
+    try:
+        response = client.post("/debug/profile?seconds=0.3&interval=0.005", headers=auth_headers)
+        assert response.status_code == 202
+        location = response.get_json()['data']['location']
+        assert client.get(location, headers=auth_headers).status_code == 202
+        assert client.post("/debug/profile?seconds=0.3", headers=auth_headers).status_code == 409
+        response = wait_for(client, location, headers=auth_headers)
+    finally:
+        done.set()
+        worker.join()
+    assert response.status_code == 200
+    assert int(response.headers['X-Profile-Samples']) > 0
+    assert 'busy_until' in response.get_data(as_text=True)
+
+
+def test_unknown_profile(client, auth_headers):
+    assert client.get("/debug/profile/1-2-deadbeef", headers=auth_headers).status_code == 404
+    assert client.get("/debug/profile/../etc", headers=auth_headers).status_code == 404
+
+
+def test_profile_needs_an_admin(client, auth_headers, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    store.users.get(1)['is_admin'] = False
+    assert client.post("/debug/profile?seconds=0.1", headers=auth_headers).status_code == 403
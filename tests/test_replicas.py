@@ -0,0 +1,99 @@
+import logging
+import time
+
+import psycopg2
+import pytest
+
+from api import pipeline
+
+
+class FakePool:
+    """Pool handing out its own name as the connection"""
+
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+        self.out = 0
+
+    def getconn(self):
+        if self.error:
+            raise self.error
+        self.out += 1
+        return self.name
+
+    def putconn(self, conn):
+        assert conn == self.name
+        self.out -= 1
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    primary, replica = FakePool('primary'), FakePool('replica')
+    monkeypatch.setattr(pipeline, 'pool', primary)
+    monkeypatch.setattr(pipeline, 'replica_pools', [replica])
+    monkeypatch.setattr(pipeline, '_fallbacks', {'logged_at': 0.0, 'suppressed': 0})
+    return primary, replica
+
+
+def routed(app, method='GET', cookie=None):
+    """Connection get_conn checks out for a request, and the route it counted"""
+    headers = {'Cookie': f"{pipeline.STICKY_COOKIE}={cookie}"} if cookie is not None else {}
+    before = pipeline.connection_routes._merged()
+    with app.test_request_context('/bus_stations', method=method, headers=headers):
+        conn = pipeline.get_conn()
+        pipeline.release_conn()
+    after = pipeline.connection_routes._merged()
+    return conn, [labels for labels, count in after.items() if count != before.get(labels, 0)]
+
+
+def test_reads_go_to_a_replica(app, pools):
+    assert routed(app) == ('replica', [('replica', 'read')])
+    assert routed(app, 'HEAD')[0] == 'replica'
+
+
+def test_writes_go_to_the_primary(app, pools):
+    assert routed(app, 'PUT') == ('primary', [('primary', 'write')])
+
+
+def test_sticky_reads_go_to_the_primary(app, pools):
+    assert routed(app, cookie=time.time() + 5) == ('primary', [('primary', 'sticky')])
+    assert routed(app, cookie=time.time() - 1)[0] == 'replica', "the window is over"
+    assert routed(app, cookie='garbage')[0] == 'replica'
+
+
+def test_without_replicas(app, pools, monkeypatch):
+    monkeypatch.setattr(pipeline, 'replica_pools', [])
+    assert routed(app) == ('primary', [('primary', 'primary')])
+
+
+def test_unavailable_replica_falls_back(app, pools, caplog):
+    primary, replica = pools
+    replica.error = psycopg2.OperationalError("connection refused")
+    with caplog.at_level(logging.WARNING, logger=pipeline.logger.name):
+        assert routed(app) == ('primary', [('primary', 'fallback')])
+        routed(app)
+    assert len(caplog.records) == 1, "fallback warnings are rate limited"
+    assert pipeline._fallbacks['suppressed'] == 1
+    assert primary.out == 0, "the connection went back to the pool it came from"
+
+
+def test_unavailable_primary_raises(app, pools):
+    primary, _ = pools
+    primary.error = psycopg2.OperationalError("connection refused")
+    with pytest.raises(psycopg2.OperationalError):
+        routed(app, 'POST')
+
+
+def test_write_sets_the_sticky_cookie(client, store, auth_headers, pools):
+    station = store.bus_stations.all()[0]
+    body = {'name': station.name, 'long': station.long, 'lat': station.lat, 'address': station.address,
+            'id_ward': station.id_ward}
+    response = client.put(f'/bus_stations/{station.id}', json=body, headers=auth_headers)
+    assert response.status_code == 201
+    cookie = response.headers['Set-Cookie']
+    assert cookie.startswith(f"{pipeline.STICKY_COOKIE}=") and 'HttpOnly' in cookie
+    until = float(cookie.split(';')[0].split('=')[1])
+    assert time.time() < until <= time.time() + pipeline.sticky_seconds
+    assert 'Set-Cookie' not in client.get(f'/bus_stations/{station.id}').headers
+    failed = client.put('/bus_stations/0', json=body, headers=auth_headers)
+    assert failed.status_code == 404 and 'Set-Cookie' not in failed.headers
@@ -0,0 +1,68 @@
+from decimal import Decimal
+
+import pytest
+
+from models import NetworkImport, StationLine, read_bundle
+from models.memory import MemoryStationLine
+
+
+@pytest.fixture(params=['memory', 'postgres'])
+def station_line(request, network):
+    if request.param == 'memory':
+        return MemoryStationLine(request.getfixturevalue('store'))
+    conn = request.getfixturevalue('pg_conn')
+    with read_bundle(network) as bundle:
+        NetworkImport(conn).import_bundle(bundle, replace=True)
+    return StationLine(conn)
+
+
+def stops(station_line, line):
+    return [(schedule.id_bus_station, schedule.seq, Decimal(str(schedule.distance)), schedule.start_time_first)
+            for schedule in station_line.get_all_schedules_by_id_bus_line(line)]
+
+
+def request_of(current):
+    """resequence payload that keeps the current order, distances and start times"""
+    return [{'id_bus_station': station, 'distance': str(distance), 'start_time_first': start.isoformat()}
+            for station, _, distance, start in current]
+
+
+@pytest.fixture
+def line(network):
+    return network['bus_lines'][0]['id']
+
+
+def test_unchanged_sequence_touches_nothing(station_line, line):
+    current = stops(station_line, line)
+    assert station_line.resequence(line, request_of(current)) == {'removed': 0, 'upserted': 0}
+    assert stops(station_line, line) == current
+
+
+def test_swapping_two_stops_upserts_only_those(station_line, line):
+    payload = request_of(stops(station_line, line))
+    payload[0], payload[1] = payload[1], payload[0]
+    assert station_line.resequence(line, payload) == {'removed': 0, 'upserted': 2}
+    assert [stop[0] for stop in stops(station_line, line)] == [stop['id_bus_station'] for stop in payload]
+
+
+def test_dropped_stops_are_removed_and_new_ones_added(station_line, line, network):
+    current = stops(station_line, line)
+    on_line = {stop[0] for stop in current}
+    new = next(station['id'] for station in network['bus_stations'] if station['id'] not in on_line)
+    payload = request_of(current[:-2]) + [{'id_bus_station': new, 'distance': '1.25'}]
+    assert station_line.resequence(line, payload) == {'removed': 2, 'upserted': 1}
+    assert stops(station_line, line) == current[:-2] + [(new, len(current) - 1, Decimal('1.25'), None)]
+
+
+def test_distance_change_is_an_upsert(station_line, line):
+    payload = request_of(stops(station_line, line))
+    payload[3]['distance'] = '9.99'
+    assert station_line.resequence(line, payload) == {'removed': 0, 'upserted': 1}
+    assert stops(station_line, line)[3][2] == Decimal('9.99')
+
+
+def test_unknown_station_changes_nothing(station_line, line):
+    current = stops(station_line, line)
+    payload = request_of(current) + [{'id_bus_station': 10 ** 6, 'distance': '1'}]
+    assert station_line.resequence(line, payload) is None
+    assert stops(station_line, line) == current
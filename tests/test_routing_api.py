@@ -0,0 +1,28 @@
+import re
+
+from decimal import Decimal
+
+from models.memory import MemoryStationLine
+
+CENTS = re.compile(r'\d+\.\d\d')
+
+
+def ends_of_first_line(store):
+    stops = MemoryStationLine(store)._stops(store.bus_lines.all()[0].id)
+    return stops[0].id_bus_station, stops[3].id_bus_station
+
+
+def test_distances_are_decimal_strings(client, store):
+    start, end = ends_of_first_line(store)
+    shortest = client.get(f"/routes/shortest?start={start}&end={end}").get_json()['data']
+    assert isinstance(shortest['distance'], str) and CENTS.fullmatch(shortest['distance'])
+    paths = client.get(f"/routes?start={start}&end={end}").get_json()['data']
+    weights = [path['total_weight'] for path in paths]
+    assert weights and all(isinstance(weight, str) and CENTS.fullmatch(weight) for weight in weights)
+    assert Decimal(shortest['distance']) == min(map(Decimal, weights))
+
+
+def test_route_to_itself(client, store):
+    start, _ = ends_of_first_line(store)
+    assert client.get(f"/routes/shortest?start={start}&end={start}").get_json()['data'] == \
+        {'routing': [start], 'distance': 0}
@@ -0,0 +1,133 @@
+import random
+
+import pytest
+
+from models.memory import MemoryBusLine, MemoryBusStation, MemoryStationLine
+from routing.graph import RoutingGraph
+from routing.maintainer import GraphMaintainer
+
+
+@pytest.fixture
+def graph(store):
+    """A graph built from the store and patched by the memory models' events"""
+    graph = RoutingGraph()
+    graph.get(MemoryStationLine(store))
+    maintainer = GraphMaintainer(graph=graph).start()
+    yield graph
+    maintainer.stop()
+
+
+def assert_patched_like_a_fresh_build(graph, store, version):
+    assert graph.built and graph.version > version, "the graph was dropped instead of patched"
+    assert graph.snapshot() == graph.describe(graph.build(MemoryStationLine(store)))
+
+
+def line_stops(store, line):
+    return MemoryStationLine(store)._stops(line)
+
+
+def first_line(store):
+    return store.bus_lines.all()[0].id
+
+
+def test_stop_added(graph, store):
+    line = first_line(store)
+    on_line = {stop.id_bus_station for stop in line_stops(store, line)}
+    station = next(node for node in sorted(graph.get(MemoryStationLine(store))) if node not in on_line)
+    version = graph.version
+    MemoryStationLine(store).create_station_line(station, line, 100, None, '0.75')
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_stop_moved_and_distance_changed(graph, store):
+    line = first_line(store)
+    stop = line_stops(store, line)[0]
+    version = graph.version
+    MemoryStationLine(store).update_station_line(stop.id_bus_station, line, 100, None, '3.5')
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_stop_removed(graph, store):
+    line = first_line(store)
+    stop = line_stops(store, line)[3]
+    version = graph.version
+    MemoryStationLine(store).delete_station_line(stop.id_bus_station, line)
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_line_removed(graph, store):
+    version = graph.version
+    MemoryBusLine(store).delete_bus_line(first_line(store))
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_station_moved(graph, store):
+    station = store.bus_stations.get(line_stops(store, first_line(store))[0].id_bus_station)
+    version = graph.version
+    MemoryBusStation(store).update_bus_station(station.id, "Moved", station.long + 0.01, station.lat - 0.01,
+                                               station.address, station.id_ward)
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_shared_station_removed(graph, store):
+    shared = next(station for station in sorted(graph.get(MemoryStationLine(store)))
+                  if len(store.station_line.find('id_bus_station', station)) > 1)
+    version = graph.version
+    MemoryBusStation(store).delete_bus_station(shared)
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_line_reloaded(store):
+    # LineChanged reloads the line through the writer's connection, and the
+    # memory models emit it without one, so this graph is patched by hand
+    graph = RoutingGraph()
+    graph.get(MemoryStationLine(store))
+    line = first_line(store)
+    stops = line_stops(store, line)
+    payload = [{'id_bus_station': stop.id_bus_station, 'distance': stop.distance} for stop in reversed(stops[1:])]
+    MemoryStationLine(store).resequence(line, payload)
+    version = graph.version
+    graph.refresh_line(MemoryStationLine(store), line)
+    assert_patched_like_a_fresh_build(graph, store, version)
+
+
+def test_shared_hop_keeps_the_shortest_distance(graph, store):
+    line = first_line(store)
+    # a hop weighs the distance stored on the stop it leaves
+    u, v = line_stops(store, line)[1:3]
+    other = MemoryBusLine(store).create_bus_line("Shortcut", None, None, None, None, None)['id']
+    station_line = MemoryStationLine(store)
+    version = graph.version
+    station_line.create_station_line(u.id_bus_station, other, 1, None, u.distance / 2)
+    station_line.create_station_line(v.id_bus_station, other, 2, None, '0')
+    assert_patched_like_a_fresh_build(graph, store, version)
+    assert graph.snapshot()[1][(u.id_bus_station, v.id_bus_station)] == float(u.distance / 2)
+    station_line.delete_station_line(v.id_bus_station, other)
+    assert_patched_like_a_fresh_build(graph, store, version)
+    assert graph.snapshot()[1][(u.id_bus_station, v.id_bus_station)] == float(u.distance)
+
+
+def test_random_writes_match_a_fresh_build(graph, store):
+    rng = random.Random(7)
+    station_line = MemoryStationLine(store)
+    for _ in range(60):
+        lines = [bus_line.id for bus_line in store.bus_lines.all()]
+        stations = sorted(graph.get(MemoryStationLine(store)))
+        line = rng.choice(lines)
+        stops = line_stops(store, line)
+        action = rng.choice(['add', 'move', 'remove', 'station'])
+        if action == 'add':
+            station_line.create_station_line(rng.choice(stations), line, rng.randint(1, 12), None,
+                                             f"{rng.uniform(0.1, 3):.2f}")
+        elif action == 'move' and stops:
+            station_line.update_station_line(rng.choice(stops).id_bus_station, line, rng.randint(1, 12), None,
+                                             f"{rng.uniform(0.1, 3):.2f}")
+        elif action == 'remove' and stops:
+            station_line.delete_station_line(rng.choice(stops).id_bus_station, line)
+        elif action == 'station':
+            station = store.bus_stations.get(rng.choice(stations))
+            MemoryBusStation(store).update_bus_station(station.id, station.name, station.long + 0.001,
+                                                       station.lat, station.address, station.id_ward)
+        if not graph.built:
+            graph.get(station_line)
+        assert graph.snapshot() == graph.describe(graph.build(station_line))
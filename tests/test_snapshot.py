@@ -0,0 +1,80 @@
+import pytest
+
+from models.memory import MemoryStationLine
+from routing import snapshot
+from routing.graph import RoutingGraph
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'graph.snap')
+
+
+@pytest.fixture
+def version(monkeypatch):
+    """network_version the graphs see, settable by the test"""
+    current = {'version': 7}
+    monkeypatch.setattr(snapshot, 'data_version', lambda conn: current['version'])
+    return current
+
+
+def saved(store, path, version):
+    graph = RoutingGraph(snapshot_path=path)
+    graph.get(MemoryStationLine(store))
+    assert snapshot.read(path, version) is not None
+    return graph.snapshot()
+
+
+def no_build(station_line):
+    raise AssertionError("built from the database instead of the snapshot")
+
+
+def test_round_trip(store, path):
+    graph = RoutingGraph()
+    state = graph.build(MemoryStationLine(store))
+    assert graph.save(state, 7, path)
+    nodes, line_stops = snapshot.read(path, 7)
+    assert RoutingGraph.describe(graph.restore(nodes, line_stops)) == RoutingGraph.describe(state)
+    assert line_stops == state.line_stops
+
+
+def test_restored_instead_of_built(store, path, version, monkeypatch):
+    expected = saved(store, path, 7)
+    graph = RoutingGraph(snapshot_path=path)
+    monkeypatch.setattr(graph, 'build', no_build)
+    graph.get(MemoryStationLine(store))
+    assert graph.snapshot() == expected
+
+
+def test_stale_version_is_rebuilt(store, path, version):
+    saved(store, path, 7)
+    version['version'] = 8
+    assert snapshot.read(path, 8) is None
+    graph = RoutingGraph(snapshot_path=path)
+    graph.get(MemoryStationLine(store))
+    assert graph.snapshot() == graph.describe(graph.build(MemoryStationLine(store)))
+    assert snapshot.read(path, 8) is not None, "the rebuild did not rewrite the snapshot"
+
+
+def test_corrupt_checksum_is_rebuilt(store, path, version):
+    expected = saved(store, path, 7)
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xff]))
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read(path, 7)
+    graph = RoutingGraph(snapshot_path=path)
+    graph.get(MemoryStationLine(store))
+    assert graph.snapshot() == expected
+    assert snapshot.read(path, 7) is not None, "the rebuild did not rewrite the snapshot"
+
+
+def test_truncated(path, store):
+    graph = RoutingGraph()
+    graph.save(graph.build(MemoryStationLine(store)), 7, path)
+    with open(path, 'r+b') as f:
+        f.truncate(snapshot.HEADER.size - 1)
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read(path, 7)
@@ -1 +1,4 @@
 from .validation import validate, validate_email, validate_user, validate_password, validate_email_and_password
+from .json_provider import JSONProvider, RawJSON
+from . import columnar, metrics
+from .cache import TTLCache
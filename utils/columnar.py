@@ -0,0 +1,96 @@
+import datetime
+import importlib.util
+
+JSON = 'application/json'
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+PARQUET = 'application/vnd.apache.parquet'
+
+FORMATS = {'json': JSON, 'arrow': ARROW_STREAM, 'parquet': PARQUET}
+
+
+def _pyarrow():
+    """Import pyarrow on first use, it takes longer to import than the app"""
+    import pyarrow
+    import pyarrow.parquet
+
+    return pyarrow, pyarrow.parquet
+
+
+def _schemas(pa):
+    return {
+        'bus_stations': pa.schema([
+            ('id', pa.int32()),
+            ('name', pa.string()),
+            ('long', pa.float64()),
+            ('lat', pa.float64()),
+            ('address', pa.string()),
+            ('id_ward', pa.string())
+        ]),
+        'bus_lines': pa.schema([
+            ('id', pa.int32()),
+            ('name', pa.string()),
+            ('length', pa.float64()),
+            ('price', pa.float64()),
+            ('number_of_trips', pa.int32()),
+            ('time_between_trips', pa.int32()),
+            ('start_time_first', pa.time64('us'))
+        ]),
+        'schedules': pa.schema([
+            ('id_bus_station', pa.int32()),
+            ('id_bus_line', pa.int32()),
+            ('seq', pa.int32()),
+            ('start_time_first', pa.time64('us')),
+            ('distance', pa.float64()),
+            ('lat', pa.float64()),
+            ('long', pa.float64()),
+            ('name', pa.string())
+        ])
+    }
+
+
+def negotiate(request):
+    """Pick the response mimetype from `?format=` or the Accept header"""
+    fmt = request.args.get('format')
+    if fmt:
+        return FORMATS.get(fmt)
+    return request.accept_mimetypes.best_match([JSON, ARROW_STREAM, PARQUET], default=JSON)
+
+
+def available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def _record_batch(pa, schema, rows):
+    """Transpose a cursor batch of tuples straight into typed Arrow columns"""
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def encode(dataset, batches, mimetype):
+    """Encode an iterable of row batches as an Arrow IPC stream or a Parquet file.
+
+    Args:
+        dataset (str): key of the schema, e.g. 'bus_stations'
+        batches (iterable): lists of row tuples, in schema column order
+        mimetype (str): ARROW_STREAM or PARQUET
+
+    Returns:
+        bytes: encoded body
+    """
+    pa, pq = _pyarrow()
+    schema = _schemas(pa)[dataset]
+    sink = pa.BufferOutputStream()
+    if mimetype == PARQUET:
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    with writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(pa, schema, rows))
+    return sink.getvalue().to_pybytes()
+
+
+def filename(dataset, mimetype):
+    extension = 'parquet' if mimetype == PARQUET else 'arrows'
+    return f"{dataset}-{datetime.date.today().isoformat()}.{extension}"
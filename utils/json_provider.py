@@ -0,0 +1,80 @@
+import dataclasses
+import datetime
+import decimal
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RawJSON:
+    """Already serialized JSON text, spliced as-is into a response"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _default(o):
+    if isinstance(o, decimal.Decimal):
+        # as Flask's default provider does, so exact values survive
+        return str(o)
+    if isinstance(o, datetime.timedelta):
+        return o.total_seconds()
+    if isinstance(o, RawJSON):
+        return orjson.Fragment(o.text) if orjson else json.loads(o.text)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class JSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson, falling back to the stdlib encoder.
+
+    Handles the column types psycopg2 returns for the schedule tables
+    (`time`, `Decimal`, `timedelta`), the models' dataclass records and
+    `RawJSON` fragments produced by the models' `*_json` list queries.
+    Decimals are sent as strings, like Flask's default provider does.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault('default', self._fallback_default)
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._option(kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        if orjson is None:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._option({}) | (orjson.OPT_INDENT_2 if self._pretty() else 0)
+        return self._app.response_class(orjson.dumps(obj, default=_default, option=option), mimetype=self.mimetype)
+
+    def _option(self, kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _pretty(self):
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+    @staticmethod
+    def _fallback_default(o):
+        if isinstance(o, (datetime.time, datetime.date)):
+            return o.isoformat()
+        if dataclasses.is_dataclass(o) and not isinstance(o, type):
+            return dataclasses.asdict(o)
+        return _default(o)
@@ -0,0 +1,237 @@
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+COUNT_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Values are kept per thread and only summed when scraped.
+
+    Each thread writes to its own shard (keyed by thread ident, which a
+    later thread may reuse), so recording takes no lock.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = {}
+
+    def _shard(self):
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _merged(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines += self._samples()
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merged(self):
+        totals = {}
+        for shard in list(self._shards.values()):
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def _samples(self):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(self._merged().items())]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            entry = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def _merged(self):
+        totals = {}
+        for shard in list(self._shards.values()):
+            for labels, (counts, total) in list(shard.items()):
+                merged = totals.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        return totals
+
+    def _samples(self):
+        lines = []
+        for labels, (counts, total) in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time, {labels: value} or a number"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+                for labels, value in sorted(values.items()) if value is not None]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()):
+        return self.register(Gauge(name, documentation, callback, labelnames))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                lines += metric.render()
+            except Exception:
+                logger.exception("Error collecting metric %s", metric.name)
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+model_duration = registry.histogram(
+    'model_method_duration_seconds', "Time spent in model methods, i.e. their database work", ('method',))
+model_errors = registry.counter(
+    'model_method_exceptions_total', "Exceptions raised out of model methods or database errors they caught",
+    ('method',))
+
+# Class.method names of the model methods running in this context, outermost first
+model_calls = contextvars.ContextVar('model_calls', default=())
+
+
+def count_model_error():
+    """Count a database error the running model method caught and turned
+    into a None or False result"""
+    calls = model_calls.get()
+    if calls:
+        model_errors.inc((calls[-1],))
+
+
+def timed_methods(cls):
+    """Class decorator recording model_method_duration_seconds for every
+    public method, labelled Class.method, and keeping model_calls up to
+    date. Generator methods are timed until they are exhausted and are on
+    model_calls while they produce each item.
+    """
+    for name, fn in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(fn):
+            continue
+        setattr(cls, name, _timed(fn, f"{cls.__name__}.{name}"))
+    return cls
+
+
+def _timed(fn, name):
+    labels = (name,)
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator(*args, **kwargs):
+            start = time.perf_counter()
+            batches = fn(*args, **kwargs)
+            try:
+                while True:
+                    # set only while the body runs, not between the batches
+                    token = model_calls.set(model_calls.get() + (name,))
+                    try:
+                        batch = next(batches)
+                    except StopIteration:
+                        return
+                    except Exception:
+                        model_errors.inc(labels)
+                        raise
+                    finally:
+                        model_calls.reset(token)
+                    yield batch
+            finally:
+                batches.close()
+                model_duration.observe(labels, time.perf_counter() - start)
+        return generator
+
+    @functools.wraps(fn)
+    def method(*args, **kwargs):
+        token = model_calls.set(model_calls.get() + (name,))
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            model_errors.inc(labels)
+            raise
+        finally:
+            model_duration.observe(labels, time.perf_counter() - start)
+            model_calls.reset(token)
+    return method
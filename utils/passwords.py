@@ -0,0 +1,87 @@
+import concurrent.futures
+import os
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashPoolBusy(Exception):
+    """Raised instead of queueing when the password hashing pool is full"""
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing pool is full")
+        self.retry_after = retry_after
+
+
+class HashPool:
+    """Runs password KDFs on a bounded pool instead of the request thread.
+
+    At most `workers` hashes run at once and `queue` more may wait; past
+    that a call raises HashPoolBusy right away, so the caller can answer 503
+    rather than hold a request thread. `kind` is 'thread' (hashlib's scrypt
+    and pbkdf2 release the GIL) or 'process'; workers=0 hashes inline.
+
+    `method` is the werkzeug hash method new hashes use, e.g.
+    'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'. Hashes made with anything
+    else report needs_rehash.
+    """
+
+    def __init__(self, method='scrypt:32768:8:1', workers=1, queue=8, kind='thread', retry_after=1):
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self.kind = kind
+        self.retry_after = retry_after
+        self.rejected = 0
+        self._prefix = None
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        workers = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+        return cls(method=os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+                   workers=workers,
+                   queue=int(os.getenv('PASSWORD_HASH_QUEUE', 4 * workers)),
+                   kind=os.getenv('PASSWORD_HASH_POOL', 'thread'),
+                   retry_after=int(os.getenv('PASSWORD_HASH_RETRY_AFTER', 1)))
+
+    def _ensure_executor(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                executor = (concurrent.futures.ProcessPoolExecutor if self.kind == 'process'
+                            else concurrent.futures.ThreadPoolExecutor)
+                self._executor = executor(max_workers=self.workers)
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+                self._pid = os.getpid()
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        self._ensure_executor()
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashPoolBusy(self.retry_after)
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        if self._prefix is None:
+            # werkzeug fills in default parameters, so ask it for the full prefix
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
@@ -0,0 +1,122 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+
+from collections import Counter
+
+
+class ProfilerBusy(Exception):
+    """Raised when this process is already being profiled"""
+
+
+logger = logging.getLogger(__name__)
+
+# Results of background sessions, shared by the workers of one host
+directory = os.getenv('PROFILE_DIR', tempfile.gettempdir())
+
+_session = threading.Lock()
+_short_names = {}
+
+
+def _where(code):
+    """function (file:line) with the file relative to the sys.path entry holding it"""
+    filename = code.co_filename
+    short = _short_names.get(filename)
+    if short is None:
+        roots = [root for root in map(os.path.abspath, sys.path) if filename.startswith(root.rstrip(os.sep) + os.sep)]
+        short = _short_names[filename] = os.path.relpath(filename, max(roots, key=len)) if roots else filename
+    return f"{code.co_qualname} ({short}:{code.co_firstlineno})"
+
+
+def _collect(seconds, interval):
+    me = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_where(frame.f_code))
+                frame = frame.f_back
+            stacks[';'.join(reversed(names))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def result_path(session_id):
+    return os.path.join(directory, f"profile-{session_id}.json")
+
+
+def start(session_id, seconds, interval=0.01):
+    """Sample the Python stack of every other thread of this process from a
+    background thread, and leave the result for `result`.
+
+    The sampler takes a snapshot every `interval` seconds and sleeps in
+    between, so the cost is one stack walk per thread and sample. The
+    calling thread returns at once, so a worker serving one request at a
+    time is sampled while it serves the next ones. Only one session runs per
+    process at a time.
+
+    Raises:
+        ProfilerBusy: when another session is running
+    """
+    if not _session.acquire(blocking=False):
+        raise ProfilerBusy("A profiling session is already running in this worker")
+    try:
+        threading.Thread(target=_record, args=(session_id, seconds, interval),
+                         name='profiler', daemon=True).start()
+    except BaseException:
+        _session.release()
+        raise
+
+
+def _record(session_id, seconds, interval):
+    try:
+        stacks, samples = _collect(seconds, interval)
+        fd, temp = tempfile.mkstemp(dir=directory, prefix='.profile-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'pid': os.getpid(), 'samples': samples, 'stacks': collapsed(stacks)}, f)
+        os.replace(temp, result_path(session_id))
+    except Exception:
+        logger.exception("Profiling session %s failed", session_id)
+    finally:
+        _session.release()
+
+
+def result(session_id):
+    """The pid, number of samples and collapsed stacks (root;...;leaf) of a
+    finished session, None until then"""
+    try:
+        with open(result_path(session_id), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def collapsed(stacks):
+    """Stacks in the collapsed format read by flamegraph.pl and speedscope"""
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile_call(fn, *args, sort='cumulative', limit=40, **kwargs):
+    """Run fn under cProfile
+
+    Returns:
+        tuple: fn's result and the pstats report of the `limit` top functions
+    """
+    profile = cProfile.Profile()
+    result = profile.runcall(fn, *args, **kwargs)
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()